@@ -10,9 +10,10 @@ import os
 import pandas
 import datetime
 import time
-import numpy as np
 import argparse
 
+import data_schema
+
 def get_filepaths():
     """Get the inputs from the user"""
 
@@ -168,65 +169,6 @@ def data_to_dataframe(rows_of_data, dataframe, header):
     return dataframe
 
 
-def reduce_memory_usage(props):
-    """
-    Takes a dataframe and converts the data type of each float to float64 (originally did it to float32 but wanted
-    more dp for lat and lon), reducing the memory usage.
-
-    The code below was modified from https://www.kaggle.com/arjanso/reducing-dataframe-memory-size-by-65 and is used to
-    convert the datatype to one that uses less memory. This code was provided with an Apache 2.0 license:
-    http://www.apache.org/licenses/LICENSE-2.0
-    """
-
-    NAlist = [] # Keeps track of columns that have missing values filled in. 
-    for col in props.columns:
-        if props[col].dtype != object:  # Exclude strings
-
-            # make variables for Int, max and min
-            IsInt = False
-            mx = props[col].max()
-            mn = props[col].min()
-            
-            # Integer does not support NA, therefore, NA needs to be filled
-            if not np.isfinite(props[col]).all(): 
-                NAlist.append(col)
-                props[col].fillna(mn-1, inplace=True)
-                   
-            # test if column can be converted to an integer
-            asint = props[col].fillna(0).astype(np.int64)
-            result = (props[col] - asint)
-            result = result.sum()
-            if result > -0.01 and result < 0.01:
-                IsInt = True
-
-            # Make Integer/unsigned Integer datatypes
-            if IsInt:
-                if mn >= 0:
-                    if mx < 255:
-                        props[col] = props[col].astype(np.uint8)
-                    elif mx < 65535:
-                        props[col] = props[col].astype(np.uint16)
-                    elif mx < 4294967295:
-                        props[col] = props[col].astype(np.uint32)
-                    else:
-                        props[col] = props[col].astype(np.uint64)
-                else:
-                    if mn > np.iinfo(np.int8).min and mx < np.iinfo(np.int8).max:
-                        props[col] = props[col].astype(np.int8)
-                    elif mn > np.iinfo(np.int16).min and mx < np.iinfo(np.int16).max:
-                        props[col] = props[col].astype(np.int16)
-                    elif mn > np.iinfo(np.int32).min and mx < np.iinfo(np.int32).max:
-                        props[col] = props[col].astype(np.int32)
-                    elif mn > np.iinfo(np.int64).min and mx < np.iinfo(np.int64).max:
-                        props[col] = props[col].astype(np.int64)    
-            
-            # Make float datatypes 64 bit
-            else:
-                props[col] = props[col].astype(np.float64) # changed this from float32 to avoid losing the accuracy of the latitude and longitude
-
-    return props, NAlist
-
-
 def output_daily_files(dataframe, output_data_folder):
     """
     Output a pandas dataframe to files where each file contains one day's worth of data.
@@ -333,7 +275,10 @@ if __name__ == "__main__":
         motiondf = data_to_dataframe(rows_of_data, motiondf, header)
         rows_of_data = list()
     
-        reduce_memory_usage(motiondf)
+        # Convert the columns to the data types of the schema (float64 for the latitudes and longitudes, float32 for the
+        # other measurements) and the integer columns to the smallest integer types, keeping the missing values.
+        motiondf, memory_report = data_schema.downcast_dataframe(motiondf)
+        print("Memory used by the dataframe before: ", memory_report['bytes_before'].sum(), " bytes, after: ", memory_report['bytes_after'].sum(), " bytes")
     
         no_files_processed += 1
         print("Processed", no_files_processed, "out of", total_no_files)
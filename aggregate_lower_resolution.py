@@ -1,43 +1,200 @@
+import argparse
+import concurrent.futures
 import pandas
 import os
-import datetime
+import numpy as np
 import cruise_track_data_processing_utils
+import data_schema
 import matplotlib.pyplot as plt
-import glob
+
+# Strategies to choose the point of each time bucket when resampling the track (see resample_track):
+# 'first': the first point of the bucket,
+# 'nearest': the point nearest to the boundary (for one minute, the point nearest to 12:03:00 from 12:02:30 to 12:03:29),
+# 'mean': the mean position of the points of the bucket,
+# 'best_quality': the point with the best (lowest) overall qualifier flag, the first one if several have it.
+RESAMPLING_STRATEGIES = ['first', 'nearest', 'mean', 'best_quality']
+
+# Columns which are averaged with the 'mean' strategy. The longitude is averaged as an angle.
+RESAMPLING_MEAN_COLUMNS = ['latitude', 'speed']
+
+# Levels of the pyramid of resolutions (name used in the filenames, resolution in seconds), from the finest to the
+# coarsest. Each level is built from the previous one.
+PYRAMID_LEVELS = [('1min', 60), ('1hour', 3600)]
+
+NANOSECONDS_PER_SECOND = 10**9
+
 
 def investigate_aggregation_by_time(dataframe):
     """investigate approximately how many rows to expect when the dataset is aggregated to minute and hour resolution.
     Output the dataframe with columns which contain just the number of hours, number of minutes and number of seconds, to aid with the aggregation."""
 
     # create columns with just hours, minutes, seconds.
-    dataframe['time_hours'] = pandas.to_datetime(dataframe['date_time']).dt.hour
-    dataframe['time_minutes'] = pandas.to_datetime(dataframe['date_time']).dt.minute
-    dataframe['time_seconds'] = pandas.to_datetime(dataframe['date_time']).dt.second
+    date_time = pandas.to_datetime(dataframe['date_time'])
+    dataframe['time_hours'] = date_time.dt.hour
+    dataframe['time_minutes'] = date_time.dt.minute
+    dataframe['time_seconds'] = date_time.dt.second
 
     # how many rows have 0 seconds (this will be used to get data on the minute, i.e 12:03:00).
-    print("Number of rows with 0 seconds: ", len(dataframe[dataframe['time_seconds']==0]))
-    print(dataframe[dataframe['time_seconds']==0].head(5))
+    on_the_minute = (dataframe['time_seconds'] == 0)
+    print("Number of rows with 0 seconds: ", on_the_minute.sum())
+    print(dataframe[on_the_minute].head(5))
+
+    # how many minutes have data but no point on the minute (these were missing from the aggregation by time_seconds).
+    minutes = cruise_track_data_processing_utils.date_time_to_nanoseconds(date_time) // (60 * NANOSECONDS_PER_SECOND)
+    print("Number of minutes with data but without a point on the minute: ", len(np.unique(minutes)) - on_the_minute.sum())
 
     # how many rows have 0 minutes (this will be used to get data on the hour, i.e 13:00:00).
-    print("Number of rows with 0 minutes and 0 seconds: ", len(dataframe[(dataframe['time_minutes'] == 0) & (dataframe['time_seconds'] == 0)]))
-    print(dataframe[(dataframe['time_minutes'] == 0) & (dataframe['time_seconds'] == 0)].head(5))
+    on_the_hour = on_the_minute & (dataframe['time_minutes'] == 0)
+    print("Number of rows with 0 minutes and 0 seconds: ", on_the_hour.sum())
+    print(dataframe[on_the_hour].head(5))
 
     return dataframe
 
 
-def get_minute_resolution(dataframe):
-    """Aggregate the data to get one-minute resolution, where the number of seconds is 0, so each record is on the minute exactly. Output a new dataframe with one-minute resolution. """
+def get_time_buckets(nanoseconds, resolution, strategy):
+    """Get the time bucket of each point by floor division of its int64 nanoseconds since the epoch by the resolution
+    in seconds. For the 'nearest' strategy the buckets are centred on the boundaries. Output the bucket numbers and the
+    boundary of the bucket of each point, in nanoseconds since the epoch."""
+
+    resolution_nanoseconds = resolution * NANOSECONDS_PER_SECOND
+
+    if strategy == 'nearest':
+        buckets = (nanoseconds + resolution_nanoseconds // 2) // resolution_nanoseconds
+    else:
+        buckets = nanoseconds // resolution_nanoseconds
+
+    return (buckets, buckets * resolution_nanoseconds)
+
+
+def get_bucket_starts(sorted_buckets):
+    """Get the indices of the first point of each bucket in an array of sorted bucket numbers."""
+
+    return np.flatnonzero(np.concatenate(([True], sorted_buckets[1:] != sorted_buckets[:-1])))
+
+
+def get_mean_resolution(dataframe, buckets, boundaries):
+    """Get a dataframe with the mean position of the points of each bucket (see resample_track). The dataframe is
+    sorted by date_time."""
+
+    starts = get_bucket_starts(buckets)
+    counts = np.diff(np.append(starts, len(buckets)))
+
+    mean_df = dataframe.iloc[starts].reset_index(drop=True)
+    mean_df['date_time'] = boundaries[starts].astype('datetime64[ns]')
+
+    for column in RESAMPLING_MEAN_COLUMNS:
+        if column in dataframe.columns:
+            mean_df[column] = np.add.reduceat(dataframe[column].values.astype('float64'), starts) / counts
+
+    # Average the longitude as an angle, otherwise the mean of 179.9 and -179.9 would be 0.
+    longitude = np.radians(dataframe['longitude'].values)
+    mean_df['longitude'] = np.degrees(np.arctan2(np.add.reduceat(np.sin(longitude), starts), np.add.reduceat(np.cos(longitude), starts)))
+
+    if 'measureland_qualifier_flag_overall' in dataframe.columns:
+        mean_df['measureland_qualifier_flag_overall'] = np.maximum.reduceat(dataframe['measureland_qualifier_flag_overall'].values, starts)
+
+    return mean_df
+
+
+def resample_track(dataframe, resolution, strategy='nearest'):
+    """Resample track data to one point per time bucket of the resolution in seconds (10, 60, 600, 3600...), in one pass
+    over the data, choosing the point with the strategy (one of RESAMPLING_STRATEGIES). Buckets without points, and
+    with the 'nearest' strategy buckets whose boundary is after the last point, are not output. Output a new dataframe sorted by date_time.
+
+    The chosen points keep their date_time. With the 'mean' strategy, the date_time is the start of the bucket,
+    the latitude, longitude and speed are the means of the points, the overall qualifier flag is the worst of the
+    points and the other columns are those of the first point."""
+
+    if strategy not in RESAMPLING_STRATEGIES:
+        raise ValueError("Resampling strategy should be one of {}: {}".format(RESAMPLING_STRATEGIES, strategy))
+
+    dataframe = cruise_track_data_processing_utils.sort_dataframe_by_time(dataframe)
+    nanoseconds = cruise_track_data_processing_utils.date_time_to_nanoseconds(dataframe['date_time'])
+
+    (buckets, boundaries) = get_time_buckets(nanoseconds, resolution, strategy)
+
+    if strategy == 'mean':
+        return get_mean_resolution(dataframe, buckets, boundaries)
+
+    # Order the points of each bucket so that the chosen point is the first one (lexsort is stable, so ties are kept
+    # in order of time).
+    if strategy == 'nearest':
+        order = np.lexsort((np.abs(nanoseconds - boundaries), buckets))
+    elif strategy == 'best_quality':
+        order = np.lexsort((dataframe['measureland_qualifier_flag_overall'].values, buckets))
+    else:
+        order = np.arange(len(buckets))
+
+    selected = order[get_bucket_starts(buckets[order])]
+
+    # With the 'nearest' strategy the last points can be nearest to a boundary after the end of the data (the first
+    # minute of the next month for a monthly file), which is not output.
+    if strategy == 'nearest':
+        selected = selected[boundaries[selected] <= nanoseconds[-1]]
+
+    return dataframe.iloc[selected].reset_index(drop=True)
+
+
+def resample_track_in_chunks(chunks, resolution, strategy='nearest'):
+    """Resample track data read in chunks (an iterable of dataframes, each one sorted by date_time and after the
+    previous one) in the same way as resample_track, with only one chunk in memory at a time. The points of the last
+    bucket of each chunk are carried over to the next chunk, as the bucket can go on in it. Output a new dataframe
+    sorted by date_time."""
+
+    if strategy not in RESAMPLING_STRATEGIES:
+        raise ValueError("Resampling strategy should be one of {}: {}".format(RESAMPLING_STRATEGIES, strategy))
+
+    resampled_dfs = []
+    carried_df = None
 
-    minute_res_df = dataframe[dataframe['time_seconds'] == 0]
+    for chunk_df in chunks:
+        if carried_df is not None:
+            chunk_df = pandas.concat([carried_df, chunk_df], ignore_index=True)
+
+        if len(chunk_df) == 0:
+            continue
+
+        nanoseconds = cruise_track_data_processing_utils.date_time_to_nanoseconds(chunk_df['date_time'])
+        if np.any(nanoseconds[1:] < nanoseconds[:-1]):
+            raise ValueError("Track data should be sorted by date_time to be resampled in chunks")
+
+        (buckets, boundaries) = get_time_buckets(nanoseconds, resolution, strategy)
+        last_bucket_start = np.searchsorted(buckets, buckets[-1], side='left')
+
+        # The chunk is resampled with its last bucket, so that the boundaries before it are compared with the last point
+        # of the chunk as in resample_track, but the point of the last bucket is only chosen once it is complete.
+        resampled_df = resample_track(chunk_df, resolution, strategy)
+        resampled_buckets = get_time_buckets(cruise_track_data_processing_utils.date_time_to_nanoseconds(resampled_df['date_time']),
+                                             resolution, strategy)[0]
+        resampled_dfs.append(resampled_df[resampled_buckets < buckets[-1]])
+
+        carried_df = chunk_df.iloc[last_bucket_start:].reset_index(drop=True)
+
+    if carried_df is None or len(carried_df) == 0:
+        raise ValueError("No track data to resample")
+
+    resampled_dfs.append(resample_track(carried_df, resolution, strategy))
+
+    return pandas.concat(resampled_dfs, ignore_index=True)
+
+
+def get_minute_resolution(dataframe, strategy='nearest'):
+    """Aggregate the data to get one-minute resolution, choosing the point of each minute with the resampling strategy
+    (see resample_track). With the 'nearest' strategy this is the point on the minute exactly, i.e. 12:03:00, or the
+    nearest one if it is missing. Output a new dataframe with one-minute resolution. """
+
+    minute_res_df = resample_track(dataframe, 60, strategy)
     print("Number of rows in minute resolution dataframe: ", len(minute_res_df))
 
     return minute_res_df
 
 
-def get_hour_resolution(dataframe):
-    """Aggregate the data to get one-hour resolution, where the number of minutes is 0 and the number of seconds is 0, so each record is on the hour exactly. Output a new dataframe with one-hour resolution. """
+def get_hour_resolution(dataframe, strategy='nearest'):
+    """Aggregate the data to get one-hour resolution, choosing the point of each hour with the resampling strategy
+    (see resample_track). With the 'nearest' strategy this is the point on the hour exactly, i.e. 13:00:00, or the
+    nearest one if it is missing. Output a new dataframe with one-hour resolution. """
 
-    hour_res_df = dataframe[(dataframe['time_minutes'] == 0) & (dataframe['time_seconds'] == 0)]
+    hour_res_df = resample_track(dataframe, 3600, strategy)
     print("Number of rows in hour resolution dataframe: ", len(hour_res_df))
 
     return hour_res_df
@@ -52,13 +209,13 @@ def format_time(row):
 
 def output_dataframe_to_csv(dataframe, columns, output_filepath, output_filename):
     """Output a dataframe to a csv file, specifying the columns that are required in the output and the output filepath and filename.
-    The index is not included in the output. The datetime is corrected to IS 8601 format."""
+    The index is not included in the output. The datetime is corrected to IS 8601 format. The dataframe is not modified."""
 
     output_file = os.path.join(output_filepath, output_filename)
     print("Output filename: ", output_file)
 
-    # apply the datetime format function
-    dataframe['date_time'] = dataframe.apply(format_time, axis=1)
+    # format all of the dates and times at once, in the same format as format_time
+    dataframe = dataframe.assign(date_time=pandas.to_datetime(dataframe['date_time']).dt.strftime('%Y-%m-%dT%H:%M:%S+00:00'))
 
     dataframe.to_csv(output_file, index=False, columns=columns)
 
@@ -109,65 +266,133 @@ def check_aggregation_output(dataframe):
     print("Number of rows with 0 seconds, group by minutes: ", subset_sec_df.groupby(['time_minutes'])[['time_minutes']].count())
 
 
-def process_aggregation(month):
-    """ Process the aggregation for each month of data that exists.
+def build_resolution_pyramid(second_res_df, levels=PYRAMID_LEVELS, strategy='nearest'):
+    """Resample the one-second resolution data to each of the levels (a list of (name, resolution in seconds), from the
+    finest to the coarsest), building each level from the previous one rather than from the one-second data (see
+    resample_track). With the 'first', 'nearest' and 'best_quality' strategies this chooses the same points as
+    resampling the one-second data when the points on the boundaries exist; with the 'mean' strategy the coarser levels
+    are means of means. Output a dictionary of the dataframes by level name."""
+
+    pyramid = {}
+    previous_level_df = second_res_df
+
+    for (level_name, resolution) in levels:
+        previous_level_df = resample_track(previous_level_df, resolution, strategy)
+        print("Number of rows in {} resolution dataframe: ".format(level_name), len(previous_level_df))
+
+        pyramid[level_name] = previous_level_df
+
+    return pyramid
+
+
+def get_level_filename(level_name, month):
+    """Get the name of the file of a level of the pyramid, without extension, i.e. ace_cruise_track_1min_2016-12."""
+
+    return "ace_cruise_track_{}_{}".format(level_name, month)
+
+
+def output_resolution_pyramid(pyramid, columns, output_filepath, month):
+    """Output each level of the pyramid to a csv file and to a parquet file, which keeps the data types and is faster to
+    read, in the output filepath."""
+
+    for (level_name, level_df) in pyramid.items():
+        output_filename = get_level_filename(level_name, month)
+
+        output_dataframe_to_csv(level_df, columns, output_filepath, output_filename + ".csv")
+        level_df[columns].to_parquet(os.path.join(output_filepath, output_filename + ".parquet"), index=False)
+
+
+def read_second_resolution_in_chunks(filepath, chunk_size):
+    """Read a one-second resolution file in chunks of chunk_size rows, printing what is to be expected once each chunk
+    is aggregated (see investigate_aggregation_by_time and check_aggregation_output). Output a generator of the
+    downcast dataframes of the chunks."""
+
+    for chunk_df in cruise_track_data_processing_utils.read_track_csv_in_chunks(filepath, data_schema.POSITION_CSV_SCHEMA, chunk_size):
+        print("Number of rows in second resolution chunk: ", len(chunk_df))
+
+        # check what is to be expected once aggregated
+        chunk_df = investigate_aggregation_by_time(chunk_df)
+        check_aggregation_output(chunk_df)
+
+        # the hours, minutes and seconds columns fit in int8
+        chunk_df, memory_report = data_schema.downcast_dataframe(chunk_df)
+        print(memory_report)
+
+        yield chunk_df
+
+
+def process_aggregation(filepath, month, levels=PYRAMID_LEVELS, strategy='nearest', plot=True, chunk_size=1000000):
+    """ Process the aggregation for each month of data that exists, reading the one-second resolution file of the month
+    in filepath once, in chunks of chunk_size rows, and outputting all of the levels of the pyramid to filepath. Only
+    the first level is resampled from the chunks (see resample_track_in_chunks), the others are built from it.
     month is in format 2016-12
+    If plot is True, the levels should include '1min' and '1hour', which are plotted.
+    Output a dictionary of the number of rows of each level.
     """
 
+    level_names = [level_name for (level_name, resolution) in levels]
+    if plot and not ('1min' in level_names and '1hour' in level_names):
+        raise ValueError("The levels should include '1min' and '1hour' to be plotted: {}".format(level_names))
+
     # input variables
-    filepath = "/home/jen/projects/ace_data_management/wip/cruise_track_data"
     one_sec_resolution_filename = "ace_cruise_track_1sec_{}.csv".format(month)
-    date_column_list = [0]
-    
-    datatypes = { 'latitude': 'float64',
-                  'longitude': 'float64',
-                  'fix_quality': 'int8',
-                  'number_satellites': 'int8',
-                  'horiz_dilution_of_position': 'float16',
-                  'altitude': 'float16',
-                  'altitude_units': 'category',
-                  'geoid_height': 'float16',
-                  'geoid_height_units': 'category',
-                  'device_id': 'int8',
-                  'speed': 'float64',
-                  'measureland_qualifier_flags_overall': 'int8'}
-
-    output_filename_minute = "ace_cruise_track_1min_{}.csv".format(month)
-    output_filename_hour = "ace_cruise_track_1hour_{}.csv".format(month)
+
     columns = ['date_time', 'latitude', 'longitude', 'fix_quality', 'number_satellites', 'horiz_dilution_of_position',
                'altitude', 'altitude_units', 'geoid_height', 'geoid_height_units', 'device_id', 'speed', 'measureland_qualifier_flag_overall']
 
-    # get the data from the csv files (1 second resolution)
-    second_res_df = cruise_track_data_processing_utils.get_data_from_csv(filepath, one_sec_resolution_filename, datatypes, date_column_list)
+    # get the data from the csv files (1 second resolution), one chunk at a time, into the first level
+    chunks = read_second_resolution_in_chunks(os.path.join(filepath, one_sec_resolution_filename), chunk_size)
 
-    print("Number of rows in second resolution file: ", len(second_res_df))
+    (first_level_name, first_resolution) = levels[0]
+    first_level_df = resample_track_in_chunks(chunks, first_resolution, strategy)
+    print("Number of rows in {} resolution dataframe: ".format(first_level_name), len(first_level_df))
 
-    # check what is to be expected once aggregated
-    investigate_aggregation_by_time(second_res_df)
+    # do all of the lower resolutions, each one from the previous one
+    pyramid = {first_level_name: first_level_df}
+    pyramid.update(build_resolution_pyramid(first_level_df, levels[1:], strategy))
+    output_resolution_pyramid(pyramid, columns, filepath, month)
 
-    # do one minute resolution
-    minute_res_df = get_minute_resolution(second_res_df)
-    output_dataframe_to_csv(minute_res_df, columns, filepath, output_filename_minute)
+    # do plots of output aggregations
+    if plot:
+        plot_aggregated_data_separate_graphs(pyramid['1min'], pyramid['1hour'], month)
 
-    # do one hour resolution
-    hour_res_df = get_hour_resolution(second_res_df)
-    output_dataframe_to_csv(hour_res_df, columns, filepath, output_filename_hour)
+        plot_aggregated_data_same_axes(pyramid['1min'], pyramid['1hour'], month)
 
-    # do plots and checking of output aggregations
-    plot_aggregated_data_separate_graphs(minute_res_df, hour_res_df, month)
+    return {level_name: len(level_df) for (level_name, level_df) in pyramid.items()}
 
-    plot_aggregated_data_same_axes(minute_res_df, hour_res_df, month)
 
-    check_aggregation_output(second_res_df)
+def process_aggregations_in_parallel(filepath, months, levels=PYRAMID_LEVELS, strategy='nearest', max_workers=None, chunk_size=1000000):
+    """Process the aggregation of the months at the same time, each one in a separate process (see process_aggregation).
+    The aggregations are not plotted."""
 
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_aggregation, filepath, month, levels, strategy, False, chunk_size) for month in months]
 
-def main():
+        for (month, future) in zip(months, futures):
+            print("Aggregation of {} done: ".format(month), future.result())
 
-    # list of months that should be processed
-    months_to_be_processed = ["2016-12", "2017-01", "2017-02", "2017-03", "2017-04"]
 
-    for month in months_to_be_processed:
-        process_aggregation(month)
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the one-second resolution cruise track files of each month to one minute and one hour resolution (and optionally one day), in csv and parquet files.")
+    parser.add_argument("filepath", help="Directory of the one-second resolution files (ace_cruise_track_1sec_YYYY-MM.csv), where the aggregated files are output")
+    parser.add_argument("--months", nargs="+", default=["2016-12", "2017-01", "2017-02", "2017-03", "2017-04"], help="Months to be processed, in format 2016-12")
+    parser.add_argument("--day", action="store_true", help="Also aggregate to one day resolution")
+    parser.add_argument("--strategy", choices=RESAMPLING_STRATEGIES, default='nearest', help="Resampling strategy (see resample_track)")
+    parser.add_argument("--max-workers", type=int, default=None, help="Number of months processed at the same time")
+    parser.add_argument("--plot", action="store_true", help="Process the months one after the other and plot the aggregations")
+    parser.add_argument("--chunk-size", type=int, default=1000000, help="Number of rows of the one-second resolution files read at a time")
+
+    args = parser.parse_args()
+
+    levels = PYRAMID_LEVELS
+    if args.day:
+        levels = PYRAMID_LEVELS + [('1day', 86400)]
+
+    if args.plot:
+        for month in args.months:
+            process_aggregation(args.filepath, month, levels, args.strategy, chunk_size=args.chunk_size)
+    else:
+        process_aggregations_in_parallel(args.filepath, args.months, levels, args.strategy, args.max_workers, args.chunk_size)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import argparse
+import numpy as np
+import os
+import pandas
+import tempfile
+import time
+
+import cruise_track_data_processing_utils
+import data_schema
+
+
+def create_synthetic_track(number_of_rows, start_date_time='2016-12-20 00:00:00', seed=0):
+    """Create a dataframe of a synthetic one-second resolution track, with small random movements between each point, which looks like the output of the GPS and GLONASS devices."""
+
+    random_generator = np.random.RandomState(seed)
+
+    date_time = pandas.date_range(start=start_date_time, periods=number_of_rows, freq='s')
+    latitude = -50 + np.cumsum(random_generator.normal(0, 2e-5, number_of_rows))
+    longitude = 30 + np.cumsum(random_generator.normal(0, 3e-5, number_of_rows))
+
+    track_df = pandas.DataFrame({'id': np.arange(number_of_rows, dtype='int32'),
+                                 'date_time': date_time,
+                                 'latitude': latitude,
+                                 'longitude': longitude,
+                                 'device_id': np.full(number_of_rows, 63, dtype='int8')})
+
+    return track_df
+
+
+def print_rate(name, number_of_rows, seconds):
+    """Print how long a stage took and the number of rows processed per second."""
+
+    print("{}: {} rows in {:.3f} seconds, {:.0f} rows/second".format(name, number_of_rows, seconds, number_of_rows / seconds))
+
+
+def benchmark_scalar_speed(track_df):
+    """Time the calculation of the speed between consecutive points using the scalar knots_two_points function, as was done row by row before."""
+
+    positions = list(track_df[['date_time', 'latitude', 'longitude']].itertuples(index=False, name=None))
+
+    t1 = time.time()
+    for previous_position, current_position in zip(positions[:-1], positions[1:]):
+        cruise_track_data_processing_utils.knots_two_points(previous_position, current_position)
+    seconds = time.time() - t1
+
+    print_rate("Scalar speed (knots_two_points)", len(track_df), seconds)
+
+
+def benchmark_calculate_speed(track_df):
+    """Time the vectorised calculation of the speed and distance between consecutive points."""
+
+    t1 = time.time()
+    cruise_track_data_processing_utils.calculate_speed(track_df)
+    seconds = time.time() - t1
+
+    print_rate("Vectorised speed (calculate_speed)", len(track_df), seconds)
+
+
+def create_synthetic_position_file(number_of_rows, path):
+    """Create a csv file of prioritised positions from a synthetic one-second resolution track, in the format of the
+    ace_cruise_track_1sec_YYYY-MM.csv files. Output the name of the file."""
+
+    track_df = create_synthetic_track(number_of_rows)
+    track_df['fix_quality'] = 1
+    track_df['number_satellites'] = 8
+    track_df['horiz_dilution_of_position'] = 1.2
+    track_df['altitude'] = 20.5
+    track_df['altitude_units'] = 'M'
+    track_df['geoid_height'] = 3.5
+    track_df['geoid_height_units'] = 'M'
+    track_df['speed'] = 10.0
+    track_df['measureland_qualifier_flag_overall'] = 1
+
+    output_filename = 'ace_cruise_track_1sec_2016-12.csv'
+    cruise_track_data_processing_utils.output_prioritised_data_points(track_df[cruise_track_data_processing_utils.PRIORITISED_COLUMNS], path, output_filename)
+
+    return os.path.join(path, output_filename)
+
+
+def read_position_file_with_date_parser(filepath):
+    """Read a file of positions as get_position_data did before, parsing the dates with pandas.to_datetime as the
+    date_parser (or after reading the file with versions of pandas which do not have date_parser)."""
+
+    datatypes = data_schema.POSITION_CSV_SCHEMA['datatypes']
+
+    try:
+        return pandas.read_csv(filepath, dtype=datatypes, date_parser=pandas.to_datetime, parse_dates=[0])
+    except TypeError:
+        dataframe = pandas.read_csv(filepath, dtype=datatypes)
+        dataframe['date_time'] = pandas.to_datetime(dataframe['date_time'])
+        return dataframe
+
+
+def benchmark_read_position_file(number_of_rows):
+    """Time reading a synthetic file of positions with the previous reader and with read_track_csv, with all of the
+    columns and with only the date_time, latitude and longitude."""
+
+    with tempfile.TemporaryDirectory() as path:
+        position_file = create_synthetic_position_file(number_of_rows, path + "/")
+        print("Size of the position file: {:.0f} MB".format(os.path.getsize(position_file) / 1e6))
+
+        t1 = time.time()
+        read_position_file_with_date_parser(position_file)
+        print_rate("Previous reader (pandas.read_csv with date_parser)", number_of_rows, time.time() - t1)
+
+        t1 = time.time()
+        cruise_track_data_processing_utils.read_track_csv(position_file, data_schema.POSITION_CSV_SCHEMA)
+        print_rate("read_track_csv", number_of_rows, time.time() - t1)
+
+        t1 = time.time()
+        cruise_track_data_processing_utils.read_track_csv(position_file, data_schema.POSITION_CSV_SCHEMA,
+                                                          columns=['date_time', 'latitude', 'longitude'])
+        print_rate("read_track_csv (date_time, latitude, longitude)", number_of_rows, time.time() - t1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the cruise track data processing on a synthetic one-second resolution track.")
+    parser.add_argument("--rows", type=int, default=5000000, help="Number of rows of the synthetic track")
+    parser.add_argument("--scalar-rows", type=int, default=100000, help="Number of rows used to time the scalar version (0 to skip it)")
+    parser.add_argument("--read-rows", type=int, default=31 * 24 * 3600, help="Number of rows of the position file used to time the csv readers, a month by default (0 to skip it)")
+
+    args = parser.parse_args()
+
+    track_df = create_synthetic_track(args.rows)
+
+    if args.scalar_rows > 0:
+        benchmark_scalar_speed(track_df.head(args.scalar_rows))
+
+    benchmark_calculate_speed(track_df)
+
+    if args.read_rows > 0:
+        benchmark_read_position_file(args.read_rows)
+
+
+if __name__ == "__main__":
+    main()
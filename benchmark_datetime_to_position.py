@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+import datetime_to_position
+
+
+def create_synthetic_position_database(database_path, number_of_rows, start_date_time=datetime.datetime(2016, 12, 20)):
+    """Create an SQLite database with a gps table of one-second resolution positions, without an index, with the
+    dates and times in the format YYYY-MM-DDThh:mm:ss.ss+00:00."""
+
+    random_generator = np.random.RandomState(0)
+    latitude = -50 + np.cumsum(random_generator.normal(0, 2e-5, number_of_rows))
+    longitude = 30 + np.cumsum(random_generator.normal(0, 3e-5, number_of_rows))
+
+    conn = sqlite3.connect(database_path)
+    conn.execute("CREATE TABLE gps (date_time TEXT, latitude REAL, longitude REAL)")
+    conn.executemany("INSERT INTO gps VALUES (?, ?, ?)",
+                     (((start_date_time + datetime.timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%S.00+00:00"), latitude[i], longitude[i])
+                      for i in range(number_of_rows)))
+    conn.commit()
+    conn.close()
+
+
+def get_random_datetime_texts(number_of_lookups, number_of_rows, start_date_time=datetime.datetime(2016, 12, 20)):
+    """Get dates and times in the format YYYY-MM-DDThh:mm:ss at random during the synthetic track."""
+
+    random_generator = np.random.RandomState(1)
+    seconds = random_generator.randint(0, number_of_rows, number_of_lookups)
+
+    return [(start_date_time + datetime.timedelta(seconds=int(second))).strftime("%Y-%m-%dT%H:%M:%S") for second in seconds]
+
+
+def print_rate(name, number_of_lookups, seconds):
+    """Print how long the lookups took and the number of lookups per second."""
+
+    print("{}: {} lookups in {:.3f} seconds, {:.1f} lookups/second".format(name, number_of_lookups, seconds, number_of_lookups / seconds))
+
+
+def benchmark_like_lookups(database_path, datetime_texts):
+    """Time the lookups with the LIKE prefix query used by DatetimeToPosition before."""
+
+    conn = sqlite3.connect("file:{}?mode=ro".format(database_path), uri=True)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA case_sensitive_like = 1")
+
+    t1 = time.time()
+    for datetime_text in datetime_texts:
+        cursor.execute('SELECT latitude,longitude FROM gps where date_time like ?', (datetime_text + "%",))
+        cursor.fetchone()
+
+    print_rate("LIKE prefix query", len(datetime_texts), time.time() - t1)
+
+
+def benchmark_range_lookups(name, database_path, datetime_texts):
+    """Time the lookups of DatetimeToPosition.datetime_text_to_position."""
+
+    locator = datetime_to_position.DatetimeToPosition(database_path)
+
+    t1 = time.time()
+    for datetime_text in datetime_texts:
+        locator.datetime_text_to_position(datetime_text)
+
+    print_rate(name, len(datetime_texts), time.time() - t1)
+
+
+def benchmark_batch_lookups(database_path, datetime_texts):
+    """Time the lookups of DatetimeToPosition.positions_for_datetimes, all in one query."""
+
+    locator = datetime_to_position.DatetimeToPosition(database_path)
+
+    t1 = time.time()
+    locator.positions_for_datetimes(datetime_texts)
+
+    print_rate("Batch query with covering index", len(datetime_texts), time.time() - t1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lookups of DatetimeToPosition on a synthetic one-second resolution track.")
+    parser.add_argument("--rows", type=int, default=92 * 24 * 3600, help="Number of rows of the gps table, the length of the cruise by default")
+    parser.add_argument("--lookups", type=int, default=10000, help="Number of lookups with the indexed range and batch queries")
+    parser.add_argument("--scan-lookups", type=int, default=20, help="Number of lookups with the queries which read the whole table")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        database_path = os.path.join(path, "positions.sqlite3")
+        indexed_database_path = os.path.join(path, "positions_indexed.sqlite3")
+
+        create_synthetic_position_database(database_path, args.rows)
+
+        t1 = time.time()
+        datetime_to_position.create_position_index(database_path, indexed_database_path)
+        print("Copy and index creation: {:.1f} seconds".format(time.time() - t1))
+
+        scan_datetime_texts = get_random_datetime_texts(args.scan_lookups, args.rows)
+        benchmark_like_lookups(database_path, scan_datetime_texts)
+        benchmark_range_lookups("Range query without index", database_path, scan_datetime_texts)
+
+        datetime_texts = get_random_datetime_texts(args.lookups, args.rows)
+        benchmark_range_lookups("Range query with covering index", indexed_database_path, datetime_texts)
+        benchmark_batch_lookups(indexed_database_path, datetime_texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,48 @@
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import cruise_track_data_processing_utils
+import data_schema
 import cruise_track_data_plotting
+import concurrent.futures
 import os
+import numpy as np
 import pandas
 import glob
+import shutil
 import datetime
 
+# Directory of the track data files of the devices, and of the files created during the processing.
+TRACK_DATA_FILEPATH = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
+
+# Tracking instruments to process. filename is the beginning of the name of the daily csv files of the device.
+# When the data are combined, the points of the GLONASS (device_id=64) are preferred over those of the Trimble GPS.
+TRACK_DEVICES = [{'dataframe_name': 'trimble',
+                  'device_id': 63,
+                  'filename': 'ace_trimble_gps',
+                  'invalid_position_filename': 'ace_trimble_manual_position_errors.csv',
+                  'output_flagging_filename': 'flagging_data_ace_trimble_gps'},
+                 {'dataframe_name': 'glonass',
+                  'device_id': 64,
+                  'filename': 'ace_glonass',
+                  'invalid_position_filename': 'ace_glonass_manual_position_errors.csv',
+                  'output_flagging_filename': 'flagging_data_ace_glonass'}]
+
+# Data types of the columns of the track data from the devices.
+TRACK_DATATYPES = data_schema.TRACK_CSV_SCHEMA['datatypes']
+
+# Data types of the columns of the flagged (intermediate) track data.
+FLAGGED_TRACK_DATATYPES = data_schema.FLAGGED_TRACK_CSV_SCHEMA['datatypes']
+
+
 def process_track_data(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath, input_filename, device_id, output_create_files_filepath, output_create_files_filename,
-                       invalid_position_filepath, output_flagging_filepath, output_flagging_filename):
+                       invalid_position_filepath, output_flagging_filepath, output_flagging_filename, in_port_filepath=''):
     """Process track data from some input. Output data as a pandas dataframe and perform some quality assurance and quality checking of the data points."""
 
-    concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename)
+    concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                                                                     datatypes=TRACK_DATATYPES)
 
     # Read the concatenated csv file into a pandas dataframe.
-    datatypes = {'id': 'int32',
-              'latitude': 'float64',
-              'longitude': 'float64',
-              'fix_quality': 'int8',
-              'number_satellites': 'int8',
-              'horiz_dilution_of_position': 'float16',
-              'altitude': 'float16',
-              'altitude_units': 'category',
-              'geoid_height': 'float16',
-              'geoid_height_units': 'category',
-              'device_id': 'int8',
-              'measureland_qualifier_flags_id': 'int8'}
-
-    track_df = pandas.read_csv(concatenated_file, dtype=datatypes, date_parser=pandas.to_datetime, parse_dates=[1, 13])
+    track_df = cruise_track_data_processing_utils.read_track_csv(concatenated_file, data_schema.TRACK_CSV_SCHEMA)
 
     print(track_df.sample(5))
     start_dataframe_length = len(track_df)
@@ -38,7 +53,7 @@ def process_track_data(dataframe_name, concatenated_filepath, concatenated_filen
     print(track_df['speed'].head(10))
     print(track_df['distance'].head(10))
     track_df = cruise_track_data_processing_utils.analyse_speed(track_df)
-    track_df = cruise_track_data_processing_utils.analyse_distance_between_points(track_df)
+    track_df = cruise_track_data_processing_utils.analyse_distance_between_points(track_df, in_port_filepath)
 
     #print(track_df['measureland_qualifier_flag_speed'].head(10))
     #print(track_df['measureland_qualifier_flag_distance'].head(10))
@@ -66,15 +81,17 @@ def process_track_data(dataframe_name, concatenated_filepath, concatenated_filen
 
     # Calculate an overall quality flag, taking into account all of the factors tested above.
     print("Calculating overall measureand qualifier flag from individual ones.")
-    track_df['measureland_qualifier_flag_overall'] = track_df.apply(cruise_track_data_processing_utils.calculate_measureland_qualifier_flag_overall, axis=1)
-    track_df['measureland_qualifier_flag_overall'] = track_df['measureland_qualifier_flag_overall'].astype('int8')
+    track_df['measureland_qualifier_flag_overall'] = cruise_track_data_processing_utils.combine_measureland_qualifier_flags(track_df)
     #print("Dataframe with overall quality flag: ", track_df.head(10))
 
     print("OVERALL:", track_df['measureland_qualifier_flag_overall'].value_counts())
 
+    # Store the flags and the other columns with the smallest data types of the schema.
+    track_df, memory_report = data_schema.downcast_dataframe(track_df)
+    print(memory_report)
 
     # Output the data files where they have been flagged to show the intermediate steps and flagging.
-    cruise_track_data_processing_utils.output_daily_files(track_df, output_flagging_filepath, output_flagging_filename)
+    cruise_track_data_processing_utils.output_daily_parquet_files(track_df, output_flagging_filepath, output_flagging_filename)
 
     end_dataframe_length = len(track_df)
 
@@ -94,72 +111,620 @@ def process_track_data(dataframe_name, concatenated_filepath, concatenated_filen
     return track_df
 
 
+def read_track_data_in_chunks(concatenated_file, chunk_size):
+    """Read the concatenated csv file of track data in chunks of chunk_size rows, in time order."""
+
+    return cruise_track_data_processing_utils.read_track_csv_in_chunks(concatenated_file, data_schema.TRACK_CSV_SCHEMA, chunk_size)
+
+
+def calculate_speed_upper_bound_in_chunks(concatenated_file, chunk_size):
+    """Calculate the upper bound of the speed of the whole track, reading it in chunks. The statistics of the speed are
+    accumulated chunk by chunk, so the speeds are not kept in memory."""
+
+    speed_statistics = cruise_track_data_processing_utils.StreamingStatistics()
+    previous_point = None
+
+    for chunk_df in read_track_data_in_chunks(concatenated_file, chunk_size):
+        date_time_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(chunk_df['date_time'])
+        latitude = chunk_df['latitude'].values.astype('float64')
+        longitude = chunk_df['longitude'].values.astype('float64')
+
+        # Add the last point of the previous chunk so that the speed of the first point of this chunk is calculated.
+        if previous_point is not None:
+            date_time_ns = np.concatenate(([previous_point[0]], date_time_ns))
+            latitude = np.concatenate(([previous_point[1]], latitude))
+            longitude = np.concatenate(([previous_point[2]], longitude))
+
+        (distance_m, speed_knots) = cruise_track_data_processing_utils.knots_consecutive_points(date_time_ns, latitude, longitude)
+        speed_statistics.update(speed_knots)
+
+        previous_point = (date_time_ns[-1], latitude[-1], longitude[-1])
+
+    speed_statistics.print_statistics('speed')
+
+    return speed_statistics.iqr_upper_bound()
+
+
+def process_track_data_in_chunks(dataframe_name, concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                 invalid_position_filepath, output_flagging_filepath, output_flagging_filename, in_port_filepath='', chunk_size=1000000):
+    """Process track data in the same way as process_track_data, but reading and flagging it in chunks of chunk_size
+    rows so that the whole track is never in memory. The flagged chunks are written to the intermediate parquet files.
+
+    The upper bound of the speed is calculated from the whole track in a first pass. In the second pass, the last point
+    of each chunk is kept to calculate the speed and acceleration of the first point of the next chunk, so the flags
+    are the same as when processing the whole track at once."""
+
+    concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                                                                     datatypes=TRACK_DATATYPES)
+
+    upper_bound = calculate_speed_upper_bound_in_chunks(concatenated_file, chunk_size)
+    print("Upper bound:", upper_bound)
+
+    previous_point_df = None
+    initial_speed_knots = 0
+    number_of_rows = 0
+    count_acceleration_errors = 0
+    flag_counts = {}
+
+    for part, chunk_df in enumerate(read_track_data_in_chunks(concatenated_file, chunk_size)):
+        print("Processing chunk ", part, " of ", dataframe_name, " data: ", len(chunk_df), " rows")
+
+        (track_df, chunk_acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(chunk_df, previous_point_df, initial_speed_knots,
+                                                                                                    upper_bound, invalid_position_filepath, in_port_filepath)
+
+        cruise_track_data_processing_utils.output_daily_parquet_files(track_df, output_flagging_filepath, output_flagging_filename, part)
+
+        for flag_name in cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_COLUMNS + ['measureland_qualifier_flag_overall']:
+            flag_counts[flag_name] = flag_counts.get(flag_name, pandas.Series(dtype='int64')).add(track_df[flag_name].value_counts(), fill_value=0)
+
+        number_of_rows += len(track_df)
+        count_acceleration_errors += chunk_acceleration_errors
+
+        # The speed before the second point of the track is taken as 0, as the first point has no speed.
+        previous_point_df = track_df.iloc[[-1]]
+        initial_speed_knots = 0 if number_of_rows == 1 else track_df['speed'].iloc[-1]
+
+    print("Number of acceleration errors: ", count_acceleration_errors)
+    for flag_name, counts in flag_counts.items():
+        print(flag_name, ":", counts.astype('int64'))
+
+    print("Length of dataframe processed in chunks: ", number_of_rows)
+
+
+def calculate_speed_upper_bound(track_df):
+    """Calculate the upper bound of the speed of the whole track, without adding any column to the dataframe. Output the
+    upper bound and the speed of each point."""
+
+    date_time_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(track_df['date_time'])
+    latitude = track_df['latitude'].values.astype('float64')
+    longitude = track_df['longitude'].values.astype('float64')
+
+    (distance_m, speed_knots) = cruise_track_data_processing_utils.knots_consecutive_points(date_time_ns, latitude, longitude)
+
+    speed_statistics = cruise_track_data_processing_utils.StreamingStatistics()
+    speed_statistics.update(speed_knots)
+    speed_statistics.print_statistics('speed')
+
+    return (speed_statistics.iqr_upper_bound(), speed_knots)
+
+
+def flag_and_output_track_day(day_df, previous_point_df, initial_speed_knots, upper_bound, invalid_position_filepath,
+                              in_port_filepath, output_flagging_filepath, output_flagging_filename):
+    """Flag one day of the track data and write it to the intermediate parquet files. Only the counts of the flags are
+    output, so that the flagged data are not sent back when this runs in a separate process."""
+
+    (track_df, count_acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(day_df, previous_point_df, initial_speed_knots,
+                                                                                                upper_bound, invalid_position_filepath, in_port_filepath)
+
+    cruise_track_data_processing_utils.output_daily_parquet_files(track_df, output_flagging_filepath, output_flagging_filename)
+
+    flag_counts = {}
+    for flag_name in cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_COLUMNS + ['measureland_qualifier_flag_overall']:
+        flag_counts[flag_name] = track_df[flag_name].value_counts()
+
+    return (len(track_df), count_acceleration_errors, flag_counts)
+
+
+def process_track_data_by_day(dataframe_name, concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                              invalid_position_filepath, output_flagging_filepath, output_flagging_filename, in_port_filepath='', max_workers=None):
+    """Process track data in the same way as process_track_data, but flagging each day in a separate process, with up
+    to max_workers processes (the number of processors if None). The flagged days are written to the intermediate
+    parquet files.
+
+    The upper bound of the speed is calculated from the whole track beforehand. Each day is given the last point of the
+    previous day to calculate the speed and acceleration of its first point, so the flags are the same as when
+    processing the whole track at once."""
+
+    concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                                                                     datatypes=TRACK_DATATYPES)
+
+    track_df = cruise_track_data_processing_utils.read_track_csv(concatenated_file, data_schema.TRACK_CSV_SCHEMA)
+
+    (upper_bound, speed_knots) = calculate_speed_upper_bound(track_df)
+    print("Upper bound:", upper_bound)
+
+    days = cruise_track_data_processing_utils.split_track_by_day(track_df, speed_knots)
+    print("Processing ", len(days), " days of ", dataframe_name, " data")
+
+    number_of_rows = 0
+    count_acceleration_errors = 0
+    flag_counts = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(flag_and_output_track_day, day_df, previous_point_df, initial_speed_knots, upper_bound,
+                                   invalid_position_filepath, in_port_filepath, output_flagging_filepath, output_flagging_filename)
+                   for (day_df, previous_point_df, initial_speed_knots) in days]
+
+        for future in futures:
+            (day_rows, day_acceleration_errors, day_flag_counts) = future.result()
+
+            number_of_rows += day_rows
+            count_acceleration_errors += day_acceleration_errors
+            for flag_name, counts in day_flag_counts.items():
+                flag_counts[flag_name] = flag_counts.get(flag_name, pandas.Series(dtype='int64')).add(counts, fill_value=0)
+
+    print("Number of acceleration errors: ", count_acceleration_errors)
+    for flag_name, counts in flag_counts.items():
+        print(flag_name, ":", counts.astype('int64'))
+
+    print("Length of dataframe at start: ", len(track_df))
+    print("Length of dataframe processed by day: ", number_of_rows)
+
+
+def load_track_stage(concatenated_file, daily_file_list=None):
+    """Stage of the processing which reads the concatenated csv file of the track data. If the list of daily files is
+    given, the concatenated file is created again from them first, as they have changed since it was created."""
+
+    if daily_file_list is not None:
+        cruise_track_data_processing_utils.concatenate_csv_files(daily_file_list, concatenated_file + ".tmp")
+        os.replace(concatenated_file + ".tmp", concatenated_file)
+
+    return cruise_track_data_processing_utils.read_track_csv(concatenated_file, data_schema.TRACK_CSV_SCHEMA)
+
+
+def speed_stage(track_df):
+    """Stage of the processing which calculates the speed and distance between consecutive points and flags the speed.
+    Only the new columns are output."""
+
+    speed_df = track_df[['date_time', 'latitude', 'longitude']].copy()
+    cruise_track_data_processing_utils.calculate_speed(speed_df)
+    cruise_track_data_processing_utils.analyse_speed(speed_df)
+
+    return speed_df[['measureland_qualifier_flag_speed', 'speed', 'distance']]
+
+
+def distance_stage(track_df, in_port_filepath):
+    """Stage of the processing which flags the distance between consecutive points. Only the new column is output."""
+
+    distance_df = track_df[['date_time', 'distance']].copy()
+    cruise_track_data_processing_utils.analyse_distance_between_points(distance_df, in_port_filepath)
+
+    return distance_df[['measureland_qualifier_flag_distance']]
+
+
+def course_stage(track_df):
+    """Stage of the processing which flags the acceleration. Only the new column is output."""
+
+    course_df = track_df[['date_time', 'speed']].copy()
+    count_acceleration_errors = cruise_track_data_processing_utils.analyse_course(course_df)
+    print("Number of acceleration errors: ", count_acceleration_errors)
+
+    return course_df[['measureland_qualifier_flag_acceleration']]
+
+
+def visual_stage(track_df, invalid_position_filepath):
+    """Stage of the processing which flags the points identified visually as incorrect. Only the new column is output."""
+
+    visual_df = track_df[['date_time']].copy()
+    cruise_track_data_processing_utils.update_visual_position_flag(visual_df, invalid_position_filepath)
+
+    return visual_df[['measureland_qualifier_flag_visual']]
+
+
+def overall_stage(track_df):
+    """Stage of the processing which calculates the overall qualifier flag. Only the new column is output."""
+
+    return pandas.DataFrame({'measureland_qualifier_flag_overall': cruise_track_data_processing_utils.combine_measureland_qualifier_flags(track_df)})
+
+
+def process_track_data_with_stage_cache(dataframe_name, concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                        invalid_position_filepath, output_flagging_filepath, output_flagging_filename, in_port_filepath='', cache_path=None):
+    """Process track data in the same way as process_track_data, keeping the result of each stage in a cache in
+    cache_path (<output_flagging_filename>_stage_cache in the output_flagging_filepath if None).
+
+    Each stage has a fingerprint calculated from its input files, the fingerprints of the stages it uses and its
+    parameters. Only the stages with a fingerprint which is not in the cache are calculated, so changing the invalid
+    position file only recalculates the visual and overall flags. If there are daily csv files
+    (<concatenated_filename>_YYYY-MM-DD.csv), the track data are fingerprinted from their names and contents (see
+    cruise_track_data_processing_utils.fingerprint_files), and the concatenated file is created again from them when
+    they change; otherwise from the content of the concatenated file. The intermediate parquet files are written again if the overall flag has been calculated.
+    Output the flagged data."""
+
+    if cache_path is None:
+        cache_path = os.path.join(output_flagging_filepath, output_flagging_filename + "_stage_cache")
+
+    fingerprint_stage = cruise_track_data_processing_utils.fingerprint_stage
+    fingerprint_file = cruise_track_data_processing_utils.fingerprint_file
+    run_cached_stage = cruise_track_data_processing_utils.run_cached_stage
+
+    daily_file_list = cruise_track_data_processing_utils.get_daily_csv_files(concatenated_filepath, concatenated_filename)
+
+    if len(daily_file_list) > 0:
+        concatenated_file = concatenated_filepath + "/" + concatenated_filename + "_concatenated.csv"
+        load_fingerprint = fingerprint_stage('load', cruise_track_data_processing_utils.fingerprint_files(daily_file_list,
+                                                                                                         cruise_track_data_processing_utils.get_fingerprint_cache_file(cache_path)),
+                                             TRACK_DATATYPES)
+        (track_df, calculated) = run_cached_stage(cache_path, 'load', load_fingerprint, load_track_stage, concatenated_file, daily_file_list)
+    else:
+        concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id,
+                                                                                         output_create_files_filepath, output_create_files_filename,
+                                                                                         datatypes=TRACK_DATATYPES)
+        load_fingerprint = fingerprint_stage('load', fingerprint_file(concatenated_file), TRACK_DATATYPES)
+        (track_df, calculated) = run_cached_stage(cache_path, 'load', load_fingerprint, load_track_stage, concatenated_file)
+    track_df = track_df.astype(TRACK_DATATYPES)
+
+    speed_fingerprint = fingerprint_stage('speed', load_fingerprint)
+    (speed_df, calculated) = run_cached_stage(cache_path, 'speed', speed_fingerprint, speed_stage, track_df)
+    track_df = pandas.concat([track_df, speed_df], axis=1)
+
+    distance_fingerprint = fingerprint_stage('distance', speed_fingerprint, fingerprint_file(in_port_filepath))
+    course_fingerprint = fingerprint_stage('course', speed_fingerprint)
+    visual_fingerprint = fingerprint_stage('visual', load_fingerprint, fingerprint_file(invalid_position_filepath))
+
+    (distance_df, calculated) = run_cached_stage(cache_path, 'distance', distance_fingerprint, distance_stage, track_df, in_port_filepath)
+    (course_df, calculated) = run_cached_stage(cache_path, 'course', course_fingerprint, course_stage, track_df)
+    (visual_df, calculated) = run_cached_stage(cache_path, 'visual', visual_fingerprint, visual_stage, track_df, invalid_position_filepath)
+    track_df = pandas.concat([track_df, distance_df, course_df, visual_df], axis=1)
+
+    overall_fingerprint = fingerprint_stage('overall', speed_fingerprint, distance_fingerprint, course_fingerprint, visual_fingerprint,
+                                            cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_COLUMNS,
+                                            cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_OVERALL_RULES,
+                                            cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_OVERALL_DEFAULT)
+    (overall_df, calculated) = run_cached_stage(cache_path, 'overall', overall_fingerprint, overall_stage, track_df)
+    track_df = pandas.concat([track_df, overall_df], axis=1).astype(FLAGGED_TRACK_DATATYPES)
+
+    print("OVERALL:", track_df['measureland_qualifier_flag_overall'].value_counts())
+
+    # Write the intermediate files again, removing those of an earlier run, as some of the flags have changed.
+    if calculated or len(cruise_track_data_processing_utils.get_parquet_store_files(output_flagging_filepath, output_flagging_filename)) == 0:
+        store_path = cruise_track_data_processing_utils.get_parquet_store_path(output_flagging_filepath, output_flagging_filename)
+        if os.path.isdir(store_path):
+            shutil.rmtree(store_path)
+        cruise_track_data_processing_utils.output_daily_parquet_files(track_df, output_flagging_filepath, output_flagging_filename)
+
+    return track_df
+
+
+def process_new_track_data(dataframe_name, input_filepath, input_filename, invalid_position_filepath,
+                           output_flagging_filepath, output_flagging_filename, in_port_filepath='', last_day=None):
+    """Process only the daily csv files of track data which have not been processed yet, until last_day (YYYY-MM-DD, or
+    all of them if it is None). Output the new flagged data and the new state of the incremental processing, or
+    (None, None) if there are no new files. Neither is written (see output_new_track_data), so that they can be kept
+    only once the new points have been prioritised.
+
+    The last point processed and the statistics of the speed of all the points processed are kept in the parquet store
+    between runs. The last point is used to calculate the speed and acceleration of the first new point, and the upper
+    bound of the speed is calculated from the statistics updated with the new points, so the time taken depends only on
+    the number of new files. The points processed earlier are not flagged again with the new upper bound. Only
+    complete daily files should be processed, as a file is not read again once it has been processed."""
+
+    (processed_file_list, last_point_df, speed_statistics) = cruise_track_data_processing_utils.get_incremental_state(output_flagging_filepath, output_flagging_filename,
+                                                                                                                     input_filepath, input_filename)
+
+    new_file_list = cruise_track_data_processing_utils.get_new_daily_csv_files(input_filepath, input_filename, processed_file_list)
+    if last_day is not None:
+        new_file_list = [file for file in new_file_list if cruise_track_data_processing_utils.get_daily_csv_file_day(file) <= last_day]
+    print("Number of new ", dataframe_name, " files to process: ", len(new_file_list))
+
+    if len(new_file_list) == 0:
+        return (None, None)
+
+    new_df = pandas.concat(cruise_track_data_processing_utils.read_csv_files_in_chunks(new_file_list, data_schema.TRACK_CSV_SCHEMA), ignore_index=True)
+    new_df = cruise_track_data_processing_utils.sort_dataframe_by_time(new_df)
+
+    if last_point_df is None:
+        initial_speed_knots = 0
+    else:
+        if new_df['date_time'].iloc[0] < last_point_df['date_time'].iloc[0]:
+            raise ValueError("The new {} data begin at {}, before the last point processed at {}. Process all of the data again.".format(
+                dataframe_name, new_df['date_time'].iloc[0], last_point_df['date_time'].iloc[0]))
+
+        # Only the first point of the track has no distance. The speed before the second point of the track is taken as 0.
+        initial_speed_knots = 0 if np.isnan(last_point_df['distance'].iloc[0]) else last_point_df['speed'].iloc[0]
+
+    # Update the statistics of the speed with the new points, including the first one, to calculate the upper bound.
+    date_time_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(new_df['date_time'])
+    latitude = new_df['latitude'].values.astype('float64')
+    longitude = new_df['longitude'].values.astype('float64')
+    if last_point_df is not None:
+        date_time_ns = np.concatenate((cruise_track_data_processing_utils.date_time_to_nanoseconds(last_point_df['date_time']), date_time_ns))
+        latitude = np.concatenate((last_point_df['latitude'].values.astype('float64'), latitude))
+        longitude = np.concatenate((last_point_df['longitude'].values.astype('float64'), longitude))
+
+    (distance_m, speed_knots) = cruise_track_data_processing_utils.knots_consecutive_points(date_time_ns, latitude, longitude)
+    speed_statistics.update(speed_knots if last_point_df is None else speed_knots[1:])
+    speed_statistics.print_statistics('speed')
+
+    upper_bound = speed_statistics.iqr_upper_bound()
+    print("Upper bound:", upper_bound)
+
+    (track_df, count_acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(new_df, last_point_df, initial_speed_knots,
+                                                                                                upper_bound, invalid_position_filepath, in_port_filepath)
+    print("Number of acceleration errors: ", count_acceleration_errors)
+    print("OVERALL:", track_df['measureland_qualifier_flag_overall'].value_counts())
+
+    processed_file_list = processed_file_list + [os.path.basename(file) for file in new_file_list]
+
+    return (track_df, (processed_file_list, track_df.iloc[[-1]], speed_statistics))
+
+
+def output_new_track_data(track_df, state, output_flagging_filepath, output_flagging_filename):
+    """Add the new flagged data of process_new_track_data to the intermediate parquet files and write the new state of
+    the incremental processing. Nothing is written if there are no new data."""
+
+    if track_df is None:
+        return
+
+    cruise_track_data_processing_utils.output_daily_parquet_files(track_df, output_flagging_filepath, output_flagging_filename)
+
+    (processed_file_list, last_point_df, speed_statistics) = state
+    cruise_track_data_processing_utils.output_incremental_state(output_flagging_filepath, output_flagging_filename, processed_file_list,
+                                                                last_point_df, speed_statistics)
+
+
+def process_new_combined_track_data(dataframes, output_filepath, output_filename):
+    """Combine the new flagged data of the devices (None for a device with no new data), prioritise the data points
+    and add them to the end of the prioritised csv file. The daily files of the devices should be processed together,
+    as the prioritised file can only be added to with points later than those it already has."""
+
+    frames = [dataframe for dataframe in dataframes if dataframe is not None]
+
+    if len(frames) == 0:
+        print("No new track data to prioritise.")
+        return None
+
+    track_df = cruise_track_data_processing_utils.merge_sorted_dataframes(frames)
+    track_df_overall_flags = cruise_track_data_processing_utils.remove_intermediate_columns(track_df)
+
+    return cruise_track_data_processing_utils.append_prioritised_data_points(track_df_overall_flags, output_filepath, output_filename)
+
+
+def get_last_day_of_all_devices(devices, track_data_filepath):
+    """Get the last day (YYYY-MM-DD) for which each of the devices from TRACK_DEVICES has a daily csv file, or None
+    if a device has none. The later days of the other devices are held back until the device which lags behind has
+    them too, as the prioritised file can only be added to with later points."""
+
+    last_days = []
+    for device in devices:
+        file_list = cruise_track_data_processing_utils.get_daily_csv_files(track_data_filepath, device['filename'])
+
+        if len(file_list) == 0:
+            return None
+
+        last_days.append(cruise_track_data_processing_utils.get_daily_csv_file_day(file_list[-1]))
+
+    return min(last_days)
+
+
+def process_new_track_data_of_devices(devices, track_data_filepath, in_port_filepath, output_filename):
+    """Process the new daily files of the devices from TRACK_DEVICES until the last day which all of them have (see
+    get_last_day_of_all_devices) and add their prioritised points to the prioritised csv file. The flagged data and
+    the state of each device are written only once the points have been added, so a run which fails can be done
+    again. Output the new prioritised points, or None if there are none."""
+
+    last_day = get_last_day_of_all_devices(devices, track_data_filepath)
+    print("Processing the new daily files until: ", last_day)
+
+    if last_day is None:
+        return None
+
+    new_track_data = []
+    for device in devices:
+        print("****PROCESSING NEW", device['dataframe_name'].upper(), "DATA ****")
+        new_track_data.append(process_new_track_data(device['dataframe_name'], track_data_filepath, device['filename'],
+                                                     os.path.join(track_data_filepath, device['invalid_position_filename']),
+                                                     track_data_filepath, device['output_flagging_filename'], in_port_filepath, last_day))
+
+    prioritised_df = process_new_combined_track_data([track_df for (track_df, state) in new_track_data], track_data_filepath, output_filename)
+
+    for (device, (track_df, state)) in zip(devices, new_track_data):
+        output_new_track_data(track_df, state, track_data_filepath, device['output_flagging_filename'])
+
+    return prioritised_df
+
+
 def begin_from_intermediate_files(intermediate_filepath, intermediate_filename):
     """If the intermediate flagged files exist, open these and create a concatenated csv file, to begin the next steps of analysis from here to avoid doing the full set of processing."""
 
     intermediate_concatenated_file = intermediate_filepath + "/" + intermediate_filename + "_concatenated.csv"
 
-    datatypes = {'id': 'int32',
-              'latitude': 'float64',
-              'longitude': 'float64',
-              'fix_quality': 'int8',
-              'number_satellites': 'int8',
-              'horiz_dilution_of_position': 'float16',
-              'altitude': 'float16',
-              'altitude_units': 'category',
-              'geoid_height': 'float16',
-              'geoid_height_units': 'category',
-              'device_id': 'int8',
-              'measureland_qualifier_flags_id': 'int8',
-              'measureland_qualifier_flag_speed': 'int8',
-              'speed': 'float64',
-              'distance': 'float64',
-              #'measureland_qualifier_flag_course': 'int8',
-              'measureland_qualifier_flag_distance': 'int8',
-              'measureland_qualifier_flag_acceleration': 'int8',
-              'measureland_qualifier_flag_visual': 'int8',
-              'measureland_qualifier_flag_overall': 'int8'
-                 }
-
     if not os.path.isfile(intermediate_concatenated_file):
         concatenated_filename = cruise_track_data_processing_utils.create_concatenated_csvfile(intermediate_filepath, intermediate_filename)
         print("Concatenated filename should now have been created: ", concatenated_filename)
 
-    intermediate_dataframe = pandas.read_csv(intermediate_concatenated_file, dtype=datatypes, date_parser=pandas.to_datetime, parse_dates=[1, 13])
+    intermediate_dataframe = cruise_track_data_processing_utils.read_track_csv(intermediate_concatenated_file, data_schema.FLAGGED_TRACK_CSV_SCHEMA)
 
     return intermediate_dataframe
 
 
-def decide_start_of_processing(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath, input_filename,
-                               device_id, output_create_files_filepath, output_create_files_filename, invalid_position_filepath,
-                               output_flagging_filepath, output_flagging_filename):
+def begin_from_parquet_store(intermediate_filepath, intermediate_filename, columns=None):
+    """If the intermediate flagged parquet files exist, read them (only the columns in the list of columns, or all of
+    them if it is None), to begin the next steps of analysis from here to avoid doing the full set of processing."""
+
+    intermediate_dataframe = cruise_track_data_processing_utils.get_data_from_parquet_store(intermediate_filepath, intermediate_filename,
+                                                                                              FLAGGED_TRACK_DATATYPES, columns)
+
+    return intermediate_dataframe
+
+
+def get_intermediate_files_format(output_flagging_filepath, output_flagging_filename):
+    """Check if the intermediate flagged files exist. Output 'parquet' or 'csv' depending on their format, or None if
+    they do not exist."""
 
+    parquet_file_list = cruise_track_data_processing_utils.get_parquet_store_files(output_flagging_filepath, output_flagging_filename)
 
     intermediate_files = output_flagging_filepath + "/" + output_flagging_filename + "*.csv"
     intermediate_file_list = glob.glob(intermediate_files)
     print("Checking if intermediate files, ", intermediate_files, " exist")
 
-    if len(intermediate_file_list) == 0:
-        print("Intermediate files do not exist. Doing processing from the beginning.")
-        intermediate_df = process_track_data(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath,
-                                        input_filename, device_id, output_create_files_filepath, output_create_files_filename,
-                                        invalid_position_filepath, output_flagging_filepath, output_flagging_filename)
+    if len(parquet_file_list) > 0:
+        return 'parquet'
+    elif len(intermediate_file_list) > 0:
+        return 'csv'
+
+    return None
+
+
+def create_intermediate_files(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath, input_filename,
+                              device_id, output_create_files_filepath, output_create_files_filename, invalid_position_filepath,
+                              output_flagging_filepath, output_flagging_filename, in_port_filepath='', chunk_size=None, day_workers=None):
+    """Process the track data of one device from the beginning and write the intermediate flagged parquet files,
+    in chunks of chunk_size rows if it is given, or else with the days flagged in parallel in day_workers processes
+    if it is given."""
+
+    if chunk_size is None and day_workers is not None:
+        process_track_data_by_day(dataframe_name, concatenated_filepath, concatenated_filename, device_id,
+                                  output_create_files_filepath, output_create_files_filename,
+                                  invalid_position_filepath, output_flagging_filepath, output_flagging_filename,
+                                  in_port_filepath, day_workers)
+    elif chunk_size is None:
+        process_track_data(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath,
+                           input_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                           invalid_position_filepath, output_flagging_filepath, output_flagging_filename,
+                           in_port_filepath)
+    else:
+        process_track_data_in_chunks(dataframe_name, concatenated_filepath, concatenated_filename, device_id,
+                                     output_create_files_filepath, output_create_files_filename,
+                                     invalid_position_filepath, output_flagging_filepath, output_flagging_filename,
+                                     in_port_filepath, chunk_size)
+
+
+def check_processing_mode(chunk_size=None, day_workers=None, cache_path=None):
+    """Raise a ValueError if chunk_size or day_workers is given together with cache_path, as the processing with the
+    stage cache always processes each track at once."""
+
+    if cache_path is not None and (chunk_size is not None or day_workers is not None):
+        raise ValueError("chunk_size and day_workers cannot be used with the stage cache (cache_path)")
+
+
+def decide_start_of_processing(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath, input_filename,
+                               device_id, output_create_files_filepath, output_create_files_filename, invalid_position_filepath,
+                               output_flagging_filepath, output_flagging_filename, in_port_filepath='', columns=None, chunk_size=None, day_workers=None,
+                               cache_path=None):
+    """Get the flagged data of one device. If cache_path is given, do the processing with the stage cache, which only
+    recalculates the stages whose inputs have changed. Otherwise read it from the intermediate parquet files if they
+    exist, or from the intermediate csv files from earlier runs, otherwise do the processing from the beginning (see
+    create_intermediate_files). chunk_size and day_workers cannot be given with cache_path."""
+
+    check_processing_mode(chunk_size, day_workers, cache_path)
+
+    if cache_path is not None:
+        intermediate_df = process_track_data_with_stage_cache(dataframe_name, concatenated_filepath, concatenated_filename, device_id,
+                                                              output_create_files_filepath, output_create_files_filename,
+                                                              invalid_position_filepath, output_flagging_filepath,
+                                                              output_flagging_filename, in_port_filepath, cache_path)
+        if columns is not None:
+            intermediate_df = intermediate_df[columns]
+
+        print("Intermediate data read into dataframe: ", intermediate_df.head())
+
+        return intermediate_df
+
+    intermediate_files_format = get_intermediate_files_format(output_flagging_filepath, output_flagging_filename)
+
+    if intermediate_files_format == 'parquet':
+        print("Intermediate parquet files already exist.")
+        intermediate_df = begin_from_parquet_store(output_flagging_filepath, output_flagging_filename, columns)
+    elif intermediate_files_format == 'csv':
+        print("Intermediate csv files already exist.")
+        intermediate_df = begin_from_intermediate_files(output_flagging_filepath, output_flagging_filename)
     else:
-        print("Intermediate files already exist.")
+        print("Intermediate files do not exist. Doing processing from the beginning.")
+        create_intermediate_files(dataframe_name, concatenated_filepath, concatenated_filename, input_filepath,
+                                  input_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                                  invalid_position_filepath, output_flagging_filepath, output_flagging_filename,
+                                  in_port_filepath, chunk_size, day_workers)
+
+        intermediate_df = begin_from_parquet_store(output_flagging_filepath, output_flagging_filename, columns)
 
-    intermediate_df = begin_from_intermediate_files(output_flagging_filepath, output_flagging_filename)
     print("Intermediate data read into dataframe: ", intermediate_df.head())
 
     return intermediate_df
 
 
-def process_combined_track_data(dataframe1, dataframe2):
-    """Combine the track data sets and prioritise data point selection."""
+def create_device_intermediate_files(device, track_data_filepath, in_port_filepath='', chunk_size=None, day_workers=None, cache_path=None):
+    """Create the intermediate flagged files of a device from TRACK_DEVICES, if they do not exist yet or, if
+    cache_path is given, if they are not up to date with the stage cache. The flagged data are not returned but
+    written to the intermediate parquet files, so this can run in a separate process. chunk_size and day_workers cannot
+    be given with cache_path."""
+
+    check_processing_mode(chunk_size, day_workers, cache_path)
+
+    output_flagging_filename = device['output_flagging_filename']
+
+    if cache_path is not None:
+        print("****PROCESSING", device['dataframe_name'].upper(), "DATA WITH THE STAGE CACHE ****")
+        process_track_data_with_stage_cache(device['dataframe_name'], track_data_filepath, device['filename'], device['device_id'],
+                                            track_data_filepath, device['filename'],
+                                            os.path.join(track_data_filepath, device['invalid_position_filename']),
+                                            track_data_filepath, output_flagging_filename, in_port_filepath,
+                                            get_device_stage_cache_path(cache_path, device))
+    elif get_intermediate_files_format(track_data_filepath, output_flagging_filename) is None:
+        print("****PROCESSING", device['dataframe_name'].upper(), "DATA ****")
+        create_intermediate_files(device['dataframe_name'], track_data_filepath, device['filename'], track_data_filepath,
+                                  device['filename'], device['device_id'], track_data_filepath, device['filename'],
+                                  os.path.join(track_data_filepath, device['invalid_position_filename']),
+                                  track_data_filepath, output_flagging_filename, in_port_filepath, chunk_size, day_workers)
+
+    return output_flagging_filename
+
+
+def create_intermediate_files_in_parallel(devices, track_data_filepath, in_port_filepath='', chunk_size=None, day_workers=None, cache_path=None,
+                                          max_workers=None):
+    """Create the intermediate flagged files of the devices at the same time, each one in a separate process, so that
+    the time taken is that of the slowest device rather than the sum of all of them."""
+
+    check_processing_mode(chunk_size, day_workers, cache_path)
+
+    if max_workers is None:
+        max_workers = len(devices)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(create_device_intermediate_files, device, track_data_filepath, in_port_filepath, chunk_size, day_workers,
+                                   cache_path)
+                   for device in devices]
+
+        for future in futures:
+            print("Intermediate files created: ", future.result())
+
+
+def get_device_stage_cache_path(cache_path, device):
+    """Get the directory of the stage cache of a device from TRACK_DEVICES, in the directory of the stage cache."""
+
+    return os.path.join(cache_path, device['output_flagging_filename'])
+
+
+def get_device_track_data(device, track_data_filepath, in_port_filepath='', columns=None, chunk_size=None, day_workers=None, cache_path=None):
+    """Get the flagged data of a device from TRACK_DEVICES (see decide_start_of_processing)."""
+
+    if cache_path is not None:
+        cache_path = get_device_stage_cache_path(cache_path, device)
+
+    return decide_start_of_processing(device['dataframe_name'], track_data_filepath, device['filename'], track_data_filepath,
+                                      device['filename'], device['device_id'], track_data_filepath, device['filename'],
+                                      os.path.join(track_data_filepath, device['invalid_position_filename']),
+                                      track_data_filepath, device['output_flagging_filename'], in_port_filepath,
+                                      columns, chunk_size, day_workers, cache_path)
+
+
+def process_combined_track_data(dataframe1, dataframe2, *other_dataframes, cache_path=None):
+    """Combine the track data sets and prioritise data point selection. If cache_path is given, the prioritised data
+    points are kept in the stage cache and only selected again if the combined data have changed."""
 
     print("*****COMBINING TRACK DATA SETS*****")
 
-    # Combine the two dataframes of track data, into one dataframe.
-    track_df = cruise_track_data_processing_utils.combine_position_dataframes(dataframe1, dataframe2)
+    # Combine the dataframes of track data, into one dataframe.
+    track_df = cruise_track_data_processing_utils.combine_position_dataframes(dataframe1, dataframe2, *other_dataframes)
     print("Combined dataframe: ", track_df.head())
 
     # test writing to parquet
@@ -191,7 +756,14 @@ def process_combined_track_data(dataframe1, dataframe2):
     output_filename = "track_data_prioritised.csv"
 
     # For each second, prioritise the data points according to the source and MQF.
-    resulting_prioritised_df = cruise_track_data_processing_utils.prioritise_data_points(track_df_overall_flags, output_filepath, output_filename)
+    if cache_path is None:
+        resulting_prioritised_df = cruise_track_data_processing_utils.prioritise_data_points(track_df_overall_flags, output_filepath, output_filename)
+    else:
+        prioritise_fingerprint = cruise_track_data_processing_utils.fingerprint_stage('prioritise', cruise_track_data_processing_utils.fingerprint_dataframe(track_df_overall_flags))
+        (resulting_prioritised_df, calculated) = cruise_track_data_processing_utils.run_cached_stage(cache_path, 'prioritise', prioritise_fingerprint,
+                                                                                                     cruise_track_data_processing_utils.select_prioritised_data_points,
+                                                                                                     track_df_overall_flags)
+        cruise_track_data_processing_utils.output_prioritised_data_points(resulting_prioritised_df, output_filepath, output_filename)
 
     # delete the dataframe to save memory
     track_df_overall_flags.drop(track_df_overall_flags.index, inplace=True)
@@ -203,115 +775,44 @@ def process_combined_track_data(dataframe1, dataframe2):
 def main():
     """Run the processing for the different tracking instruments."""
 
-    print("****PROCESSING TRIMBLE GPS DATA ****")
-
-    concatenated_filepath_trimble = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    concatenated_filename_trimble = 'ace_trimble_gps'
-
-    input_filepath_trimble_gps = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    input_filename_trimble_gps = 'ace_trimble_gps'
-
-    # TESTING USING SUBSET OF FILES.
-    # input_filepath_trimble_gps = ''
-    # input_filename_trimble_gps = ''
-    #
-    # file_list = ['/home/jen/projects/ace_data_management/wip/cruise_track_data//ace_trimble_gps_2016-12-24.csv', '/home/jen/projects/ace_data_management/wip/cruise_track_data//ace_trimble_gps_2017-01-18.csv', '/home/jen/projects/ace_data_management/wip/cruise_track_data//ace_trimble_gps_2017-01-19.csv']
-    # header = ['id', 'date_time', 'latitude', 'longitude', 'fix_quality', 'number_satellites', 'horiz_dilution_of_position', 'altitude', 'altitude_units', 'geoid_height', 'geoid_height_units', 'device_id', 'measureland_qualifier_flags_id', 'date_time_day']
-
-    device_id_trimble_gps=63
-
-    output_create_files_filepath_trimble_gps = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    output_create_files_filename_trimble_gps = 'ace_trimble_gps'
-
-    invalid_position_filepath_trimble_gps = '/home/jen/projects/ace_data_management/wip/cruise_track_data/ace_trimble_manual_position_errors.csv'
-
-    output_flagging_filepath_trimble_gps = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    output_flagging_filename_trimble_gps = 'flagging_data_ace_trimble_gps'
+    # Periods when the ship was in port, which are used for all of the tracking instruments.
+    in_port_filepath = os.path.join(TRACK_DATA_FILEPATH, 'in_port.csv')
 
-    dataframe_name_trimble = 'trimble'
+    # Number of rows to process at a time, to limit the memory used. If None, each track is processed at once.
+    chunk_size = None
 
-    trimble_intermediate_df = decide_start_of_processing(dataframe_name_trimble, concatenated_filepath_trimble, concatenated_filename_trimble,
-                                         input_filepath_trimble_gps, input_filename_trimble_gps, device_id_trimble_gps,
-                                         output_create_files_filepath_trimble_gps,
-                                         output_create_files_filename_trimble_gps, invalid_position_filepath_trimble_gps,
-                                         output_flagging_filepath_trimble_gps, output_flagging_filename_trimble_gps)
-    # #
-    # trimble_df = process_track_data(dataframe_name_trimble, concatenated_filepath_trimble, concatenated_filename_trimble,
-    #                                  input_filepath_trimble_gps, input_filename_trimble_gps, device_id_trimble_gps,
-    #                                  output_create_files_filepath_trimble_gps,
-    #                                  output_create_files_filename_trimble_gps, invalid_position_filepath_trimble_gps,
-    #                                  output_flagging_filepath_trimble_gps, output_flagging_filename_trimble_gps)
-    #
-    # # Get some stats about and plot the speed throughout the cruise
-    # # cruise_track_data_processing_utils.get_stats(trimble_df, "speed")
-    # # trimble_remove_outlier = trimble_df.loc[(trimble_df['speed'] <= 100) & (trimble_df['speed'] > 2.5)]
-    # # cruise_track_data_processing_utils.get_stats(trimble_remove_outlier, "speed")
-    # #  cruise_track_data_plotting.plot_speed(trimble_remove_outlier, "red", "trimble")
-    #
-    # cruise_track_data_processing_utils.get_stats(trimble_intermediate_df, "speed")
-    # trimble_intermediate_remove_outlier = trimble_intermediate_df.loc[(trimble_intermediate_df['speed'] <= 100) & (trimble_intermediate_df['speed'] > 2.5)]
-    # cruise_track_data_processing_utils.get_stats(trimble_intermediate_remove_outlier, "speed")
-    # cruise_track_data_plotting.plot_speed(trimble_intermediate_remove_outlier, "red", "trimble")
-    #
-    # #cruise_track_data_plotting.plot_data_sources_from_dataframe(trimble_intermediate_remove_outlier, 'device_id')
-    #
-    print("****PROCESSING GLONASS DATA ****")
-
-    concatenated_filepath_glonass = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    concatenated_filename_glonass = 'ace_glonass'
-
-    input_filepath_glonass = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    input_filename_glonass = 'ace_glonass'
+    # Number of processes used to flag the days of each track in parallel. If None, each track is processed at once.
+    # Not used if chunk_size is given.
+    day_workers = None
 
-    # # TESTING USING SUBSET OF FILES.
-    # # input_filepath_glonass = ''
-    # # input_filename_glonass = ''
-    # #
-    # # file_list = ['/home/jen/projects/ace_data_management/wip/cruise_track_data//ace_glonass_2017-03-18.csv', '/home/jen/projects/ace_data_management/wip/cruise_track_data//ace_glonass_2017-03-19.csv']
-    # # header = ['id', 'date_time', 'latitude', 'longitude', 'fix_quality', 'number_satellites', 'horiz_dilution_of_position', 'altitude', 'altitude_units', 'geoid_height', 'geoid_height_units', 'device_id', 'measureland_qualifier_flags_id', 'date_time_day']
+    # Directory of the stage cache (such as os.path.join(TRACK_DATA_FILEPATH, 'stage_cache')), so that only the stages
+    # whose input files or parameters have changed are done again. If None, the intermediate files are used whenever
+    # they exist. chunk_size and day_workers cannot be used with the stage cache.
+    cache_path = None
 
-    device_id_glonass = 64
+    # If True, only the daily files which have not been processed yet are processed, and the new points are added to
+    # the intermediate files and to the end of the prioritised file. The whole track is not processed again.
+    incremental = False
 
-    output_create_files_filepath_glonass = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    output_create_files_filename_glonass = 'ace_glonass'
+    if incremental:
+        process_new_track_data_of_devices(TRACK_DEVICES, TRACK_DATA_FILEPATH, in_port_filepath, "track_data_prioritised.csv")
+        return
 
-    invalid_position_filepath_glonass = '/home/jen/projects/ace_data_management/wip/cruise_track_data/ace_glonass_manual_position_errors.csv'
+    # The devices are processed in parallel, each one in its own process.
+    create_intermediate_files_in_parallel(TRACK_DEVICES, TRACK_DATA_FILEPATH, in_port_filepath, chunk_size, day_workers, cache_path)
 
-    output_flagging_filepath_glonass = '/home/jen/projects/ace_data_management/wip/cruise_track_data/'
-    output_flagging_filename_glonass = 'flagging_data_ace_glonass'
+    # The processes have written the intermediate files, which are read without using the stage cache again.
+    intermediate_dfs = []
+    for device in TRACK_DEVICES:
+        print("****READING FLAGGED", device['dataframe_name'].upper(), "DATA ****")
+        intermediate_df = get_device_track_data(device, TRACK_DATA_FILEPATH, in_port_filepath, chunk_size=chunk_size, day_workers=day_workers)
 
-    dataframe_name_glonass = 'glonass'
-
-    glonass_intermediate_df = decide_start_of_processing(dataframe_name_glonass, concatenated_filepath_glonass, concatenated_filename_glonass,
-                                                         input_filepath_glonass, input_filename_glonass, device_id_glonass,
-                                     output_create_files_filepath_glonass, output_create_files_filename_glonass, invalid_position_filepath_glonass,
-                                     output_flagging_filepath_glonass, output_flagging_filename_glonass)
-
-    # # glonass_df = process_track_data(dataframe_name_glonass, concatenated_filepath_glonass, concatenated_filename_glonass,
-    # #                               input_filepath_glonass, input_filename_glonass, device_id_glonass,
-    # #                               output_create_files_filepath_glonass, output_create_files_filename_glonass,
-    # #                               invalid_position_filepath_glonass, output_flagging_filepath_glonass, output_flagging_filename_glonass)
-    #
-    # # Get some stats about and plot the speed throughout the cruise (use this version when doing the full processing)
-    # # cruise_track_data_processing_utils.get_stats(glonass_df, "speed")
-    # # glonass_remove_outlier = glonass_df.loc[(glonass_df['speed'] <= 100) & (glonass_df['speed'] > 2.5)]
-    # # cruise_track_data_processing_utils.get_stats(glonass_remove_outlier, "speed")
-    # #  cruise_track_data_plotting.plot_speed(glonass_remove_outlier, "red", "glonass")
-    #
-    # # Get some stats about and plot the speed throughout the cruise (use this version when doing the intermediate processing)
-    # cruise_track_data_processing_utils.get_stats(glonass_intermediate_df, "speed")
-    # glonass_intermediate_remove_outlier = glonass_intermediate_df.loc[(glonass_intermediate_df['speed'] <= 100) & (glonass_intermediate_df['speed'] > 2.5)]
-    # cruise_track_data_processing_utils.get_stats(glonass_intermediate_remove_outlier, "speed")
-    # cruise_track_data_plotting.plot_speed(glonass_intermediate_remove_outlier, "red", "glonass")
-    #
-    # # cruise_track_data_plotting.plot_data_sources_from_dataframe(glonass_intermediate_remove_outlier, 'device_id')
-    #
-    # Begin combining the dataframes and datatypes
-    print("Trimble data types to check: ", trimble_intermediate_df.dtypes)
-    print("Glonass data types to check: ", glonass_intermediate_df.dtypes)
+        # Begin combining the dataframes and datatypes
+        print(device['dataframe_name'], " data types to check: ", intermediate_df.dtypes)
+        intermediate_dfs.append(intermediate_df)
 
     # Combine the datasets
-    result_dataframe = process_combined_track_data(trimble_intermediate_df, glonass_intermediate_df)
+    result_dataframe = process_combined_track_data(*intermediate_dfs, cache_path=cache_path)
 
     # cruise_track_data_plotting.plot_data_sources_from_dataframe(result_dataframe, 'device_id')
 
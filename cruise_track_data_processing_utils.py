@@ -1,12 +1,119 @@
 import csv
-import MySQLdb
 import datetime
+import glob
+import hashlib
+import io
 import math
 import numpy as np
 import os
 import pandas
+import shutil
 import time
 
+def get_daily_csv_files(filepath, filename):
+    """Get the sorted list of the daily csv files (<filename>_YYYY-MM-DD.csv) in the filepath. Other csv files starting
+    with the filename, such as the concatenated file or the manual position errors, are not included."""
+
+    file_list = glob.glob(os.path.join(filepath, filename + "_[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].csv"))
+
+    return sorted(file_list)
+
+
+def count_csv_fields(line):
+    """Count the number of fields of a line (in bytes) of a csv file. Lines without quotes are counted directly,
+    otherwise they are parsed with the csv module."""
+
+    if b'"' not in line:
+        return line.count(b',') + 1
+
+    return len(next(csv.reader([line.decode()])))
+
+
+def iterate_valid_csv_lines(file_list):
+    """Read the csv files in the list, in order, and yield the header of the first file and then each line (in bytes)
+    of the files which has the same number of fields as the header. The header of the other files is skipped; it has
+    to be the same as the header of the first file."""
+
+    header = None
+
+    for file in file_list:
+        print("Reading file:", file)
+        with open(file, 'rb') as csvfile:
+            file_header = csvfile.readline().rstrip(b'\r\n')
+
+            if header is None:
+                header = file_header
+                number_of_fields = count_csv_fields(header)
+                yield header + b'\n'
+            elif file_header != header:
+                raise ValueError("Header of file {} is different from the header of {}: {}".format(file, file_list[0], file_header))
+
+            row_number = 1
+            for line in csvfile:
+                row_number += 1
+                line = line.rstrip(b'\r\n')
+
+                if line == b'':
+                    continue
+
+                if count_csv_fields(line) == number_of_fields:
+                    yield line + b'\n'
+                else:
+                    print("Line ", row_number, "has an incorrect number of variables. ", file, " ", line)
+
+
+def concatenate_csv_files(file_list, output_file, validate=True, buffer_size=16 * 1024 * 1024):
+    """Write the csv files in the list, in order, into one csv file with only one header line.
+    If validate is True, lines with an incorrect number of fields are skipped; otherwise, the data of each file is
+    copied in large blocks of bytes."""
+
+    with open(output_file, 'wb', buffering=buffer_size) as output:
+        if validate:
+            for line in iterate_valid_csv_lines(file_list):
+                output.write(line)
+        else:
+            header = None
+            for file in file_list:
+                with open(file, 'rb') as csvfile:
+                    file_header = csvfile.readline()
+                    if header is None:
+                        header = file_header
+                        output.write(header)
+                    elif file_header.rstrip(b'\r\n') != header.rstrip(b'\r\n'):
+                        raise ValueError("Header of file {} is different from the header of {}: {}".format(file, file_list[0], file_header))
+
+                    shutil.copyfileobj(csvfile, output, buffer_size)
+
+                    # Make sure that the next file starts on a new line.
+                    if csvfile.tell() > len(file_header):
+                        csvfile.seek(-1, os.SEEK_END)
+                        if csvfile.read(1) != b'\n':
+                            output.write(b'\n')
+
+
+def read_csv_files_in_chunks(file_list, schema, chunk_size=1000000):
+    """Read the csv files in the list, in order, and yield pandas dataframes of up to chunk_size rows with the data
+    types and dates of the schema (see read_track_csv), skipping the lines with an incorrect number of fields. This
+    avoids creating a concatenated csv file."""
+
+    lines = iterate_valid_csv_lines(file_list)
+    header = next(lines, None)
+
+    if header is None:
+        return
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+
+        if len(chunk) == chunk_size:
+            yield read_track_csv(io.BytesIO(header + b''.join(chunk)), schema)
+            chunk = []
+
+    if len(chunk) > 0:
+        yield read_track_csv(io.BytesIO(header + b''.join(chunk)), schema)
+
+
 def create_concatenated_csvfile(filepath, filename):
 
 
@@ -14,34 +121,24 @@ def create_concatenated_csvfile(filepath, filename):
 
     # Check if the concatenated files exist.
     if not os.path.isfile(concatenated_filename):
-        execution = "csvstack " + filepath + "/" + filename + "*.csv " + " > " + concatenated_filename
-
-        print("Will execute:", execution)
-        os.system(execution)
+        file_list = get_daily_csv_files(filepath, filename)
 
-        print("Creating concatenated csv file:", concatenated_filename)
+        print("Creating concatenated csv file:", concatenated_filename, "from", len(file_list), "files")
+        concatenate_csv_files(file_list, concatenated_filename)
 
     return concatenated_filename
 
 
 def get_data_from_files(path, filename):
-    """Check if the data files exist. If they don't then get the data from the database, otherwise create a list of data files."""
+    """Check if the data files exist. If they don't then get the data from the database, otherwise create a list of the
+    daily data files (see get_daily_csv_files)."""
 
     data_files = []
 
     if path:
-        list_of_files = os.listdir(path)
-        print("List of data files:", list_of_files)
+        data_files = get_daily_csv_files(path, filename)
+        print("List of data files:", data_files)
 
-        for file in list_of_files:
-            if filename in file:
-                full_filepath = path + "/" + file
-                data_files.append(full_filepath)
-            #print(data_files)
-
-    else:
-        data_files = []
-    #print(data_files)
     return data_files
 
 
@@ -70,28 +167,161 @@ def create_header_from_file(file_list):
     return header
 
 
-def get_data_from_csv(filepath, filename, datatypes, date_column_list):
+def get_data_from_csv(filepath, filename, schema):
     """Get data from a csv file. In the processing this is used for getting data from the concatenated csv file but can be used for any.
-    Write it into a pandas dataframe.date_column_list should be [1, 19] or similar, with the index of the columns that should be converted to dates"""
+    Write it into a pandas dataframe with the data types and dates of the schema (see read_track_csv)."""
 
     concatenated_file = os.path.join(filepath, filename)
 
-    dataframe = get_data_from_csv_full_path(concatenated_file, datatypes, date_column_list)
+    dataframe = get_data_from_csv_full_path(concatenated_file, schema)
 
     return dataframe
 
 
-def get_data_from_csv_full_path(filepath, datatypes, date_column_list):
+def get_data_from_csv_full_path(filepath, schema):
     """Get data from a csv file. In the processing this is used for getting data from the concatenated csv file but can be used for any.
-    Write it into a pandas dataframe.date_column_list should be [1, 19] or similar, with the index of the columns that should be converted to dates"""
+    Write it into a pandas dataframe with the data types and dates of the schema (see read_track_csv)."""
 
-    dataframe = pandas.read_csv(filepath, dtype=datatypes, date_parser=pandas.to_datetime, parse_dates=date_column_list)
+    dataframe = read_track_csv(filepath, schema)
 
     return dataframe
 
 
-def get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename):
-    """Create one csv file of all of the data to import."""
+def import_pyarrow_csv():
+    """Import pyarrow and pyarrow.csv. Output the pyarrow module, or None if it is not installed."""
+
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        return None
+
+    return pyarrow
+
+
+def get_track_csv_datatypes(schema, columns=None):
+    """Get the data types and the date columns of the schema which are in the list of columns (all of them if it is
+    None)."""
+
+    datatypes = schema['datatypes']
+    date_columns = schema['date_columns']
+
+    if columns is not None:
+        datatypes = {column: datatype for column, datatype in datatypes.items() if column in columns}
+        date_columns = [column for column in date_columns if column in columns]
+
+    return (datatypes, date_columns)
+
+
+def get_track_csv_convert_options(pyarrow, schema, columns=None):
+    """Get the pyarrow.csv.ConvertOptions to read the columns of a csv file of track data with the types of the
+    schema. The float16 columns are read as float64 and converted by set_track_csv_datatypes, as pyarrow can not
+    convert csv values to float16. All of the types are given, so that the chunks of a file have the same types."""
+
+    (datatypes, date_columns) = get_track_csv_datatypes(schema, columns)
+
+    timestamp_type = pyarrow.timestamp('ns', tz='UTC') if schema['utc_offset'] else pyarrow.timestamp('ns')
+    column_types = {column: timestamp_type for column in date_columns}
+
+    for column, datatype in datatypes.items():
+        if datatype == 'category':
+            column_types[column] = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        elif datatype == 'float16':
+            column_types[column] = pyarrow.float64()
+        else:
+            column_types[column] = pyarrow.from_numpy_dtype(np.dtype(datatype))
+
+    return pyarrow.csv.ConvertOptions(column_types=column_types, include_columns=columns)
+
+
+def get_track_csv_pandas_datatypes(schema, columns=None):
+    """Get the data types to read the columns of a csv file of track data with pandas. The float16 columns are read
+    as float32, as pandas can not parse missing float16 values."""
+
+    (datatypes, date_columns) = get_track_csv_datatypes(schema, columns)
+
+    return {column: 'float32' if datatype == 'float16' else datatype for column, datatype in datatypes.items()}
+
+
+def set_track_csv_datatypes(dataframe, schema, columns=None):
+    """Set the data types and dates of the schema to a dataframe read from a csv file of track data by pyarrow or
+    pandas. The dates read as text by pandas are parsed by numpy as ISO 8601, without the UTC offset, and all of the
+    dates are output in UTC without a time zone."""
+
+    (datatypes, date_columns) = get_track_csv_datatypes(schema, columns)
+
+    for column in date_columns:
+        if not pandas.api.types.is_datetime64_any_dtype(dataframe[column]):
+            date_time_text = dataframe[column].str.slice(0, -6) if schema['utc_offset'] else dataframe[column]
+            dataframe[column] = date_time_text.to_numpy(dtype=str).astype('datetime64[ns]')
+        elif getattr(dataframe[column].dtype, 'tz', None) is not None:
+            dataframe[column] = dataframe[column].dt.tz_convert(None)
+
+    dataframe = dataframe.astype(datatypes)
+
+    if columns is not None:
+        dataframe = dataframe[columns]
+
+    return dataframe
+
+
+def read_track_csv(filepath, schema, columns=None):
+    """Read a csv file of track data (a path or a file object) into a pandas dataframe, with the data types and dates
+    of the schema (one of the *_CSV_SCHEMA of data_schema). Only the columns in the list of columns are read (all of
+    them if it is None). The dates are output in UTC without a time zone.
+
+    The file is parsed with pyarrow, which parses the ISO 8601 dates natively, if it is installed, otherwise with
+    pandas."""
+
+    pyarrow = import_pyarrow_csv()
+
+    if pyarrow is None:
+        dataframe = pandas.read_csv(filepath, dtype=get_track_csv_pandas_datatypes(schema, columns), usecols=columns)
+    else:
+        dataframe = pyarrow.csv.read_csv(filepath, convert_options=get_track_csv_convert_options(pyarrow, schema, columns)).to_pandas()
+
+    return set_track_csv_datatypes(dataframe, schema, columns)
+
+
+def read_track_csv_in_chunks(filepath, schema, chunk_size, columns=None):
+    """Read a csv file of track data in order, in dataframes of chunk_size rows (the last one can have fewer), with the
+    data types and dates of the schema (see read_track_csv). Only one chunk is in memory at a time.
+
+    With pyarrow, the file is streamed with pyarrow.csv.open_csv and its record batches are put together into the
+    chunks, otherwise it is read by pandas in chunks."""
+
+    pyarrow = import_pyarrow_csv()
+
+    if pyarrow is None:
+        for chunk_df in pandas.read_csv(filepath, dtype=get_track_csv_pandas_datatypes(schema, columns), usecols=columns,
+                                        chunksize=chunk_size):
+            yield set_track_csv_datatypes(chunk_df.reset_index(drop=True), schema, columns)
+        return
+
+    reader = pyarrow.csv.open_csv(filepath, convert_options=get_track_csv_convert_options(pyarrow, schema, columns))
+
+    batches = []
+    number_of_rows = 0
+    for batch in reader:
+        batches.append(batch)
+        number_of_rows += batch.num_rows
+
+        while number_of_rows >= chunk_size:
+            table = pyarrow.Table.from_batches(batches)
+            yield set_track_csv_datatypes(table.slice(0, chunk_size).to_pandas(), schema, columns)
+
+            batches = table.slice(chunk_size).to_batches()
+            number_of_rows -= chunk_size
+
+    if number_of_rows > 0:
+        yield set_track_csv_datatypes(pyarrow.Table.from_batches(batches).to_pandas(), schema, columns)
+
+
+def get_concatenated_csv_data(concatenated_filepath, concatenated_filename, device_id, output_create_files_filepath, output_create_files_filename,
+                              datatypes=None, db_connection=None, chunk_size=100000):
+    """Create one csv file of all of the data to import. If there are neither a concatenated file nor daily files, the
+    data of the device are extracted from the database (see extract_track_data_from_database), connecting to it with
+    connect_to_database if db_connection is not given."""
 
     # Create the full file name of the concatenated filename.
     concatenated_file = concatenated_filepath + "/" + concatenated_filename + "_concatenated.csv"
@@ -114,23 +344,106 @@ def get_concatenated_csv_data(concatenated_filepath, concatenated_filename, devi
             concatenated_file = create_concatenated_csvfile(concatenated_filepath, concatenated_filename)
             return concatenated_file
 
-        # If the individual files do not exist, get the data from the database, create the files then concatenate them.
+        # If the individual files do not exist, get the data from the database into the concatenated file.
         else:
-            database_query = "select * from ship_data_gpggagpsfix where device_id=" + int(
-                device_id) + " order by date_time;"
-            # print(database_query)
-            password = input()
+            if db_connection is None:
+                db_connection = connect_to_database()
 
-            db_connection = MySQLdb.connect(host='localhost', user='ace', passwd=password, db='ace2016', port=3306);
+            extract_track_data_from_database(db_connection, device_id, concatenated_file, datatypes, chunk_size)
+            return concatenated_file
 
-            track_df = get_data_from_database(database_query, db_connection)
-            track_df = string_to_datetime(track_df)
 
-            # Output the data into daily files (as they do not already exist).
-            output_daily_files(track_df, output_create_files_filepath, output_create_files_filename)
+# Columns of the track data in the database, in the order of the csv files. The date_time_day column is added to them.
+TRACK_DATABASE_COLUMNS = ['id', 'date_time', 'latitude', 'longitude', 'fix_quality', 'number_satellites', 'horiz_dilution_of_position',
+                          'altitude', 'altitude_units', 'geoid_height', 'geoid_height_units', 'device_id', 'measureland_qualifier_flags_id']
+
+
+def get_database_connection_parameters(environment=None):
+    """Get the parameters to connect to the MySQL database from the environment variables ACE_DATABASE_HOST,
+    ACE_DATABASE_PORT, ACE_DATABASE_NAME, ACE_DATABASE_USER and ACE_DATABASE_PASSWORD. The parameters which are not
+    defined are read from the [client] group of the MySQL option file ACE_DATABASE_OPTION_FILE (~/.my.cnf by
+    default) if it exists, otherwise the defaults are used for all of them except the password."""
+
+    if environment is None:
+        environment = os.environ
+
+    option_file = os.path.expanduser(environment.get('ACE_DATABASE_OPTION_FILE', '~/.my.cnf'))
+
+    if os.path.isfile(option_file):
+        parameters = {'read_default_file': option_file}
+        defaults = {}
+    elif 'ACE_DATABASE_PASSWORD' in environment:
+        parameters = {}
+        defaults = {'host': 'localhost', 'port': 3306, 'db': 'ace2016', 'user': 'ace'}
+    else:
+        raise ValueError("Define the ACE_DATABASE_PASSWORD environment variable or the MySQL option file " + option_file)
+
+    for (parameter, environment_variable) in [('host', 'ACE_DATABASE_HOST'), ('port', 'ACE_DATABASE_PORT'),
+                                              ('db', 'ACE_DATABASE_NAME'), ('user', 'ACE_DATABASE_USER'),
+                                              ('passwd', 'ACE_DATABASE_PASSWORD')]:
+        if environment_variable in environment:
+            parameters[parameter] = environment[environment_variable]
+        elif parameter in defaults:
+            parameters[parameter] = defaults[parameter]
+
+    if 'port' in parameters:
+        parameters['port'] = int(parameters['port'])
+
+    return parameters
+
+
+def connect_to_database():
+    """Connect to the MySQL database (see get_database_connection_parameters). The rows of the queries are streamed
+    from the server (server-side cursor) instead of all being read into memory at once."""
+
+    import MySQLdb
+    import MySQLdb.cursors
+
+    return MySQLdb.connect(cursorclass=MySQLdb.cursors.SSCursor, **get_database_connection_parameters())
 
-            concatenated_file = create_concatenated_csvfile(concatenated_filepath, concatenated_filename)
-            return concatenated_file
+
+def read_track_data_from_database(db_connection, device_id, datatypes=None, chunk_size=100000):
+    """Read the track data of a device from the database, in time order, and yield pandas dataframes of up to chunk_size
+    rows. Only the TRACK_DATABASE_COLUMNS are read, and the data types are set to those in datatypes."""
+
+    query = "SELECT {} FROM ship_data_gpggagpsfix WHERE device_id={:d} ORDER BY date_time".format(", ".join(TRACK_DATABASE_COLUMNS), int(device_id))
+    print("Reading data from the database: ", query)
+
+    if datatypes is None:
+        datatypes = {}
+    datatypes_present = {column: datatype for column, datatype in datatypes.items() if column in TRACK_DATABASE_COLUMNS}
+
+    for chunk_df in pandas.read_sql(query, con=db_connection, chunksize=chunk_size):
+        chunk_df = chunk_df.astype(datatypes_present)
+        chunk_df['date_time'] = pandas.to_datetime(chunk_df['date_time'])
+        chunk_df['date_time_day'] = chunk_df['date_time'].dt.normalize()
+
+        yield chunk_df
+
+
+def extract_track_data_from_database(db_connection, device_id, concatenated_file, datatypes=None, chunk_size=100000):
+    """Extract the track data of a device from the database in chunks of chunk_size rows (see
+    read_track_data_from_database). Each chunk is added to the concatenated csv file, so the data are never all in
+    memory. Output the number of rows."""
+
+    # Write to a temporary file first, so that an interrupted extraction does not leave an incomplete concatenated file.
+    temporary_file = concatenated_file + ".tmp"
+    number_of_rows = 0
+
+    for part, chunk_df in enumerate(read_track_data_from_database(db_connection, device_id, datatypes, chunk_size)):
+        print("Extracted chunk ", part, " from the database: ", len(chunk_df), " rows")
+
+        chunk_df.to_csv(temporary_file, index=False, mode='w' if part == 0 else 'a', header=(part == 0))
+
+        number_of_rows += len(chunk_df)
+
+    if number_of_rows == 0:
+        raise ValueError("No data in the database for device_id={}".format(device_id))
+
+    os.replace(temporary_file, concatenated_file)
+    print("Number of rows extracted from the database: ", number_of_rows)
+
+    return number_of_rows
 
 
 def get_data_from_file_list(file_list, header):
@@ -179,15 +492,272 @@ def output_daily_files(dataframe, path, filename):
         days.get_group(day).to_csv(output_path, index=False)
 
 
-def get_location(datetime, position_df):
-    """Create a tuple of the date_time, latitude and longitude of a location in a dataframe from a given date_time."""
+def get_parquet_store_path(path, filename):
+    """Get the directory of the parquet store of the data, which contains one directory per device_id and one parquet file per day."""
+
+    return os.path.join(path, filename + "_parquet")
+
+
+def output_daily_parquet_files(dataframe, path, filename, part=None):
+    """Create parquet files from the data as it is grouped by device and day, keeping the data types of the columns.
+    The files are in the directory <filename>_parquet/device_id=<device_id>/ with the name <filename>_<day>.parquet,
+    or <filename>_<day>_<part>.parquet when the data of a day are written in several parts."""
+
+    store_path = get_parquet_store_path(path, filename)
+
+    for (device_id, day), day_df in dataframe.groupby(['device_id', 'date_time_day'], observed=True, sort=True):
+        device_path = os.path.join(store_path, "device_id={}".format(device_id))
+        os.makedirs(device_path, exist_ok=True)
+
+        output_name = "{}_{}".format(filename, pandas.Timestamp(day).strftime('%Y-%m-%d'))
+        if part is not None:
+            output_name += "_{:05d}".format(part)
+
+        output_path = os.path.join(device_path, output_name + ".parquet")
+        print("Creating intermediate flagged data file: ", output_path)
+        day_df.to_parquet(output_path, index=False)
+
+
+def get_parquet_store_files(path, filename):
+    """Get the list of parquet files of the parquet store, sorted by device and day."""
+
+    return sorted(glob.glob(os.path.join(get_parquet_store_path(path, filename), "device_id=*", filename + "_*.parquet")))
+
+
+def get_data_from_parquet_store(path, filename, datatypes, columns=None):
+    """Get the data from the parquet store into a pandas dataframe. Only the columns in the list of columns are read
+    (all of them if it is None), and the data types are set again to those in datatypes."""
+
+    file_list = get_parquet_store_files(path, filename)
+    print("Reading ", len(file_list), " files from the parquet store ", get_parquet_store_path(path, filename))
+
+    dataframe = pandas.concat([pandas.read_parquet(file, columns=columns) for file in file_list], ignore_index=True)
+
+    datatypes_present = {column: datatype for column, datatype in datatypes.items() if column in dataframe.columns}
+    dataframe = dataframe.astype(datatypes_present)
+
+    return dataframe
+
+
+def get_new_daily_csv_files(filepath, filename, processed_file_list):
+    """Get the sorted list of the daily csv files (<filename>_YYYY-MM-DD.csv) in the filepath which are not in the list
+    of the names of the files already processed."""
+
+    processed_files = set(processed_file_list)
+
+    return [file for file in get_daily_csv_files(filepath, filename) if os.path.basename(file) not in processed_files]
+
+
+def get_daily_csv_file_day(file):
+    """Get the day (YYYY-MM-DD) of a daily csv file from its name (<filename>_YYYY-MM-DD.csv)."""
+
+    return os.path.splitext(os.path.basename(file))[0][-10:]
+
+
+def get_incremental_state_files(path, filename):
+    """Get the files in the parquet store which keep the state of the incremental processing between runs: the names
+    of the daily csv files processed, the last point processed and the statistics of the speed."""
+
+    store_path = get_parquet_store_path(path, filename)
+
+    return (os.path.join(store_path, filename + "_processed_files.txt"),
+            os.path.join(store_path, filename + "_last_point.parquet"),
+            os.path.join(store_path, filename + "_speed_statistics.npz"))
+
+
+def get_incremental_state(path, filename, input_filepath, input_filename):
+    """Get the state of the incremental processing: the list of the names of the daily csv files processed, a dataframe
+    with the last point processed and the StreamingStatistics of the speed. Output ([], None, empty statistics) if
+    nothing has been processed yet. If the parquet store has been written by processing the whole track, without
+    the state, the state is calculated from it (see get_incremental_state_from_parquet_store)."""
+
+    (processed_files_file, last_point_file, speed_statistics_file) = get_incremental_state_files(path, filename)
+
+    if not os.path.isfile(processed_files_file):
+        if len(get_parquet_store_files(path, filename)) > 0:
+            return get_incremental_state_from_parquet_store(path, filename, input_filepath, input_filename)
+
+        return ([], None, StreamingStatistics())
+
+    with open(processed_files_file, 'r') as file:
+        processed_file_list = file.read().split()
+
+    return (processed_file_list, pandas.read_parquet(last_point_file), StreamingStatistics.load(speed_statistics_file))
+
+
+def get_incremental_state_from_parquet_store(path, filename, input_filepath, input_filename):
+    """Calculate the state of the incremental processing (see get_incremental_state) from the parquet store of the
+    whole track: the last point is the last point of the store, the statistics are those of the speed of all of its
+    points, and the daily csv files (<input_filename>_YYYY-MM-DD.csv in the input_filepath) processed are those until
+    the day of the last point."""
+
+    store_file_list = get_parquet_store_files(path, filename)
+    print("Calculating the state of the incremental processing from ", len(store_file_list), " files of the parquet store")
+
+    speed_statistics = StreamingStatistics()
+    for file in store_file_list:
+        speed_statistics.update(pandas.read_parquet(file, columns=['speed'])['speed'].values.astype('float64'))
+
+    # The files are sorted by day, so the last point is in the last file.
+    last_point_df = sort_dataframe_by_time(pandas.read_parquet(store_file_list[-1])).iloc[[-1]].reset_index(drop=True)
+
+    last_day = last_point_df['date_time'].iloc[0].strftime('%Y-%m-%d')
+    processed_file_list = [os.path.basename(file) for file in get_daily_csv_files(input_filepath, input_filename)
+                           if get_daily_csv_file_day(file) <= last_day]
+
+    return (processed_file_list, last_point_df, speed_statistics)
+
+
+def output_incremental_state(path, filename, processed_file_list, last_point_df, speed_statistics):
+    """Write the state of the incremental processing (see get_incremental_state). The list of processed files is written
+    last, so that the state of an interrupted run is not used."""
+
+    (processed_files_file, last_point_file, speed_statistics_file) = get_incremental_state_files(path, filename)
+
+    os.makedirs(get_parquet_store_path(path, filename), exist_ok=True)
+
+    last_point_df.to_parquet(last_point_file, index=False)
+    speed_statistics.save(speed_statistics_file)
+
+    with open(processed_files_file + ".tmp", 'w') as file:
+        file.write("".join(name + "\n" for name in processed_file_list))
+    os.replace(processed_files_file + ".tmp", processed_files_file)
+
+
+# Increase when the processing done in a stage changes, so that the results cached by earlier versions are not used.
+STAGE_CACHE_VERSION = 1
+
+
+def fingerprint_file(filepath, buffer_size=16 * 1024 * 1024):
+    """Calculate the SHA-256 of the content of a file. An empty filepath (no file given) has its own fingerprint."""
+
+    file_hash = hashlib.sha256()
+
+    if filepath == '':
+        return file_hash.hexdigest()
+
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(buffer_size), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def fingerprint_files(file_list, fingerprint_cache_file):
+    """Calculate the fingerprints (see fingerprint_file) of the contents of the files of a list. Output a list of tuples
+    of the name of each file and its fingerprint, which do not change when the files are touched, copied or moved
+    without changing their contents.
+
+    The fingerprints are kept in the fingerprint_cache_file (a csv file) with the path, size and modification time of
+    each file, so that only the files which are new or have been modified since the last run are read again. Only the
+    files of the list are kept in it."""
+
+    known_fingerprints = {}
+    if os.path.isfile(fingerprint_cache_file):
+        with open(fingerprint_cache_file, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                known_fingerprints[(row['filepath'], int(row['size']), int(row['modification_time_ns']))] = row['sha256']
+
+    rows = []
+    fingerprints = []
+    for filepath in file_list:
+        # The status is read before the content, so that a file modified while it is read is read again next time.
+        file_status = os.stat(filepath)
+        key = (os.path.abspath(filepath), file_status.st_size, file_status.st_mtime_ns)
+
+        if key not in known_fingerprints:
+            known_fingerprints[key] = fingerprint_file(filepath)
+
+        rows.append(key + (known_fingerprints[key],))
+        fingerprints.append((os.path.basename(filepath), known_fingerprints[key]))
+
+    os.makedirs(os.path.dirname(os.path.abspath(fingerprint_cache_file)), exist_ok=True)
+    with open(fingerprint_cache_file + ".tmp", 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['filepath', 'size', 'modification_time_ns', 'sha256'])
+        writer.writerows(rows)
+    os.replace(fingerprint_cache_file + ".tmp", fingerprint_cache_file)
+
+    return fingerprints
+
+
+def get_fingerprint_cache_file(cache_path):
+    """Get the csv file which keeps the fingerprints of the input files (see fingerprint_files) in a stage cache."""
+
+    return os.path.join(cache_path, "file_fingerprints.csv")
+
+
+def fingerprint_dataframe(dataframe):
+    """Calculate a fingerprint of the content of a dataframe, including its column names and data types."""
+
+    dataframe_hash = hashlib.sha256(repr(list(dataframe.dtypes.astype(str).items())).encode())
+    dataframe_hash.update(pandas.util.hash_pandas_object(dataframe, index=False).values.tobytes())
+
+    return dataframe_hash.hexdigest()
+
+
+def fingerprint_stage(stage_name, *inputs):
+    """Calculate the fingerprint of a stage of the processing from the fingerprints of its inputs (files or earlier
+    stages) and its parameters. The cached result of the stage can be used only if the fingerprint is the same."""
+
+    stage_hash = hashlib.sha256(repr((STAGE_CACHE_VERSION, stage_name, inputs)).encode())
+
+    return stage_hash.hexdigest()
+
+
+def get_stage_cache_file(cache_path, stage_name, fingerprint):
+    """Get the parquet file of the cached result of a stage with a given fingerprint."""
 
-    latitude = position_df[position_df.date_time == datetime].latitude.item()
-    longitude = position_df[position_df.date_time == datetime].longitude.item()
+    return os.path.join(cache_path, "{}_{}.parquet".format(stage_name, fingerprint))
 
-    location = (datetime, latitude, longitude)
 
-    return location
+def get_stage_cache_files(cache_path, stage_name):
+    """Get the list of the parquet files of the cached results of a stage, whatever their fingerprint."""
+
+    return glob.glob(os.path.join(glob.escape(cache_path), glob.escape(stage_name) + "_" + "[0-9a-f]" * 64 + ".parquet"))
+
+
+def run_cached_stage(cache_path, stage_name, fingerprint, function, *args):
+    """Get the result of a stage of the processing from the cache if it has been calculated with the same fingerprint,
+    otherwise calculate it with function(*args), which returns a dataframe, and store it in the cache as a parquet file,
+    removing the results of the stage with other fingerprints. Output the dataframe and whether it was calculated."""
+
+    cache_file = get_stage_cache_file(cache_path, stage_name, fingerprint)
+
+    if os.path.isfile(cache_file):
+        print("Reading cached stage ", stage_name, ": ", cache_file)
+        return (pandas.read_parquet(cache_file), False)
+
+    print("Calculating stage ", stage_name)
+    dataframe = function(*args)
+
+    # Write to a temporary file first, so that an interrupted run does not leave an incomplete file in the cache.
+    os.makedirs(cache_path, exist_ok=True)
+    dataframe.to_parquet(cache_file + ".tmp", index=False)
+    os.replace(cache_file + ".tmp", cache_file)
+
+    # The results with other fingerprints are out of date, only the last one is kept.
+    for other_cache_file in get_stage_cache_files(cache_path, stage_name):
+        if other_cache_file != cache_file:
+            os.remove(other_cache_file)
+
+    return (dataframe, True)
+
+
+def find_nearest_indexes(sorted_values, values):
+    """Find with a binary search the indexes in sorted_values (sorted and not empty) of the values just before and just
+    after (or at) each of the values, clipped to the array, and of the nearest one (the one before if two are as near).
+    Output a tuple of the three arrays of indexes."""
+
+    insertion = np.searchsorted(sorted_values, values, side='left')
+    after = np.minimum(insertion, len(sorted_values) - 1)
+    before = np.maximum(insertion - 1, 0)
+
+    # Where there is no value after, or the value before is as near, the value before is used.
+    use_before = (insertion == len(sorted_values)) | \
+                 ((insertion > 0) & (values - sorted_values[before] <= sorted_values[after] - values))
+
+    return (before, after, np.where(use_before, before, after))
 
 
 def string_to_datetime(dataframe):
@@ -262,54 +832,117 @@ def set_utc(date_time):
     return date_time
 
 
-def calculate_speed(position_df):
-    """Calculate the speed between consectutive points and add this as a variable to the dataframe."""
+def date_time_to_nanoseconds(date_time_series):
+    """Convert a pandas date_time column into a numpy array of int64 nanoseconds since the epoch (UTC)."""
+
+    return date_time_series.values.astype('datetime64[ns]').view('int64')
 
-    print("Calculating speed of track")
 
-    earliest_date_time = position_df['date_time'].min()
+def calculate_distance_arrays(latitude1, longitude1, latitude2, longitude2):
+    """Calculate the haversine or great-circle distance in metres between two arrays of latitudes and longitudes.
+    The operations are done in the same order as in calculate_distance so the results are the same as the scalar version."""
 
-    current_date = earliest_date_time
+    radius = 6371  # km
+
+    dlat = np.radians(latitude2 - latitude1)
+    dlon = np.radians(longitude2 - longitude1)
+    a = np.sin(dlat / 2) * np.sin(dlat / 2) + np.cos(np.radians(latitude1)) \
+        * np.cos(np.radians(latitude2)) * np.sin(dlon / 2) * np.sin(dlon / 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    d = radius * c  # Distance in km
+    d_m = d * 1000  # Distance in metres
+
+    return d_m
 
-    previous_position = get_location(earliest_date_time, position_df)
-    #print("Previous position: ", previous_position)
-    #datetime_previous, latitude_previous, longitude_previous = previous_position
 
-    # count_speed_errors = 0
+def interpolate_great_circle_arrays(latitude1, longitude1, latitude2, longitude2, fraction):
+    """Interpolate positions along the great circle between two arrays of latitudes and longitudes, at a fraction
+    (0 at the first position, 1 at the second one) of the way. Output the arrays of latitudes and longitudes."""
 
-    line_number = -1
-    for position in position_df.itertuples():
-        line_number += 1
-        row_index = position[0]
+    latitude1 = np.radians(latitude1)
+    longitude1 = np.radians(longitude1)
+    latitude2 = np.radians(latitude2)
+    longitude2 = np.radians(longitude2)
 
-        if line_number == 0:
-            position_df.at[row_index, 'measureland_qualifier_flag_speed'] = 1 # assume good values to begin with
-            continue
+    # Positions as unit vectors, interpolated with spherical linear interpolation.
+    vector1 = np.stack([np.cos(latitude1) * np.cos(longitude1), np.cos(latitude1) * np.sin(longitude1), np.sin(latitude1)])
+    vector2 = np.stack([np.cos(latitude2) * np.cos(longitude2), np.cos(latitude2) * np.sin(longitude2), np.sin(latitude2)])
 
-        current_position = position[2:5]
+    angle = np.arccos(np.clip((vector1 * vector2).sum(axis=0), -1, 1))
+    sin_angle = np.sin(angle)
 
-        # print(current_position)
-        (position_difference_m, speed_knots) = knots_two_points(previous_position, current_position)
-        position_df.at[row_index, 'speed'] = speed_knots
+    # Where the positions are the same (or nearly) the interpolation is linear.
+    same_position = sin_angle < 1e-12
+    sin_angle = np.where(same_position, 1, sin_angle)
+    weight1 = np.where(same_position, 1 - fraction, np.sin((1 - fraction) * angle) / sin_angle)
+    weight2 = np.where(same_position, fraction, np.sin(fraction * angle) / sin_angle)
 
-        #print("calculated speeds")
+    vector = weight1 * vector1 + weight2 * vector2
 
-        position_df.at[row_index, 'distance'] = position_difference_m
+    latitude = np.degrees(np.arctan2(vector[2], np.hypot(vector[0], vector[1])))
+    longitude = np.degrees(np.arctan2(vector[1], vector[0]))
 
-        #print("Checked position difference")
+    return (latitude, longitude)
 
-        previous_position = current_position
 
-    print(position_df.isnull())
+def knots_consecutive_points(date_time_ns, latitude, longitude):
+    """Calculate the distance in metres and the speed in knots between each pair of consecutive points, given arrays of
+    the date_time (int64 nanoseconds), latitude and longitude. The first point has no previous point, so its distance
+    and speed are NaN. Where two consecutive points have the same time, the speed is NaN."""
+
+    distance_m = np.full(len(latitude), np.nan)
+    speed_knots = np.full(len(latitude), np.nan)
+
+    if len(latitude) < 2:
+        return (distance_m, speed_knots)
+
+    distance_m[1:] = calculate_distance_arrays(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:])
+
+    # Same rounding as pandas Timestamp.timestamp(), used by knots_two_points.
+    timestamps = np.round(date_time_ns / 1e9, 6)
+    seconds = np.abs(timestamps[:-1] - timestamps[1:])
+    conversion = 3600 / 1852  # convert 1 ms-1 to knots (nautical miles per hour; 1 nm = 1852 metres)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed_knots[1:] = np.where(seconds > 0, (distance_m[1:] / seconds) * conversion, np.nan)
+
+    return (distance_m, speed_knots)
+
+
+def calculate_speed(position_df):
+    """Calculate the speed between consectutive points and add this as a variable to the dataframe."""
+
+    print("Calculating speed of track")
+
+    date_time_ns = date_time_to_nanoseconds(position_df['date_time'])
+    latitude = position_df['latitude'].values.astype('float64')
+    longitude = position_df['longitude'].values.astype('float64')
+
+    (distance_m, speed_knots) = knots_consecutive_points(date_time_ns, latitude, longitude)
+
+    # The first point is assumed to be good to begin with; the others are flagged in analyse_speed.
+    flag_speed = np.full(len(position_df), np.nan)
+    flag_speed[:1] = 1
+    position_df['measureland_qualifier_flag_speed'] = flag_speed
+
+    position_df['speed'] = speed_knots
+    position_df['distance'] = distance_m
+
+    print("Number of points without a calculated speed: ", np.isnan(speed_knots).sum())
 
     return position_df
 
 
-def analyse_speed(position_df):
-    """Analyse the speed that has been calculated and flag the data points accordingly."""
+def analyse_speed(position_df, upper_bound=None):
+    """Analyse the speed that has been calculated and flag the data points accordingly. If the upper bound of the
+    speed is not given, it is calculated from the speed of the points in the dataframe."""
 
     print("Analysing speed of track")
-    upper_bound = get_stats(position_df, 'speed')
+    if upper_bound is None:
+        speed_statistics = StreamingStatistics()
+        speed_statistics.update(position_df['speed'].values)
+        speed_statistics.print_statistics('speed')
+        upper_bound = speed_statistics.iqr_upper_bound()
     print("Upper bound:", upper_bound)
 
     # no speed value
@@ -328,10 +961,11 @@ def analyse_speed(position_df):
     return position_df
 
 
-def analyse_distance_between_points(position_df):
+def analyse_distance_between_points(position_df, in_port_filepath=''):
     """Analyse the distance between the points. Even when the ship is stationary, the lat and long vary slightly.
     Where there is an error in the lat and long being the same in consecutive points, the distance should be greater
-    than 0 (to 6 dp, which is equivalent to 0.19 cm at the Equator)."""
+    than 0 (to 6 dp, which is equivalent to 0.19 cm at the Equator). The exception is when the ship is in port, during
+    the periods listed in the in_port_filepath file."""
 
     print("Analysing distance between consecutive points.")
 
@@ -349,18 +983,67 @@ def analyse_distance_between_points(position_df):
     print("Flagging bad data distance")
     position_df.loc[abs(position_df['distance']) <= maximum_distance, 'measureland_qualifier_flag_distance'] = 3 # probably bad values
 
-    in_port_periods = get_list_block_time_periods("/home/jen/projects/ace_data_management/wip/cruise_track_data/in_port.csv")
-
-    for in_port_period in in_port_periods:
-        #print("Periods ship was in port: ", in_port_period[0], in_port_period[1])
+    if in_port_filepath != '':
+        in_port_periods = get_list_block_time_periods(in_port_filepath)
+        in_port = date_times_in_time_periods(date_time_to_nanoseconds(position_df['date_time']), in_port_periods, inclusive=False)
 
-        position_df.loc[(abs(position_df['distance']) <= maximum_distance) & (in_port_period[0] < position_df['date_time']) & (position_df['date_time'] < in_port_period[1]), 'measureland_qualifier_flag_distance'] = 1 # good values
+        position_df.loc[(abs(position_df['distance']) <= maximum_distance) & in_port, 'measureland_qualifier_flag_distance'] = 1 # good values
 
     position_df['measureland_qualifier_flag_distance'] = position_df['measureland_qualifier_flag_distance'].astype(int)
 
     return position_df
 
 
+def flag_track_chunk(chunk_df, previous_point_df, initial_speed_knots, upper_bound, invalid_position_filepath, in_port_filepath):
+    """Calculate the speed, distance and acceleration and all of the qualifier flags of a chunk of the track data.
+    previous_point_df is a dataframe with the last point of the previous chunk (None for the first chunk) so that the
+    speed and acceleration of the first point of the chunk are calculated as if the whole track was processed at once.
+    initial_speed_knots is the speed of that previous point. The upper bound of the speed has to be calculated
+    beforehand from the whole track. Output the flagged chunk and the number of acceleration errors."""
+
+    if previous_point_df is None:
+        track_df = chunk_df.reset_index(drop=True)
+    else:
+        track_df = pandas.concat([previous_point_df[chunk_df.columns], chunk_df], ignore_index=True)
+
+    calculate_speed(track_df)
+    analyse_speed(track_df, upper_bound)
+    analyse_distance_between_points(track_df, in_port_filepath)
+    analyse_course(track_df, initial_speed_knots)
+    update_visual_position_flag(track_df, invalid_position_filepath)
+    track_df['measureland_qualifier_flag_overall'] = combine_measureland_qualifier_flags(track_df)
+
+    if previous_point_df is not None:
+        track_df = track_df.iloc[1:].reset_index(drop=True)
+
+    count_acceleration_errors = int((track_df['measureland_qualifier_flag_acceleration'] == 3).sum())
+
+    return (track_df, count_acceleration_errors)
+
+
+def split_track_by_day(track_df, speed_knots):
+    """Split a track in time order into its days (consecutive rows with the same date_time_day) so that the days can be
+    flagged separately with flag_track_chunk. speed_knots is the speed of each point of the whole track. Output a list
+    of (day_df, previous_point_df, initial_speed_knots) with the last point of the previous day and its speed, so the
+    speed and acceleration at midnight are the same as when the whole track is processed at once."""
+
+    day_ns = date_time_to_nanoseconds(track_df['date_time_day'])
+    day_starts = np.concatenate(([0], np.flatnonzero(np.diff(day_ns) != 0) + 1, [len(track_df)]))
+
+    days = []
+    for (start, end) in zip(day_starts[:-1], day_starts[1:]):
+        day_df = track_df.iloc[start:end]
+
+        if start == 0:
+            days.append((day_df, None, 0))
+        else:
+            # The speed before the second point of the track is taken as 0, as the first point has no speed.
+            initial_speed_knots = 0 if start == 1 else speed_knots[start - 1]
+            days.append((day_df, track_df.iloc[[start - 1]], initial_speed_knots))
+
+    return days
+
+
 def calculate_bearing(origin, destination):
     """Calculate the direction turned between two points."""
 
@@ -391,81 +1074,67 @@ def calculate_bearing_difference(current_bearing, previous_bearing):
     return difference
 
 
-def analyse_course(position_df):
-    """Analyse the change in the course between two points regarding the bearing and acceleration - these features need information from previous points."""
+def calculate_acceleration(date_time_ns, speed_knots, initial_speed_knots=0):
+    """Calculate the acceleration in ms-2 between each pair of consecutive points, given arrays of the date_time (int64
+    nanoseconds) and the speed in knots of each point (as calculated by calculate_speed). The first point has no
+    acceleration (NaN) and the speed before the second point is taken as initial_speed_knots. Where the time
+    difference is not positive, the acceleration is 0."""
 
-    print("Analysing course of track")
-    total_data_points = len(position_df)
+    acceleration = np.full(len(speed_knots), np.nan)
 
-    earliest_date_time = position_df['date_time'].min()
-    current_date = earliest_date_time
+    if len(speed_knots) < 2:
+        return acceleration
 
-    previous_position = get_location(earliest_date_time, position_df)
-    datetime_previous, latitude_previous, longitude_previous = previous_position
+    previous_speed_knots = np.empty(len(speed_knots) - 1)
+    previous_speed_knots[0] = initial_speed_knots
+    previous_speed_knots[1:] = speed_knots[1:-1]
 
-    previous_speed_knots = 0
+    time_difference = np.diff(date_time_ns) / 1e9
 
-    count_acceleration_errors = 0
+    speed_difference_metres_per_sec = (speed_knots[1:] - previous_speed_knots) * (1852 / 3600)  # convert knots to ms-1
 
-    line_number = -1
-    for position in position_df.itertuples():
-        line_number += 1
-        row_index = position[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acceleration[1:] = np.where(time_difference > 0, speed_difference_metres_per_sec / time_difference, 0)
 
-        if line_number == 0:
-            #position_df.at[row_index, 'measureland_qualifier_flag_course'] = 1 # assume good value
-            position_df.at[row_index, 'measureland_qualifier_flag_acceleration'] = 1 # assume good value
-            continue
+    return acceleration
 
-        current_position = position[2:5]
 
-        # Calculate acceleration between two points
-        current_conditions = knots_two_points(previous_position, current_position)
-        current_speed_knots = current_conditions[1] # altered to this because distance and speed are output as a tuple from knots_two_points
+def analyse_course(position_df, initial_speed_knots=0):
+    """Analyse the change in the course between two points regarding the acceleration, using the speed that has been
+    calculated with calculate_speed. Flag the data points accordingly and return the number of acceleration errors.
+    The speed before the second point is taken as initial_speed_knots (0 at the beginning of the track)."""
 
-        time_difference = (current_position[0] - previous_position[0]).total_seconds()
+    print("Analysing course of track")
 
-        speed_difference_metres_per_sec = (current_speed_knots - previous_speed_knots) * (1852 / 3600)  # convert knots to ms-1
-        if time_difference > 0:
-            acceleration = speed_difference_metres_per_sec / time_difference
-        else:
-            acceleration = 0
-
-        # Print errors where data do not meet requirements
-        error_message_acceleration = ""
-
-        if acceleration == "N/A":
-            error_message_acceleration = "No acceleration value calculated"
-            position_df.at[row_index, 'measureland_qualifier_flag_acceleration'] = 9 # no value
-        elif acceleration > 1:
-            count_acceleration_errors += 1
-            error_message_acceleration = "** Acceleration too quick **"
-            position_df.at[row_index, 'measureland_qualifier_flag_acceleration'] = 3 # probably bad value
-        elif acceleration <= 1:
-            position_df.at[row_index, 'measureland_qualifier_flag_acceleration'] = 1 # good value
-
-        # if error_message_acceleration != "":
-        #     print("Error:  {} {} ({:.4f}, {:.4f}) acceleration: {} ms-2".format(error_message_acceleration,
-        #                                                                         current_position[0],
-        #                                                                         current_position[1],
-        #                                                                         current_position[2], acceleration))
-
-        previous_position = current_position
-        #previous_bearing = current_bearing
-        previous_speed_knots = current_speed_knots
-
-    #position_df['measureland_qualifier_flag_course'] = position_df['measureland_qualifier_flag_course'].astype(int)
-    position_df['measureland_qualifier_flag_acceleration'] = position_df['measureland_qualifier_flag_acceleration'].astype(int)
+    if 'speed' not in position_df.columns:
+        calculate_speed(position_df)
+
+    date_time_ns = date_time_to_nanoseconds(position_df['date_time'])
+    acceleration = calculate_acceleration(date_time_ns, position_df['speed'].values.astype('float64'), initial_speed_knots)
+
+    flag_acceleration = np.full(len(position_df), 9, dtype='int8') # no value
+    flag_acceleration[acceleration <= 1] = 1 # good value
+    flag_acceleration[acceleration > 1] = 3 # probably bad value
+    flag_acceleration[:1] = 1 # assume good value for the first point
+
+    count_acceleration_errors = int((acceleration > 1).sum())
+
+    position_df['measureland_qualifier_flag_acceleration'] = flag_acceleration.astype(int)
 
     return (count_acceleration_errors)
 
+
 def get_list_block_time_periods(filename_time_periods):
     """Get a file containing start and end times of blocks of times to be applied to the data (such as from visually marked errors, or when the ship is in port) and create a list of these."""
 
     if not hasattr(get_list_block_time_periods, "cached"):
         get_list_block_time_periods.cached = {}
 
-    if filename_time_periods not in get_list_block_time_periods.cached:
+    # The file is read again if it has been modified, so that the stage cache does not use periods which are out of date.
+    file_stat = os.stat(filename_time_periods)
+    cache_key = (filename_time_periods, file_stat.st_mtime_ns, file_stat.st_size)
+
+    if cache_key not in get_list_block_time_periods.cached:
         with open(filename_time_periods, 'r') as file:
             contents = csv.reader(file)
             next(contents)
@@ -478,9 +1147,40 @@ def get_list_block_time_periods(filename_time_periods):
                 time_periods.append((time_beginning, time_ending, row[2]))
         #print("List of time periods: ", time_periods)
 
-        get_list_block_time_periods.cached[filename_time_periods] = time_periods
+        get_list_block_time_periods.cached[cache_key] = time_periods
+
+    return get_list_block_time_periods.cached[cache_key]
+
 
-    return get_list_block_time_periods.cached[filename_time_periods]
+def date_times_in_time_periods(date_time_ns, time_periods, inclusive=True):
+    """Create a boolean array which is True where a date_time (int64 nanoseconds) lies within any of the time periods
+    from get_list_block_time_periods. The periods can overlap. If inclusive is False, the beginning and end of each
+    period are not part of it.
+
+    The periods are sorted by their beginning and, for each one, the latest end of it and the periods before it is
+    kept, so each date_time only needs a binary search in the list of periods."""
+
+    if len(time_periods) == 0:
+        return np.zeros(len(date_time_ns), dtype=bool)
+
+    beginnings = np.array([time_period[0] for time_period in time_periods], dtype='datetime64[ns]').view('int64')
+    endings = np.array([time_period[1] for time_period in time_periods], dtype='datetime64[ns]').view('int64')
+
+    order = np.argsort(beginnings, kind='mergesort')
+    beginnings = beginnings[order]
+    latest_endings = np.maximum.accumulate(endings[order])
+
+    # Index of the last period which begins before (or at, if inclusive) each date_time.
+    side = 'right' if inclusive else 'left'
+    period_index = np.searchsorted(beginnings, date_time_ns, side=side) - 1
+
+    has_begun = period_index >= 0
+    latest_ending = latest_endings[np.maximum(period_index, 0)]
+
+    if inclusive:
+        return has_begun & (date_time_ns <= latest_ending)
+    else:
+        return has_begun & (date_time_ns < latest_ending)
 
 
 def update_visual_position_flag(dataframe, invalid_position_filepath):
@@ -494,13 +1194,9 @@ def update_visual_position_flag(dataframe, invalid_position_filepath):
     else:
         invalid_times = get_list_block_time_periods(invalid_position_filepath)
 
-        # Assume the data point is good unless it has been flagged visually.
-        dataframe['measureland_qualifier_flag_visual'] = 1
-
         # Where the data point is recognised as being bad visually, flag it as probably bad data.
-        for invalid_time in invalid_times:
-            mask = (dataframe['date_time'] >= invalid_time[0]) & (dataframe['date_time'] <= invalid_time[1])
-            dataframe.loc[mask, 'measureland_qualifier_flag_visual'] = 3
+        invalid = date_times_in_time_periods(date_time_to_nanoseconds(dataframe['date_time']), invalid_times)
+        dataframe['measureland_qualifier_flag_visual'] = np.where(invalid, 3, 1)
 
     return dataframe
 
@@ -525,27 +1221,90 @@ def calculate_measureland_qualifier_flag_overall(row):
         return 2 # values that have passed the quality check are likely to be of good quality according to the criteria used, so assign as probably good value
 
 
-def combine_position_dataframes(dataframe1, dataframe2):
+# Columns of the individual qualifier flags which are combined into the overall qualifier flag.
+MEASURELAND_QUALIFIER_FLAG_COLUMNS = ['measureland_qualifier_flag_speed',
+                                      'measureland_qualifier_flag_distance',
+                                      'measureland_qualifier_flag_acceleration',
+                                      'measureland_qualifier_flag_visual']
+
+# Rules to calculate the overall qualifier flag, in order of priority: (overall flag, 'any' or 'all', individual flag).
+# The first rule which applies to a data point gives its overall flag. If none apply, the default overall flag is used.
+MEASURELAND_QUALIFIER_FLAG_OVERALL_RULES = [(3, 'any', 3), # probably bad value
+                                            (1, 'all', 1)] # good value
+
+# Values that have passed the quality check are likely to be of good quality according to the criteria used, so assign
+# as probably good value.
+MEASURELAND_QUALIFIER_FLAG_OVERALL_DEFAULT = 2
+
+
+def combine_measureland_qualifier_flags(dataframe, flag_columns=MEASURELAND_QUALIFIER_FLAG_COLUMNS,
+                                        rules=MEASURELAND_QUALIFIER_FLAG_OVERALL_RULES,
+                                        default_flag=MEASURELAND_QUALIFIER_FLAG_OVERALL_DEFAULT):
+    """Calculate the overall data quality flag of all of the data points from the individual flag columns, following
+    the rules (see MEASURELAND_QUALIFIER_FLAG_OVERALL_RULES). Output a numpy array of int8."""
+
+    flags = np.column_stack([dataframe[flag_column].values for flag_column in flag_columns])
+
+    overall_flag = np.full(len(dataframe), default_flag, dtype='int8')
+
+    # Apply the rules from the lowest to the highest priority so that the first rule that applies is the one kept.
+    for (result_flag, condition, flag) in reversed(rules):
+        if condition == 'any':
+            rows = (flags == flag).any(axis=1)
+        elif condition == 'all':
+            rows = (flags == flag).all(axis=1)
+        else:
+            raise ValueError("Condition of qualifier flag rule should be 'any' or 'all': {}".format(condition))
+
+        overall_flag[rows] = result_flag
+
+    return overall_flag
+
+
+def sort_dataframe_by_time(dataframe, column='date_time'):
+    """Sort a dataframe by time if it is not sorted already. The sort is stable."""
+
+    if dataframe[column].is_monotonic_increasing:
+        return dataframe
+
+    return dataframe.iloc[np.argsort(date_time_to_nanoseconds(dataframe[column]), kind='mergesort')]
+
+
+def merge_sorted_dataframes(dataframes, column='date_time'):
+    """Merge dataframes which are each sorted by time into one dataframe sorted by time. Rows with the same time keep
+    the order of the list of dataframes.
+
+    The dataframes are concatenated and sorted with a merge sort on the int64 times, which only has to merge the sorted
+    runs of each dataframe instead of sorting all the rows again."""
+
+    combined_dataframe = pandas.concat([sort_dataframe_by_time(dataframe, column) for dataframe in dataframes])
+
+    order = np.argsort(date_time_to_nanoseconds(combined_dataframe[column]), kind='mergesort')
+
+    return combined_dataframe.iloc[order]
+
+
+def combine_position_dataframes(dataframe1, dataframe2, *other_dataframes):
     """Bring together the dataframes from different instrument sources to combine the tracks."""
 
-    # check that the dataframes have the same number of columns
-    print("Dimensions of dataframe1: ", dataframe1.shape)
-    print("Dimensions of dataframe2: ", dataframe2.shape)
+    frames = [dataframe1, dataframe2] + list(other_dataframes)
 
-    frames = [dataframe1, dataframe2]
+    # check that the dataframes have the same number of columns
+    for number, frame in enumerate(frames, start=1):
+        print("Dimensions of dataframe{}: ".format(number), frame.shape)
 
-    combined_dataframe = pandas.concat(frames)
+    # Merge the dataframes, which are sorted by date and time, keeping the combined dataframe sorted.
+    combined_dataframe_sorted = merge_sorted_dataframes(frames)
 
-    dataframe1.drop(dataframe1.index, inplace=True) # Delete data from dataframe to save memory
-    dataframe2.drop(dataframe2.index, inplace=True) # Delete data from dataframe to save memory
+    for frame in frames:
+        frame.drop(frame.index, inplace=True) # Delete data from dataframe to save memory
 
     # confirm that the dataframes no longer exist (saving memory)
-    print("Dimensions of dataframe1: ", dataframe1.shape)
-    print("Dimensions of dataframe2: ", dataframe2.shape)
+    for number, frame in enumerate(frames, start=1):
+        print("Dimensions of dataframe{}: ".format(number), frame.shape)
 
-    # check that all rows of both dataframes have been combined into the new dataframe. Sort by date and time.
-    print("Dimensions of combined dataframe: ", combined_dataframe.shape)
-    combined_dataframe_sorted = combined_dataframe.sort_values('date_time')
+    # check that all rows of both dataframes have been combined into the new dataframe.
+    print("Dimensions of combined dataframe: ", combined_dataframe_sorted.shape)
 
     print("Sample of combined dataframe: ", combined_dataframe_sorted.sample(10))
 
@@ -618,80 +1377,138 @@ def convert_float_nan_to_string_NaN(row):
     return result
 
 
+# Columns of the prioritised output, in order.
+PRIORITISED_COLUMNS = ['date_time', 'latitude', 'longitude', 'fix_quality', 'number_satellites', 'horiz_dilution_of_position',
+                       'altitude', 'altitude_units', 'geoid_height', 'geoid_height_units', 'device_id', 'speed',
+                       'measureland_qualifier_flag_overall']
+
+
+def select_prioritised_rows(dataframe):
+    """Select one row for each second from a dataframe sorted by date_time, following the same rules as choose_rows on
+    the rows which occur in the same second (in the same order): the first of the first three rows from the GLONASS
+    (device_id=64) with good data, otherwise the first of the first three rows from the Trimble (device_id=63) with good
+    data, otherwise the row if it is the only one in the second and is probably good data. Output a dataframe of the
+    selected rows, the number of seconds where a row is selected and the number of seconds where no row is selected."""
+
+    number_of_rows = len(dataframe)
+
+    date_time_secs = date_time_to_nanoseconds(dataframe['date_time']) // 10**9
+    device_id = dataframe['device_id'].values
+    flag_overall = dataframe['measureland_qualifier_flag_overall'].values
+
+    # Group the rows which occur in the same second, and find the position of each row in its group.
+    is_first_in_second = np.ones(number_of_rows, dtype=bool)
+    is_first_in_second[1:] = date_time_secs[1:] != date_time_secs[:-1]
+    group_starts = np.flatnonzero(is_first_in_second)
+    group_id = np.cumsum(is_first_in_second) - 1
+    position_in_group = np.arange(number_of_rows) - group_starts[group_id]
+    group_size = np.diff(np.append(group_starts, number_of_rows))[group_id]
+
+    # Priority of each row (lowest is chosen), rows which can not be chosen keep the lowest priority.
+    not_chosen = 3
+    priority = np.full(number_of_rows, not_chosen, dtype='int8')
+    priority[(group_size == 1) & (flag_overall == 2)] = 2
+    priority[(position_in_group < 3) & (device_id == 63) & (flag_overall == 1)] = 1
+    priority[(position_in_group < 3) & (device_id == 64) & (flag_overall == 1)] = 0
+
+    candidates = np.flatnonzero(priority < not_chosen)
+    candidates = candidates[np.lexsort((position_in_group[candidates], priority[candidates], group_id[candidates]))]
+    (selected_groups, first_candidate) = np.unique(group_id[candidates], return_index=True)
+
+    selected_df = dataframe.iloc[np.sort(candidates[first_candidate])]
+
+    selected_count = len(selected_groups)
+    non_selected_count = len(group_starts) - selected_count
+
+    return (selected_df, selected_count, non_selected_count)
+
+
 def prioritise_data_points(dataframe, output_filepath, output_filename):
-    """Create a new dataframe from the prioritised points according to the conditions required. Rows are chosen from small groups which occur at the same time (to seconds)."""
+    """Create a new dataframe from the prioritised points according to the conditions required. Rows are chosen from small groups which occur at the same time (to seconds).
+    The prioritised points are written to a csv file, or a parquet file if the output filename ends with .parquet."""
+
+    prioritised_df = select_prioritised_data_points(dataframe)
+
+    output_prioritised_data_points(prioritised_df, output_filepath, output_filename)
+
+    return prioritised_df
+
+
+def select_prioritised_data_points(dataframe):
+    """Create a new dataframe from the prioritised points (see select_prioritised_rows), with the columns of the prioritised output."""
 
     # Beginning to prioritise data points. Firstly ensure that the data are sorted by date and time.
-    dataframe = dataframe.sort_values(['date_time'])
+    dataframe = dataframe.sort_values(['date_time'], kind='mergesort')
+
+    (selected_df, selected_count, non_selected_count) = select_prioritised_rows(dataframe)
+    prioritised_df = selected_df[PRIORITISED_COLUMNS].reset_index(drop=True)
+
+    print("Number of rows selected: ", selected_count)
+    print("Number of rows where no selection is made: ", non_selected_count)
+
+    return prioritised_df
+
+
+def get_last_prioritised_date_time(output_filepath, output_filename):
+    """Get the date and time of the last point of the prioritised csv file, reading only the end of the file. Output
+    None if the file does not exist or has no points."""
+
+    output_file = output_filepath + output_filename
+
+    if not os.path.isfile(output_file):
+        return None
+
+    with open(output_file, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        file.seek(max(file.tell() - 4096, 0))
+        last_line = file.read().splitlines()[-1].decode()
+
+    last_date_time = last_line.split(',')[0]
+    if last_date_time == PRIORITISED_COLUMNS[0]:
+        return None
+
+    return pandas.Timestamp(last_date_time).tz_localize(None)
+
+
+def append_prioritised_data_points(dataframe, output_filepath, output_filename):
+    """Prioritise the points of new data (see prioritise_data_points) and add them to the end of the prioritised csv
+    file, which is created if it does not exist. The new data must be later than the points already in the file."""
+
+    if output_filename.endswith('.parquet'):
+        raise ValueError("Only the prioritised csv file can be appended to: " + output_filename)
+
+    prioritised_df = select_prioritised_data_points(dataframe)
+
+    last_date_time = get_last_prioritised_date_time(output_filepath, output_filename)
+    if last_date_time is None:
+        output_prioritised_data_points(prioritised_df, output_filepath, output_filename)
+        return prioritised_df
 
-    last_processed_datetime_secs = None
+    if len(prioritised_df) > 0 and prioritised_df['date_time'].iloc[0].floor('s') <= last_date_time.floor('s'):
+        raise ValueError("The new data begin at {}, before the end of the prioritised file, {}".format(prioritised_df['date_time'].iloc[0], last_date_time))
 
-    rows_pending_decision = []
+    output_prioritised_data_points(prioritised_df, output_filepath, output_filename, append=True)
 
-    progress_count = 0
+    return prioritised_df
+
+
+def output_prioritised_data_points(prioritised_df, output_filepath, output_filename, append=False):
+    """Write the prioritised points to a csv file, or a parquet file if the output filename ends with .parquet. If
+    append is True, the points are added to the end of the existing csv file."""
 
-    # open output file
     output_file = output_filepath + output_filename
     print("Output selected rows to ", output_file)
-    f = open(output_file, "a+")
-    if f:
-        print("Output file opened")
-
-    writer = csv.writer(f, delimiter=',')
-    writer.writerow(['date_time','latitude','longitude','fix_quality','number_satellites','horiz_dilution_of_position',
-                     'altitude','altitude_units','geoid_height','geoid_height_units','device_id','speed','measureland_qualifier_flag_overall'])
-
-    selected_count = 0
-    non_selected_count = 0
-
-    for row_id, row in dataframe.iterrows():
-        row_datetime_secs = row['date_time'].strftime('%Y-%m-%d %H:%M:%S')
-
-        progress_count += 1
-
-        # do batches of 1000 rows at a time to avoid overloading memory
-        if progress_count == 1000:
-            print("Prioritising data points. Processing:", row_datetime_secs)
-            progress_count = 0
-
-        if row_datetime_secs != last_processed_datetime_secs and last_processed_datetime_secs is not None:
-            #print("Type:", rows_pending_decision())
-            count_rows = 0
-            length_selection = len(rows_pending_decision)
-            #print("-------------------Rows to choose from--------------: (Total = ", length_selection, ")")
-            selected_row = choose_rows(rows_pending_decision)
-            for item in rows_pending_decision:
-                #print("Counting rows: ", count_rows)
-                #print("Row number: ", count_rows, " \n --Here is the row--\n", rows_pending_decision[count_rows][[1, 2, 3, 14, 15, 16]])
-                #print("Row length: ", len(rows_pending_decision[count_rows]))
-                count_rows += 1
-
-            if selected_row is not None:
-                # write the selected row out to the file rather than appending it to the dataframe
-                # print(type(selected_row))
-
-                convert_float_nan_to_string_NaN(selected_row)
-                # selected_row['date_time'] = selected_row['date_time'].strftime('%Y-%m-%d %H:%M:%S.%f')
-                selected_row['date_time'] = '{}.{}+00:00'.format(selected_row['date_time'].strftime('%Y-%m-%dT%H:%M:%S'), selected_row['date_time'].strftime('%f')[0:2])
-                writer.writerow([*selected_row[1:12], selected_row[14], selected_row[16]])
-                #print("-----selected row: \n", selected_row)
-                #print("-----Selected row: \n", selected_row[[1, 2, 3, 13, 14, 15, 16]])
-                selected_count += 1
-            else:
-                #print("Rows of poor quality data, nothing selected")
-                non_selected_count += 1
-
-            rows_pending_decision = []
-
-        rows_pending_decision.append(row)
-
-        last_processed_datetime_secs = row_datetime_secs
-    f.close()
-    if not f:
-        print("Output file closed")
 
-    print("Number of rows selected: ", selected_count)
-    print("Number of rows where no selection is made: ", non_selected_count)
+    if output_filename.endswith('.parquet'):
+        prioritised_df.to_parquet(output_file, index=False)
+    else:
+        # Date and time in the format YYYY-MM-DDThh:mm:ss.ss+00:00
+        date_time_text = pandas.Series(np.datetime_as_string(prioritised_df['date_time'].values.astype('datetime64[ms]'), unit='ms'))
+        prioritised_csv_df = prioritised_df.assign(date_time=date_time_text.str[:22] + '+00:00')
+        if append:
+            prioritised_csv_df.to_csv(output_file, index=False, na_rep='NaN', mode='a', header=False)
+        else:
+            prioritised_csv_df.to_csv(output_file, index=False, na_rep='NaN')
 
 ####STATS#####
 
@@ -715,34 +1532,155 @@ def create_pivottable_on_flag(dataframe_name, dataframe, flag_name):
     return pivottable
 
 
-def get_stats(dataframe, variable):
-    """Get some standard statistics about a variable within a dataframe."""
+class StreamingStatistics(object):
+    """
+    Statistics of a variable which are updated in one pass over chunks of its values, and which can be merged across
+    chunks or devices: the count, minimum, maximum, mean and variance (Welford's algorithm) of all of the values, and a
+    histogram with fixed bins of the values between lower_limit and upper_limit. The quantiles are estimated from the
+    histogram, so they are within a bin width of the exact ones.
+
+    The default limits are the ones used for the speed: disregard points that are lower than 2.5 (to avoid stationary
+    periods) as part of the interquartile range and greater than 100, which is only a few points anyway.
+    """
+    def __init__(self, lower_limit=2.5, upper_limit=100, bin_width=0.001):
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        self.bin_width = bin_width
+
+        self.count = 0
+        self.mean = 0.0
+        self.sum_squared_differences = 0.0
+        self.minimum = np.nan
+        self.maximum = np.nan
+
+        number_of_bins = int(round((upper_limit - lower_limit) / bin_width))
+        self.histogram = np.zeros(number_of_bins, dtype='int64')
+
+    def update(self, values):
+        """Add the values of a chunk (NaN values are ignored)."""
+
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+
+        if len(values) == 0:
+            return
+
+        chunk_statistics = StreamingStatistics(self.lower_limit, self.upper_limit, self.bin_width)
+        chunk_statistics.count = len(values)
+        chunk_statistics.mean = values.mean()
+        chunk_statistics.sum_squared_differences = ((values - chunk_statistics.mean) ** 2).sum()
+        chunk_statistics.minimum = values.min()
+        chunk_statistics.maximum = values.max()
+
+        values_in_histogram = values[(values >= self.lower_limit) & (values < self.upper_limit)]
+        bins = np.minimum(((values_in_histogram - self.lower_limit) / self.bin_width).astype('int64'), len(self.histogram) - 1)
+        chunk_statistics.histogram = np.bincount(bins, minlength=len(self.histogram))
+
+        self.merge(chunk_statistics)
+
+    def merge(self, other):
+        """Add the statistics of other values, for example from another chunk or device."""
+
+        if (other.lower_limit, other.upper_limit, other.bin_width) != (self.lower_limit, self.upper_limit, self.bin_width):
+            raise ValueError("Statistics with different histogram bins can not be merged")
+
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.mean += delta * other.count / count
+        self.sum_squared_differences += other.sum_squared_differences + delta ** 2 * self.count * other.count / count
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self.count = count
+        self.histogram += other.histogram
+
+    def std(self):
+        """Standard deviation (with one degree of freedom, as pandas) of the values."""
+
+        if self.count < 2:
+            return np.nan
+
+        return math.sqrt(self.sum_squared_differences / (self.count - 1))
+
+    def value_at_rank(self, rank):
+        """Estimate the value of the given rank (from 0) of the sorted values in the histogram, assuming that the values
+        are spread evenly within each bin."""
+
+        cumulative_counts = np.cumsum(self.histogram)
+        bin_number = np.searchsorted(cumulative_counts, rank, side='right')
+        rank_in_bin = rank - (cumulative_counts[bin_number] - self.histogram[bin_number])
+
+        return self.lower_limit + (bin_number + (rank_in_bin + 0.5) / self.histogram[bin_number]) * self.bin_width
+
+    def quantile(self, q):
+        """Estimate the quantile q (between 0 and 1) of the values in the histogram, with linear interpolation as pandas."""
+
+        number_in_histogram = self.histogram.sum()
+
+        if number_in_histogram == 0:
+            return np.nan
+
+        position = (number_in_histogram - 1) * q
+        rank = int(math.floor(position))
+
+        value = self.value_at_rank(rank)
+        if rank + 1 < number_in_histogram:
+            value += (position - rank) * (self.value_at_rank(rank + 1) - value)
+
+        return value
+
+    def iqr_upper_bound(self):
+        """Estimate the upper limit for outliers from the interquartile range of the values in the histogram."""
+
+        q1 = self.quantile(0.25)
+        q3 = self.quantile(0.75)
+
+        return q3 + 1.5 * (q3 - q1)
+
+    def print_statistics(self, variable):
+        """Print the statistics of the variable."""
+
+        q1 = self.quantile(0.25)
+        q3 = self.quantile(0.75)
+
+        print("Maximum value of ", variable, "is: ", self.maximum)
+        print("Minimum value of ", variable, "is: ", self.minimum)
+        print("Mean of ", variable, " is: ", self.mean)
+        print("Standard deviation of ", variable, " is: ", self.std())
+        print("Upper quartile of ", variable, " is: ", q3)
+        print("Lower quartile of ", variable, " is: ", q1)
+        print("Interquartile range of ", variable, " is: ", q3 - q1)
+        print("Upper limit for outliers from IQR for ", variable, " is: ", self.iqr_upper_bound())
+        print("Total number of data points with a value", self.count)
+
+    def save(self, filepath):
+        """Save the statistics to a numpy .npz file, so that they can be updated with more values later (see load)."""
+
+        with open(filepath, 'wb') as file:
+            np.savez(file, limits=np.array([self.lower_limit, self.upper_limit, self.bin_width]), count=self.count,
+                     mean=self.mean, sum_squared_differences=self.sum_squared_differences, minimum=self.minimum,
+                     maximum=self.maximum, histogram=self.histogram)
+
+    @staticmethod
+    def load(filepath):
+        """Load the statistics saved with save."""
+
+        with np.load(filepath) as arrays:
+            (lower_limit, upper_limit, bin_width) = arrays['limits']
+
+            statistics = StreamingStatistics(lower_limit, upper_limit, bin_width)
+            statistics.count = int(arrays['count'])
+            statistics.mean = float(arrays['mean'])
+            statistics.sum_squared_differences = float(arrays['sum_squared_differences'])
+            statistics.minimum = float(arrays['minimum'])
+            statistics.maximum = float(arrays['maximum'])
+            statistics.histogram = arrays['histogram']
+
+        return statistics
 
-    print("Maximum value of ", variable, "is: ", dataframe[variable].max(), " in the row ", dataframe[dataframe[variable] == dataframe[variable].max()])
-    print("Minimum value of ", variable, "is: ", dataframe[variable].min())
-    print("Mean of ", variable, " is: ", dataframe[variable].mean())
-    print("Standard deviation of ", variable, " is: ", dataframe[variable].std())
-    print("Mode of ", variable, " is: ", dataframe[variable].mode())
-    print("Median of ", variable, " is: ", dataframe[variable].median())
-
-    # For speed: disregard points that are lower than 2.5 (to avoid stationary periods) as part of the interquartile range and greater than 100, which is only a few points anyway.
-    dataframeselection = dataframe.loc[(dataframe[variable] >= 2.5) & (dataframe[variable] < 100)]
-    q1 = dataframeselection[variable].quantile(0.25)
-    q3 = dataframeselection[variable].quantile(0.75)
-    iqr = q3 - q1
-    print("Upper quartile of ", variable, " is: ", q3)
-    print("Lower quartile of ", variable, " is: ", q1)
-    print("Interquartile range of ", variable, " is: ", iqr)
-    lower_limit = q1-1.5*iqr
-    upper_limit = q3+1.5*iqr
-    print("Lower limit for outliers from IQR for ", variable, " is: ", lower_limit)
-    print("Upper limit for outliers from IQR for ", variable, " is: ", upper_limit)
-    points_above_upper_limit = len(dataframe.loc[(dataframe[variable] > (q3+1.5*iqr)) & (dataframe[variable] < 100)])
-    number_of_points = len(dataframe)
-    print("Total number of data points", number_of_points)
-    print("There are ", points_above_upper_limit, " points that lie above the upper bound, which corresponds to ", (points_above_upper_limit/number_of_points)*100, " %")
-
-    return upper_limit
 
 def get_minmax_stats(dataframe, variable):
     """Get some standard statistics about a variable within a dataframe."""
@@ -24,6 +24,10 @@ def add_latitude_longitude(input_file_path, output_file_path):
 
     locator = datetime_to_position.DatetimeToPosition()
 
+    # Find the positions of all of the bottles at once.
+    bottle_numbers = sorted(bottles_date_times)
+    bottles_positions = dict(zip(bottle_numbers, locator.positions_for_datetimes(bottles_date_times[bottle_number] for bottle_number in bottle_numbers)))
+
     data_line = 1
     with open(input_file_path, "rb") as f:
         for line in f:
@@ -43,10 +47,10 @@ def add_latitude_longitude(input_file_path, output_file_path):
                     information = get_bottle_firing_times.list_without_empty_values(information)
                     bottle_number = int(information[0])
 
-                    location = locator.datetime_datetime_to_position(bottles_date_times[bottle_number])
+                    location = bottles_positions[bottle_number]
 
                     if location is not None:
-                        latitude_float, longitude_float = locator.datetime_datetime_to_position(bottles_date_times[bottle_number])
+                        latitude_float, longitude_float = location
                         latitude = "{:.5f}".format(latitude_float)
                         longitude = "{:.5f}".format(longitude_float)
                     else:
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas
+
+
+# Data types of the columns of the cruise track data and the motion data. The flags and small counts are int8, the
+# units are categories, the latitudes, longitudes and UTM coordinates are float64 to keep their accuracy and the
+# other measurements are float32 (or float16 for the track data, which have few significant digits). device_id is
+# int8 rather than a category: it uses the same memory and the data of different devices can be combined.
+COLUMN_DATATYPES = {# Track data from the devices
+                    'id': 'int32',
+                    'latitude': 'float64',
+                    'longitude': 'float64',
+                    'fix_quality': 'int8',
+                    'number_satellites': 'int8',
+                    'horiz_dilution_of_position': 'float16',
+                    'altitude': 'float16',
+                    'altitude_units': 'category',
+                    'geoid_height': 'float16',
+                    'geoid_height_units': 'category',
+                    'device_id': 'int8',
+                    'measureland_qualifier_flags_id': 'int8',
+                    # Flagged track data
+                    'measureland_qualifier_flag_speed': 'int8',
+                    'speed': 'float64',
+                    'distance': 'float64',
+                    'measureland_qualifier_flag_distance': 'int8',
+                    'measureland_qualifier_flag_acceleration': 'int8',
+                    'measureland_qualifier_flag_visual': 'int8',
+                    'measureland_qualifier_flag_overall': 'int8',
+                    # Aggregation of the track data
+                    'time_hours': 'int8',
+                    'time_minutes': 'int8',
+                    'time_seconds': 'int8',
+                    # Motion data (see inertial_navigation_file_header.csv)
+                    'heading': 'float32',
+                    'platform_roll': 'float32',
+                    'platform_pitch': 'float32',
+                    'heading_std_dev': 'float32',
+                    'platform_roll_std_dev': 'float32',
+                    'platform_pitch_std_dev': 'float32',
+                    'north_speed_ms-1': 'float32',
+                    'east_speed_ms-1': 'float32',
+                    'vertical_speed_ms-1': 'float32',
+                    'speed_norm_knots': 'float32',
+                    'north_speed_std_dev_ms-1': 'float32',
+                    'east_speed_std_dev_ms-1': 'float32',
+                    'vertical_speed_std_dev_ms-1': 'float32',
+                    'altitude_m': 'float32',
+                    'latitude std dev_m': 'float32',
+                    'longitude std dev_m': 'float32',
+                    'altitude std dev_m': 'float32',
+                    'utm_north_m': 'float64',
+                    'utm_east_m': 'float64',
+                    'utm_altitude_m': 'float32',
+                    'gps_latitude': 'float64',
+                    'gps_longitude': 'float64',
+                    'gps_altitude_m': 'float32',
+                    'manual_gps_latitude': 'float64',
+                    'manual_gps_longitude': 'float64',
+                    'manual_gps_altitude_m': 'float32',
+                    'manual_gps_latitude_std_dev': 'float32',
+                    'manual_gps_longitude_std_dev': 'float32',
+                    'manual_gps_altitude_std_dev_m': 'float32'}
+
+
+def get_datatypes(columns):
+    """Get the data types of the columns in the list which are in COLUMN_DATATYPES, in the order of the list."""
+
+    return {column: COLUMN_DATATYPES[column] for column in columns if column in COLUMN_DATATYPES}
+
+
+# Schemas of the csv files of track data: the data type of each column, the columns with dates and times in ISO 8601
+# format, and whether these have a UTC offset (+00:00). They are used by cruise_track_data_processing_utils.read_track_csv.
+
+# Daily and concatenated csv files of the data of a device.
+TRACK_CSV_SCHEMA = {'datatypes': get_datatypes(['id', 'latitude', 'longitude', 'fix_quality', 'number_satellites',
+                                                'horiz_dilution_of_position', 'altitude', 'altitude_units', 'geoid_height',
+                                                'geoid_height_units', 'device_id', 'measureland_qualifier_flags_id']),
+                    'date_columns': ['date_time', 'date_time_day'],
+                    'utc_offset': False}
+
+# Csv files of the flagged (intermediate) data of a device.
+FLAGGED_TRACK_CSV_SCHEMA = {'datatypes': dict(TRACK_CSV_SCHEMA['datatypes'],
+                                              **get_datatypes(['measureland_qualifier_flag_speed', 'speed', 'distance',
+                                                               'measureland_qualifier_flag_distance',
+                                                               'measureland_qualifier_flag_acceleration',
+                                                               'measureland_qualifier_flag_visual',
+                                                               'measureland_qualifier_flag_overall'])),
+                            'date_columns': ['date_time', 'date_time_day'],
+                            'utc_offset': False}
+
+# Csv files of the prioritised positions, at one second resolution and aggregated to lower resolutions.
+POSITION_CSV_SCHEMA = {'datatypes': get_datatypes(['latitude', 'longitude', 'fix_quality', 'number_satellites',
+                                                   'horiz_dilution_of_position', 'altitude', 'altitude_units', 'geoid_height',
+                                                   'geoid_height_units', 'device_id', 'speed', 'measureland_qualifier_flag_overall']),
+                       'date_columns': ['date_time'],
+                       'utc_offset': True}
+
+# Csv files of dates and times to find the positions of (i.e. the bottle firing times, BTLNBR,date_time).
+DATE_TIME_CSV_SCHEMA = {'datatypes': {},
+                        'date_columns': ['date_time'],
+                        'utc_offset': False}
+
+
+def get_smallest_integer_datatype(minimum, maximum):
+    """Get the smallest integer data type which can hold the values between minimum and maximum (unsigned if minimum
+    is not negative)."""
+
+    for datatype in (['uint8', 'uint16', 'uint32', 'uint64'] if minimum >= 0 else ['int8', 'int16', 'int32', 'int64']):
+        if np.iinfo(datatype).min <= minimum and maximum <= np.iinfo(datatype).max:
+            return datatype
+
+    return 'float64'
+
+
+def get_downcast_datatype(series):
+    """Get the data type to convert a column which is not in COLUMN_DATATYPES to: the smallest integer data type if it
+    has only integer values, without missing values. Other columns keep their data type, so that no precision is lost."""
+
+    if not (pandas.api.types.is_integer_dtype(series.dtype) or pandas.api.types.is_float_dtype(series.dtype)) or len(series) == 0:
+        return series.dtype
+
+    values = series.values
+    minimum = values.min()
+    maximum = values.max()
+
+    # The minimum and maximum are NaN or infinite if any value is.
+    if not (np.isfinite(minimum) and np.isfinite(maximum)):
+        return series.dtype
+
+    if pandas.api.types.is_float_dtype(series.dtype) and not np.array_equal(values, np.trunc(values)):
+        return series.dtype
+
+    return get_smallest_integer_datatype(minimum, maximum)
+
+
+def downcast_dataframe(dataframe, datatypes=None):
+    """Convert each column of the dataframe, in one pass, to its data type in datatypes (COLUMN_DATATYPES if None) or
+    otherwise to the smallest data type which holds its values (see get_downcast_datatype). Missing values are kept
+    and the dataframe is not modified. Output the converted dataframe and a dataframe with the memory used by each column before and after."""
+
+    if datatypes is None:
+        datatypes = COLUMN_DATATYPES
+
+    columns = {}
+    report_rows = []
+
+    for column in dataframe.columns:
+        series = dataframe[column]
+
+        # Columns of numbers can have the object data type, for example after appending to an empty dataframe.
+        inferred = series.infer_objects() if series.dtype == object else series
+        datatype = datatypes[column] if column in datatypes else get_downcast_datatype(inferred)
+
+        converted = inferred.astype(datatype)
+        columns[column] = converted
+
+        bytes_before = series.memory_usage(index=False, deep=True)
+        bytes_after = converted.memory_usage(index=False, deep=True)
+        report_rows.append((column, str(series.dtype), str(converted.dtype), bytes_before, bytes_after, bytes_before - bytes_after))
+
+    converted_dataframe = pandas.DataFrame(columns, index=dataframe.index)
+
+    report = pandas.DataFrame(report_rows, columns=['column', 'datatype_before', 'datatype_after', 'bytes_before', 'bytes_after', 'bytes_saved'])
+    report = report.set_index('column')
+
+    return (converted_dataframe, report)
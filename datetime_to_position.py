@@ -1,36 +1,99 @@
 import argparse
 import sqlite3
 import os
+import shutil
+
+
+# Name and columns of the covering index of the gps table used by the lookups: the positions are read from the index
+# without reading the table.
+POSITION_INDEX_NAME = "gps_date_time_position"
+POSITION_INDEX_COLUMNS = ['date_time', 'latitude', 'longitude']
+
+
+def get_datetime_range(datetime_text):
+    """Get the range of date_time values which start with datetime_text, as used in a query
+    date_time >= start AND date_time < end: the end is datetime_text with its last character incremented."""
+
+    return datetime_text, datetime_text[:-1] + chr(ord(datetime_text[-1]) + 1)
+
+
+def has_position_index(sqlite3_cur):
+    """Check whether the gps table has an index on POSITION_INDEX_COLUMNS (in this order), whatever its name."""
+
+    sqlite3_cur.execute("PRAGMA index_list(gps)")
+    index_names = [row[1] for row in sqlite3_cur.fetchall()]
+
+    for index_name in index_names:
+        sqlite3_cur.execute("PRAGMA index_info('{}')".format(index_name.replace("'", "''")))
+        index_columns = [row[2] for row in sorted(sqlite3_cur.fetchall())]
+
+        if index_columns[:len(POSITION_INDEX_COLUMNS)] == POSITION_INDEX_COLUMNS:
+            return True
+
+    return False
+
+
+def create_position_index(database_path, indexed_database_path):
+    """Copy the database, which is not modified, to indexed_database_path and create the covering index of the gps
+    table in the copy if it does not have one already. The copy can then be used in DATETIME_POSITIONS_SQLITE3_PATH."""
+
+    shutil.copyfile(database_path, indexed_database_path)
+    indexed_conn = sqlite3.connect(indexed_database_path)
+
+    if has_position_index(indexed_conn.cursor()):
+        print("The gps table already has an index on", ", ".join(POSITION_INDEX_COLUMNS))
+    else:
+        print("Creating index", POSITION_INDEX_NAME, "in", indexed_database_path)
+        indexed_conn.execute("CREATE INDEX {} ON gps ({})".format(POSITION_INDEX_NAME, ", ".join(POSITION_INDEX_COLUMNS)))
+        indexed_conn.execute("ANALYZE")
+        indexed_conn.commit()
+
+    indexed_conn.close()
+
+
+def datetime_to_text(date_time):
+    """Get the text in ISO 8601 format YYYY-MM-DDThh:mm:ss used in the lookups from a datetime.datetime, or from a
+    text where the date and time can be separated by a space."""
+
+    if isinstance(date_time, str):
+        return date_time.replace(' ', 'T')
+
+    return date_time.strftime("%Y-%m-%dT%H:%M:%S")
 
 
 class DatetimeToPosition(object):
     """
     Get a position from a corresponding datetime from an SQLite database.
     """
-    def __init__(self):
+    def __init__(self, database_path=None):
         environment_variable = "DATETIME_POSITIONS_SQLITE3_PATH"
-        if environment_variable not in os.environ:
-            print("Define", environment_variable, "environment variable to the file with the positions")
-        database_path = os.environ[environment_variable]
+        if database_path is None:
+            if environment_variable not in os.environ:
+                print("Define", environment_variable, "environment variable to the file with the positions")
+            database_path = os.environ[environment_variable]
 
         uri = "file:{}?mode=ro".format(database_path)
         conn = sqlite3.connect(uri, uri=True)
 
         self.sqlite3_cur = conn.cursor()
 
-        self.sqlite3_cur.execute("PRAGMA case_sensitive_like = 1")
+        if not has_position_index(self.sqlite3_cur):
+            print("The gps table of", database_path, "has no index on", ", ".join(POSITION_INDEX_COLUMNS),
+                  "so each lookup reads the whole table: create an indexed copy with create_position_index")
 
     def datetime_datetime_to_position(self, datetime_datetime):
         """Output datetime in required format."""
 
-        return self.datetime_text_to_position(datetime_datetime.strftime("%Y-%m-%dT%H:%M:%S"))
+        return self.datetime_text_to_position(datetime_to_text(datetime_datetime))
 
     def datetime_text_to_position(self, datetime_text):
-        """Convert datetime text to ISO 8601 format and find corresponding position from SQLite database."""
+        """Convert datetime text to ISO 8601 format and find corresponding position from SQLite database: the first
+        position whose date_time starts with the datetime text (i.e. 2017-01-01T12:03:04.00+00:00 for
+        2017-01-01T12:03:04)."""
 
         datetime_text = datetime_text.replace(' ', 'T')
-        approximation = datetime_text + "%"
-        self.sqlite3_cur.execute('SELECT latitude,longitude FROM gps where date_time like ?', (approximation,))
+        self.sqlite3_cur.execute('SELECT latitude,longitude FROM gps WHERE date_time >= ? AND date_time < ? ORDER BY date_time LIMIT 1',
+                                 get_datetime_range(datetime_text))
 
         result = self.sqlite3_cur.fetchone()
 
@@ -39,11 +102,45 @@ class DatetimeToPosition(object):
 
         return float(result[0]), float(result[1])
 
+    def positions_for_datetimes(self, datetimes):
+        """Find the positions of many datetimes (datetime.datetime or text, see datetime_text_to_position) in one
+        query: the datetimes are sorted in a temporary table which is joined to the gps table. Output a list of the
+        positions in the order of the datetimes, with None for the datetimes without a position."""
+
+        datetime_texts = [datetime_to_text(date_time) for date_time in datetimes]
+
+        requested = sorted((get_datetime_range(datetime_text) + (i,)) for (i, datetime_text) in enumerate(datetime_texts))
+
+        self.sqlite3_cur.execute("DROP TABLE IF EXISTS temp.requested_datetimes")
+        self.sqlite3_cur.execute("CREATE TEMP TABLE requested_datetimes (date_time_start TEXT, date_time_end TEXT, id INTEGER)")
+        self.sqlite3_cur.executemany("INSERT INTO requested_datetimes VALUES (?, ?, ?)", requested)
+
+        self.sqlite3_cur.execute("SELECT requested_datetimes.id, gps.latitude, gps.longitude FROM requested_datetimes "
+                                 "JOIN gps ON gps.date_time = (SELECT MIN(date_time) FROM gps "
+                                 "WHERE date_time >= requested_datetimes.date_time_start AND date_time < requested_datetimes.date_time_end) "
+                                 "ORDER BY requested_datetimes.rowid")
+
+        positions = [None] * len(datetime_texts)
+        for (i, latitude, longitude) in self.sqlite3_cur.fetchall():
+            # If several points have the same date_time, the first one is kept.
+            if positions[i] is None:
+                positions[i] = (float(latitude), float(longitude))
+
+        self.sqlite3_cur.execute("DROP TABLE temp.requested_datetimes")
+
+        return positions
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="Get latitude and longitude from an SQLite database that corresponds to an input datetime in the "
                     "format YYYY-MM-DDThh:m:ss.")
+    parser.add_argument("--create-index", metavar="INDEXED_DATABASE_PATH",
+                        help="Copy the database of DATETIME_POSITIONS_SQLITE3_PATH to this file with an index on "
+                             "date_time, latitude, longitude, for faster lookups")
     args = parser.parse_args()
 
+    if args.create_index is not None:
+        create_position_index(os.environ["DATETIME_POSITIONS_SQLITE3_PATH"], args.create_index)
+
     datetime_to_position = DatetimeToPosition()
@@ -1,77 +1,168 @@
 #!/usr/bin/env python3
 
-import csv
+import numpy as np
 import pandas
 import glob
 import cruise_track_data_processing_utils
+import data_schema
 import aggregate_lower_resolution
+import position_index
 import argparse
 import os
 
 
-def get_position_data(file):
+def read_positions(position_files):
+    """Read the date_time, latitude and longitude of the position files into one dataframe, with the dates and times
+    truncated to the second."""
 
-    date_column_list = [0]
+    columns = ['date_time', 'latitude', 'longitude']
 
-    datatypes = {'latitude': 'float64',
-                 'longitude': 'float64',
-                 'fix_quality': 'int8',
-                 'number_satellites': 'int8',
-                 'horiz_dilution_of_position': 'float16',
-                 'altitude': 'float16',
-                 'altitude_units': 'category',
-                 'geoid_height': 'float16',
-                 'geoid_height_units': 'category',
-                 'device_id': 'int8',
-                 'speed': 'float64',
-                 'measureland_qualifier_flags_overall': 'int8'}
+    position_dfs = []
 
-    # get the data from the csv files
-    position_df = pandas.read_csv(file, dtype=datatypes, date_parser=pandas.to_datetime,
-                                parse_dates=date_column_list)
+    for file in position_files:
+        position_df = cruise_track_data_processing_utils.read_track_csv(file, data_schema.POSITION_CSV_SCHEMA, columns=columns)
+        print("Number of rows in position file: ", len(position_df))
+        position_dfs.append(position_df)
 
-    print("Number of rows in position file: ", len(position_df))
+    res_position_df = pandas.concat(position_dfs, ignore_index=True)
+    res_position_df['date_time'] = res_position_df['date_time'].dt.floor('s')
 
-    return position_df
+    return res_position_df
 
 
-def get_all_positions(lat_lon_filepath, lat_lon_resolution):
+def get_all_positions(lat_lon_filepath, lat_lon_resolution, cache_path=None):
+    """Get the date_time (truncated to the second), latitude and longitude of all of the position files of the
+    resolution. If cache_path is given, the positions are stored there in a parquet file, which is read instead of the
+    csv files as long as none of them has been added, removed or had its content modified. The file is replaced when
+    they change (see cruise_track_data_processing_utils.run_cached_stage)."""
 
     lat_lon_filename = 'ace_cruise_track_1'
     path = os.path.join(lat_lon_filepath, lat_lon_filename)
 
-    all_position_files = glob.glob(path + lat_lon_resolution + "*.csv")
+    all_position_files = sorted(glob.glob(path + lat_lon_resolution + "*.csv"))
 
-    position_dfs = []
+    if cache_path is None:
+        res_position_df = read_positions(all_position_files)
+    else:
+        stage_name = "positions_1" + lat_lon_resolution
+        fingerprint = cruise_track_data_processing_utils.fingerprint_stage(stage_name, cruise_track_data_processing_utils.fingerprint_files(
+            all_position_files, cruise_track_data_processing_utils.get_fingerprint_cache_file(cache_path)))
 
-    for file in all_position_files:
-        position_df = get_position_data(file)
-        position_dfs.append(position_df)
+        (res_position_df, calculated) = cruise_track_data_processing_utils.run_cached_stage(cache_path, stage_name, fingerprint, read_positions,
+                                                                                           all_position_files)
 
-    res_position_df = pandas.concat(position_dfs)
     print(res_position_df.dtypes)
 
     return res_position_df
 
 
-def get_list_dates(filepath):
-    date_column_list = [1]
+def get_position_files_for_dates(lat_lon_filepath, lat_lon_resolution, dates, tolerance):
+    """Get the position files of the resolution (one per month, i.e. ace_cruise_track_1sec_2016-12.csv) which can have
+    positions within tolerance seconds of the dates: those of the months of the dates, and of the next or previous
+    month when a date is within tolerance of the change of month."""
+
+    lat_lon_filename = 'ace_cruise_track_1'
+    path = os.path.join(lat_lon_filepath, lat_lon_filename)
 
-    datatypes = {}
+    dates = pandas.to_datetime(dates)
 
-    dates_df = cruise_track_data_processing_utils.get_data_from_csv_full_path(filepath, datatypes, date_column_list)
+    months = set()
+    for shift in [-tolerance, 0, tolerance]:
+        months.update((dates + pandas.Timedelta(seconds=shift)).dt.strftime('%Y-%m'))
 
-    print("Number of rows in dates file: ", len(dates_df))
+    all_position_files = sorted(glob.glob(path + lat_lon_resolution + "*.csv"))
 
-    return dates_df
+    return [file for file in all_position_files if os.path.splitext(file)[0].split('_')[-1] in months]
+
+
+def get_positions_near_dates(lat_lon_filepath, lat_lon_resolution, dates, tolerance):
+    """Get the date_time, latitude and longitude of the position files which can have positions within tolerance
+    seconds of the dates (see get_position_files_for_dates), sorted by date_time."""
+
+    columns = ['date_time', 'latitude', 'longitude']
+
+    position_dfs = []
+
+    for file in get_position_files_for_dates(lat_lon_filepath, lat_lon_resolution, dates, tolerance):
+        print("Reading positions from: ", file)
+        position_dfs.append(cruise_track_data_processing_utils.read_track_csv(file, data_schema.POSITION_CSV_SCHEMA, columns=columns))
+
+    if len(position_dfs) == 0:
+        return pandas.DataFrame({'date_time': pandas.Series([], dtype='datetime64[ns]'), 'latitude': [], 'longitude': []})
+
+    return cruise_track_data_processing_utils.sort_dataframe_by_time(pandas.concat(position_dfs, ignore_index=True))
+
+
+def get_nearest_positions(dates, position_df, tolerance, interpolate=False):
+    """Get the position of the fix nearest in time to each date (the earlier one if two are as near), if it is within
+    tolerance seconds (see cruise_track_data_processing_utils.find_nearest_indexes). If interpolate is True and there
+    are fixes within tolerance before and after a date, the position is interpolated along the great circle between
+    them. position_df should be sorted by date_time.
+
+    Output a dataframe with the index of dates and the columns latitude, longitude (NaN if there is no fix within
+    tolerance), time_offset (seconds from the date to the nearest fix, negative if the fix is before) and
+    interpolated."""
+
+    dates = pandas.to_datetime(dates)
+    date_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(dates)
+    fix_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(position_df['date_time'])
+    latitude = position_df['latitude'].values.astype('float64')
+    longitude = position_df['longitude'].values.astype('float64')
+
+    nearest_df = pandas.DataFrame({'latitude': np.nan, 'longitude': np.nan, 'time_offset': np.nan, 'interpolated': False},
+                                  index=dates.index)
+
+    if len(fix_ns) == 0:
+        return nearest_df
+
+    (before, after, nearest) = cruise_track_data_processing_utils.find_nearest_indexes(fix_ns, date_ns)
+
+    tolerance_ns = tolerance * aggregate_lower_resolution.NANOSECONDS_PER_SECOND
+    nearest_offset = fix_ns[nearest] - date_ns
+    found = np.abs(nearest_offset) <= tolerance_ns
 
+    nearest_latitude = np.where(found, latitude[nearest], np.nan)
+    nearest_longitude = np.where(found, longitude[nearest], np.nan)
 
-def convert_datetime(date_time):
+    if interpolate:
+        before_offset = date_ns - fix_ns[before]
+        after_offset = fix_ns[after] - date_ns
+        bracketed = (before_offset > 0) & (before_offset <= tolerance_ns) & (after_offset > 0) & (after_offset <= tolerance_ns)
+        gap = (fix_ns[after] - fix_ns[before]).astype('float64')
+        fraction = np.divide(before_offset, gap, out=np.zeros(len(gap)), where=bracketed)
 
-    #pandas.to_datetime(date_time, format='%Y-%m-%d %H:%M:%S')
-    date_time_rounded = date_time.replace(microsecond=0)
+        (interpolated_latitude, interpolated_longitude) = cruise_track_data_processing_utils.interpolate_great_circle_arrays(
+            latitude[before], longitude[before], latitude[after], longitude[after], fraction)
 
-    return date_time_rounded
+        nearest_latitude = np.where(bracketed, interpolated_latitude, nearest_latitude)
+        nearest_longitude = np.where(bracketed, interpolated_longitude, nearest_longitude)
+        nearest_df['interpolated'] = bracketed
+
+    nearest_df['latitude'] = nearest_latitude
+    nearest_df['longitude'] = nearest_longitude
+    nearest_df['time_offset'] = np.where(found, nearest_offset / aggregate_lower_resolution.NANOSECONDS_PER_SECOND, np.nan)
+
+    return nearest_df
+
+
+def get_positions_from_index(dates, index_file, tolerance=0):
+    """Get the positions of the dates from a position index file (see position_index.build_position_index): those of
+    the point at the same second, or of the nearest point within tolerance seconds. Only the parts of the index used
+    are read. Output a dataframe with the index of dates and the columns latitude, longitude and time_offset (see
+    get_nearest_positions), in whole seconds as the index keeps the times of the points to the second."""
+
+    (latitude, longitude, time_offset) = position_index.PositionIndex(index_file).positions_for_datetimes(dates, tolerance)
+
+    return pandas.DataFrame({'latitude': latitude, 'longitude': longitude, 'time_offset': time_offset}, index=dates.index)
+
+
+def get_list_dates(filepath):
+
+    dates_df = cruise_track_data_processing_utils.get_data_from_csv_full_path(filepath, data_schema.DATE_TIME_CSV_SCHEMA)
+
+    print("Number of rows in dates file: ", len(dates_df))
+
+    return dates_df
 
 
 def merge_dfs(df1, df2, column_name):
@@ -81,20 +172,41 @@ def merge_dfs(df1, df2, column_name):
     return df3
 
 
-def process_get_positions(date_time_filepath, lat_lon_filepath, lat_lon_resolution, output_filepath, output_filename):
-
-    input_position_df = get_all_positions(lat_lon_filepath, lat_lon_resolution)
+def process_get_positions(date_time_filepath, lat_lon_filepath, lat_lon_resolution, output_filepath, output_filename, tolerance=None, interpolate=False,
+                          cache_path=None, index_file=None):
+    """Output the positions of the dates and times of a file. If tolerance is None the positions are those at the same
+    second (see get_all_positions for cache_path), otherwise those of the nearest fix within tolerance seconds, or interpolated between the fixes before and
+    after (see get_nearest_positions), with the time offset to the nearest fix. If index_file is given, the positions
+    are read from this position index instead of the position files (see get_positions_from_index)."""
 
     dates_df = get_list_dates(date_time_filepath)
 
-    input_position_df['date_time'] = input_position_df['date_time'].apply(convert_datetime)
-
-    matched_position_df = merge_dfs(dates_df, input_position_df, "date_time")
-    print(matched_position_df.head(10))
-
     # output the selected dataframe to a csv file
     output_columns = ['BTLNBR', 'date_time', 'latitude', 'longitude']
 
+    if index_file is not None:
+        if interpolate:
+            raise ValueError("The positions can not be interpolated from a position index")
+
+        index_position_df = get_positions_from_index(dates_df['date_time'], index_file, 0 if tolerance is None else tolerance)
+
+        matched_position_df = pandas.concat([dates_df, index_position_df], axis=1)
+        if tolerance is not None:
+            output_columns = output_columns + ['time_offset']
+    elif tolerance is None:
+        input_position_df = get_all_positions(lat_lon_filepath, lat_lon_resolution, cache_path)
+
+        matched_position_df = merge_dfs(dates_df, input_position_df, "date_time")
+    else:
+        input_position_df = get_positions_near_dates(lat_lon_filepath, lat_lon_resolution, dates_df['date_time'], tolerance)
+
+        nearest_position_df = get_nearest_positions(dates_df['date_time'], input_position_df, tolerance, interpolate)
+
+        matched_position_df = pandas.concat([dates_df, nearest_position_df], axis=1)
+        output_columns = output_columns + ['time_offset']
+
+    print(matched_position_df.head(10))
+
     aggregate_lower_resolution.output_dataframe_to_csv(matched_position_df, output_columns, output_filepath, output_filename)
 
 
@@ -105,10 +217,16 @@ if __name__ == "__main__":
     parser.add_argument("lat_lon_resolution", type=str, choices=("sec", "min", "hour"), help="Select the resolution of the position data would you like to use.")
     parser.add_argument("output_filepath", help="Filepath to output file")
     parser.add_argument("output_filename", help="Output filename")
+    parser.add_argument("--tolerance", type=float, default=None, help="Use the position of the nearest fix within this number of seconds, instead of the fix at the same second, and output the time offset to it")
+    parser.add_argument("--interpolate", action="store_true", help="With --tolerance, interpolate the position between the fixes before and after")
+    parser.add_argument("--cache-path", default=None, help="Directory of a cache of the positions read from the position files, which is used while they are not modified. By default there is no cache")
+    parser.add_argument("--position-index", default=None, help="Read the positions from this position index file (see position_index.py) instead of the position files")
 
 
     args = parser.parse_args()
 
-    process_get_positions(args.date_time_filepath, args.lat_lon_filepath, args.lat_lon_resolution, args.output_filepath, args.output_filename)
-
+    if args.position_index is not None and args.interpolate:
+        parser.error("--interpolate can not be used with --position-index")
 
+    process_get_positions(args.date_time_filepath, args.lat_lon_filepath, args.lat_lon_resolution, args.output_filepath, args.output_filename,
+                          args.tolerance, args.interpolate, args.cache_path, args.position_index)
@@ -31,9 +31,12 @@ def process_file(input_date_time_filepath, output_filepath):
         next(filereader, None)
         datetime_to_position = DatetimeToPosition()
 
-        for row in filereader:
+        # Find the positions of all of the datetimes of the file at once.
+        rows = list(filereader)
+        positions = datetime_to_position.positions_for_datetimes(row[0] for row in rows)
+
+        for (row, position) in zip(rows, positions):
             print(row[0])
-            position = datetime_to_position.datetime_text_to_position(row[0])
             if position is None:
                 output_file.write("{}, {}, {}\n".format(text_to_datetime(row[0]), None, None))
             else:
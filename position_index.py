@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import argparse
+import numpy as np
+import os
+import pandas
+
+import cruise_track_data_processing_utils
+import data_schema
+
+
+# Format of the position index file: a header of HEADER_SIZE bytes, then the sorted epoch seconds (int64), the latitudes
+# (float64) and the longitudes (float64) of the points, each one as a contiguous array, in little endian.
+HEADER_DATATYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('reserved', '<u4'), ('number_of_points', '<u8')])
+HEADER_SIZE = 64
+MAGIC = b'ACEPOSIX'
+VERSION = 1
+
+
+def build_position_index(track_files, index_file):
+    """Build the position index file from prioritised track csv files (i.e. ace_cruise_track_1sec_2016-12.csv). The
+    dates are truncated to the second and if several points have the same second the first one is kept. The file is
+    written to index_file.tmp and then renamed, so an existing index is never half written. Output the number of
+    points of the index."""
+
+    position_dfs = [cruise_track_data_processing_utils.read_track_csv(track_file, data_schema.POSITION_CSV_SCHEMA,
+                                                                      columns=['date_time', 'latitude', 'longitude'])
+                    for track_file in track_files]
+    position_df = pandas.concat(position_dfs, ignore_index=True)
+
+    seconds = cruise_track_data_processing_utils.date_time_to_nanoseconds(position_df['date_time']) // 10**9
+    order = np.argsort(seconds, kind='mergesort')
+    seconds = seconds[order]
+
+    first_of_second = np.concatenate(([True], seconds[1:] != seconds[:-1]))
+    points = order[first_of_second]
+
+    header = np.zeros(1, dtype=HEADER_DATATYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['number_of_points'] = len(points)
+
+    with open(index_file + '.tmp', 'wb') as file:
+        file.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        file.write(seconds[first_of_second].astype('<i8').tobytes())
+        file.write(position_df['latitude'].values[points].astype('<f8').tobytes())
+        file.write(position_df['longitude'].values[points].astype('<f8').tobytes())
+
+    os.replace(index_file + '.tmp', index_file)
+
+    print("Position index ", index_file, " created with ", len(points), " points")
+
+    return len(points)
+
+
+def datetimes_to_epoch_seconds(datetimes):
+    """Convert datetimes (datetime.datetime, numpy.datetime64, pandas Timestamps or ISO 8601 text, in UTC) to an
+    array of int64 seconds since the epoch, truncated to the second."""
+
+    date_times = pandas.to_datetime(pandas.Series(datetimes))
+
+    return cruise_track_data_processing_utils.date_time_to_nanoseconds(date_times) // 10**9
+
+
+class PositionIndex(object):
+    """
+    Get positions from a position index file (see build_position_index). The arrays are memory mapped, so opening
+    the index does not read them and only the parts used by the lookups are read.
+    """
+    def __init__(self, index_file):
+        header = np.fromfile(index_file, dtype=HEADER_DATATYPE, count=1)
+
+        if len(header) == 0 or header['magic'][0] != MAGIC:
+            raise ValueError("Not a position index file: {}".format(index_file))
+        if header['version'][0] != VERSION:
+            raise ValueError("Position index file version {} not supported: {}".format(header['version'][0], index_file))
+
+        number_of_points = int(header['number_of_points'][0])
+
+        # numpy.memmap cannot map empty arrays.
+        if number_of_points == 0:
+            self.seconds = np.zeros(0, dtype='<i8')
+            self.latitude = np.zeros(0, dtype='<f8')
+            self.longitude = np.zeros(0, dtype='<f8')
+            return
+
+        self.seconds = np.memmap(index_file, dtype='<i8', mode='r', offset=HEADER_SIZE, shape=(number_of_points,))
+        self.latitude = np.memmap(index_file, dtype='<f8', mode='r', offset=HEADER_SIZE + 8 * number_of_points, shape=(number_of_points,))
+        self.longitude = np.memmap(index_file, dtype='<f8', mode='r', offset=HEADER_SIZE + 16 * number_of_points, shape=(number_of_points,))
+
+    def positions_for_datetimes(self, datetimes, tolerance=0):
+        """Find the positions of the datetimes (see datetimes_to_epoch_seconds): those of the point at the same second,
+        or of the nearest point within tolerance seconds (the earlier one if two are as near). Output arrays of the
+        latitudes and longitudes, NaN where there is no point, and of the time offsets in seconds from the datetimes to
+        the points (negative if the point is before)."""
+
+        seconds = datetimes_to_epoch_seconds(datetimes)
+
+        latitude = np.full(len(seconds), np.nan)
+        longitude = np.full(len(seconds), np.nan)
+        time_offset = np.full(len(seconds), np.nan)
+
+        if len(self.seconds) == 0:
+            return (latitude, longitude, time_offset)
+
+        (before, after, nearest) = cruise_track_data_processing_utils.find_nearest_indexes(self.seconds, seconds)
+        nearest_offset = self.seconds[nearest] - seconds
+        found = np.abs(nearest_offset) <= tolerance
+
+        latitude[found] = self.latitude[nearest[found]]
+        longitude[found] = self.longitude[nearest[found]]
+        time_offset[found] = nearest_offset[found]
+
+        return (latitude, longitude, time_offset)
+
+    def datetime_to_position(self, date_time, tolerance=0):
+        """Find the position of one datetime (see positions_for_datetimes). Output (latitude, longitude), or None if
+        there is no point."""
+
+        (latitude, longitude, time_offset) = self.positions_for_datetimes([date_time], tolerance)
+
+        if np.isnan(latitude[0]):
+            return None
+
+        return float(latitude[0]), float(longitude[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a position index file from prioritised cruise track csv files, for fast lookups of positions with PositionIndex.")
+    parser.add_argument("index_file", help="Position index file to create")
+    parser.add_argument("track_files", nargs="+", help="Prioritised cruise track csv files (i.e. ace_cruise_track_1sec_2016-12.csv)")
+
+    args = parser.parse_args()
+
+    build_position_index(args.track_files, args.index_file)
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas
+
+import aggregate_lower_resolution
+import cruise_track_data_processing_utils
+
+
+def create_track(date_times, longitudes, flags):
+    """Create a dataframe of track data with the date and times, longitudes and overall qualifier flags."""
+
+    return pandas.DataFrame({'date_time': pandas.to_datetime(date_times),
+                             'latitude': np.arange(len(date_times), dtype='float64'),
+                             'longitude': longitudes,
+                             'speed': np.full(len(date_times), 10.0),
+                             'measureland_qualifier_flag_overall': np.array(flags, dtype='int8')})
+
+
+class TestResampleTrack(unittest.TestCase):
+    def setUp(self):
+        # The point at 12:01:00 is missing.
+        self.track_df = create_track(['2017-01-01 12:00:00', '2017-01-01 12:00:20', '2017-01-01 12:00:40',
+                                      '2017-01-01 12:01:10', '2017-01-01 12:01:50', '2017-01-01 12:02:00'],
+                                     [10.0, 10.1, 10.2, 179.9, -179.9, 10.5],
+                                     [2, 1, 1, 2, 1, 1])
+
+    def test_first(self):
+        actual = aggregate_lower_resolution.resample_track(self.track_df, 60, 'first')
+
+        self.assertListEqual(actual['date_time'].tolist(), pandas.to_datetime(['2017-01-01 12:00:00', '2017-01-01 12:01:10', '2017-01-01 12:02:00']).tolist())
+
+    def test_nearest(self):
+        """Test the point nearest to each minute is chosen, including for the minute without a point on the minute"""
+
+        actual = aggregate_lower_resolution.resample_track(self.track_df, 60, 'nearest')
+
+        self.assertListEqual(actual['date_time'].tolist(), pandas.to_datetime(['2017-01-01 12:00:00', '2017-01-01 12:01:10', '2017-01-01 12:02:00']).tolist())
+
+    def test_nearest_same_as_points_on_the_minute(self):
+        """Test that for a complete one-second track the points chosen are those on the minute"""
+
+        date_times = pandas.date_range('2017-01-01 11:59:30', periods=600, freq='s')
+        track_df = create_track(date_times, np.zeros(600), np.ones(600))
+
+        actual = aggregate_lower_resolution.resample_track(track_df, 60, 'nearest')
+
+        self.assertListEqual(actual['date_time'].tolist(), pandas.date_range('2017-01-01 12:00:00', periods=10, freq='min').tolist())
+
+    def test_best_quality(self):
+        actual = aggregate_lower_resolution.resample_track(self.track_df, 60, 'best_quality')
+
+        self.assertListEqual(actual['date_time'].tolist(), pandas.to_datetime(['2017-01-01 12:00:20', '2017-01-01 12:01:50', '2017-01-01 12:02:00']).tolist())
+
+    def test_mean(self):
+        """Test the mean position, with a longitude averaged across 180 degrees"""
+
+        actual = aggregate_lower_resolution.resample_track(self.track_df, 60, 'mean')
+
+        self.assertListEqual(actual['date_time'].tolist(), pandas.to_datetime(['2017-01-01 12:00:00', '2017-01-01 12:01:00', '2017-01-01 12:02:00']).tolist())
+        self.assertListEqual(actual['latitude'].tolist(), [1.0, 3.5, 5.0])
+        self.assertAlmostEqual(actual['longitude'][0], 10.1)
+        self.assertAlmostEqual(abs(actual['longitude'][1]), 180.0)
+        self.assertListEqual(actual['measureland_qualifier_flag_overall'].tolist(), [2, 2, 1])
+
+    def test_unsorted_and_other_resolutions(self):
+        track_df = self.track_df.iloc[::-1]
+
+        self.assertEqual(len(aggregate_lower_resolution.resample_track(track_df, 10, 'first')), 6)
+        self.assertEqual(len(aggregate_lower_resolution.resample_track(track_df, 600, 'first')), 1)
+
+        actual = aggregate_lower_resolution.resample_track(track_df, 3600, 'nearest')
+        self.assertListEqual(actual['date_time'].tolist(), [pandas.Timestamp('2017-01-01 12:00:00')])
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            aggregate_lower_resolution.resample_track(self.track_df, 60, 'last')
+
+
+class TestResolutionPyramid(unittest.TestCase):
+    def setUp(self):
+        # Two hours of one-second data, without the point at 12:30:00.
+        date_times = pandas.date_range('2017-01-01 12:00:00', periods=7200, freq='s')
+        self.second_res_df = create_track(date_times, np.linspace(10, 11, 7200), np.ones(7200)).drop(1800).reset_index(drop=True)
+
+    def test_levels_same_as_from_second_resolution(self):
+        levels = [('1min', 60), ('1hour', 3600), ('1day', 86400)]
+
+        for strategy in ['first', 'nearest', 'best_quality']:
+            pyramid = aggregate_lower_resolution.build_resolution_pyramid(self.second_res_df, levels, strategy)
+
+            self.assertListEqual(list(pyramid.keys()), ['1min', '1hour', '1day'])
+            self.assertEqual(len(pyramid['1min']), 120)
+
+            for (level_name, resolution) in levels:
+                expected = aggregate_lower_resolution.resample_track(self.second_res_df, resolution, strategy)
+                pandas.testing.assert_frame_equal(pyramid[level_name], expected)
+
+    def test_resample_track_in_chunks(self):
+        """Test the output is the same as resampling the whole track, with the chunks ending inside the buckets"""
+
+        chunks = [self.second_res_df.iloc[start:start + 700] for start in range(0, len(self.second_res_df), 700)]
+
+        for strategy in aggregate_lower_resolution.RESAMPLING_STRATEGIES:
+            for resolution in [60, 3600]:
+                expected = aggregate_lower_resolution.resample_track(self.second_res_df, resolution, strategy)
+                actual = aggregate_lower_resolution.resample_track_in_chunks(iter(chunks), resolution, strategy)
+
+                pandas.testing.assert_frame_equal(actual, expected)
+
+    def test_resample_track_in_chunks_unsorted(self):
+        chunks = [self.second_res_df.iloc[3600:], self.second_res_df.iloc[:3600]]
+
+        with self.assertRaises(ValueError):
+            aggregate_lower_resolution.resample_track_in_chunks(iter(chunks), 60)
+
+    def test_process_aggregation_plot_without_levels(self):
+        with self.assertRaises(ValueError):
+            aggregate_lower_resolution.process_aggregation("does_not_exist", "2017-01", levels=[('10min', 600)], plot=True)
+
+    def test_process_aggregation(self):
+        """Test the levels are output to csv and parquet files"""
+
+        second_res_df = self.second_res_df.assign(fix_quality=1, number_satellites=8, horiz_dilution_of_position=1.0, altitude=20.0,
+                                                  altitude_units='M', geoid_height=3.0, geoid_height_units='M', device_id=63)
+
+        with tempfile.TemporaryDirectory() as path:
+            cruise_track_data_processing_utils.output_prioritised_data_points(second_res_df[cruise_track_data_processing_utils.PRIORITISED_COLUMNS],
+                                                                              path + "/", "ace_cruise_track_1sec_2017-01.csv")
+
+            actual = aggregate_lower_resolution.process_aggregation(path, "2017-01", plot=False, chunk_size=1000)
+
+            self.assertDictEqual(actual, {'1min': 120, '1hour': 2})
+
+            minute_csv_df = pandas.read_csv(os.path.join(path, "ace_cruise_track_1min_2017-01.csv"))
+            # 12:29:59 and 12:30:01 are as near to 12:30:00, the first one is chosen.
+            self.assertEqual(minute_csv_df['date_time'][30], '2017-01-01T12:29:59+00:00')
+
+            hour_df = pandas.read_parquet(os.path.join(path, "ace_cruise_track_1hour_2017-01.parquet"))
+            self.assertListEqual(hour_df['date_time'].tolist(), pandas.to_datetime(['2017-01-01 12:00:00', '2017-01-01 13:00:00']).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
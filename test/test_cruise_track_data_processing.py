@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas
+
+import cruise_track_data_processing
+import cruise_track_data_processing_utils
+import data_schema
+
+
+def create_daily_track_file(path, filename, device_id, date_times):
+    """Create a daily csv file of track data (<filename>_<day>.csv) of a device with points at the date and times, on
+    a track going south at about 10 knots."""
+
+    number_of_rows = len(date_times)
+    seconds = (date_times - pandas.Timestamp('2017-01-01')).total_seconds().values
+
+    track_df = pandas.DataFrame({'id': np.arange(number_of_rows),
+                                 'date_time': date_times.strftime('%Y-%m-%d %H:%M:%S'),
+                                 'latitude': np.round(-50 - seconds * 4.6e-5 - np.sin(seconds) * 1e-6, 7),
+                                 'longitude': 30 + device_id * 1e-6,
+                                 'fix_quality': 1,
+                                 'number_satellites': 8,
+                                 'horiz_dilution_of_position': 1.0,
+                                 'altitude': 20.0,
+                                 'altitude_units': 'M',
+                                 'geoid_height': 3.0,
+                                 'geoid_height_units': 'M',
+                                 'device_id': device_id,
+                                 'measureland_qualifier_flags_id': 0,
+                                 'date_time_day': date_times.strftime('%Y-%m-%d')})
+
+    track_df.to_csv(os.path.join(path, "{}_{}.csv".format(filename, date_times[0].strftime('%Y-%m-%d'))), index=False)
+
+
+class TestProcessTrackDataWithStageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.cache_path = os.path.join(self.path, 'stage_cache')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def process(self):
+        return cruise_track_data_processing.process_track_data_with_stage_cache('gps', self.path, 'ace_gps', 63, self.path, 'ace_gps', '',
+                                                                                self.path, 'ace_gps_flagging', '', self.cache_path)
+
+    def test_new_daily_file(self):
+        """Test a daily file added after the first run is processed, with the concatenated file created again, and
+        only the stages of the last fingerprints are kept in the cache"""
+
+        create_daily_track_file(self.path, 'ace_gps', 63, pandas.date_range('2017-01-01 23:59:00', periods=60, freq='s'))
+        self.assertEqual(len(self.process()), 60)
+        self.assertEqual(len(self.process()), 60)
+
+        create_daily_track_file(self.path, 'ace_gps', 63, pandas.date_range('2017-01-02 00:00:00', periods=30, freq='s'))
+        track_df = self.process()
+
+        self.assertEqual(len(track_df), 90)
+        self.assertEqual(len(cruise_track_data_processing_utils.read_track_csv(os.path.join(self.path, 'ace_gps_concatenated.csv'),
+                                                                               data_schema.TRACK_CSV_SCHEMA)), 90)
+        self.assertEqual(len(cruise_track_data_processing_utils.get_stage_cache_files(self.cache_path, 'load')), 1)
+        self.assertEqual(len(cruise_track_data_processing_utils.get_stage_cache_files(self.cache_path, 'overall')), 1)
+
+
+class TestCheckProcessingMode(unittest.TestCase):
+    def test_stage_cache_with_chunks_or_day_workers(self):
+        cruise_track_data_processing.check_processing_mode(chunk_size=1000)
+        cruise_track_data_processing.check_processing_mode(cache_path='stage_cache')
+
+        with self.assertRaises(ValueError):
+            cruise_track_data_processing.check_processing_mode(chunk_size=1000, cache_path='stage_cache')
+        with self.assertRaises(ValueError):
+            cruise_track_data_processing.check_processing_mode(day_workers=4, cache_path='stage_cache')
+
+
+class TestProcessNewTrackDataOfDevices(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.devices = cruise_track_data_processing.TRACK_DEVICES
+
+        # The GLONASS has no points during ten minutes.
+        self.daily_date_times = {63: [pandas.date_range('2017-01-01 23:00:00', '2017-01-01 23:59:59', freq='s'),
+                                      pandas.date_range('2017-01-02 00:00:00', '2017-01-02 00:59:59', freq='s'),
+                                      pandas.date_range('2017-01-03 00:00:00', '2017-01-03 00:59:59', freq='s')],
+                                 64: [pandas.date_range('2017-01-01 23:30:00', '2017-01-01 23:59:59', freq='s'),
+                                      pandas.date_range('2017-01-02 00:00:00', '2017-01-02 00:59:59', freq='s').delete(slice(600, 1200)),
+                                      pandas.date_range('2017-01-03 00:00:00', '2017-01-03 00:30:00', freq='s')]}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_track_directory(self, name):
+        path = os.path.join(self.directory.name, name) + "/"
+        os.makedirs(path)
+
+        for device in self.devices:
+            with open(os.path.join(path, device['invalid_position_filename']), 'w') as file:
+                file.write("start_time,end_time,comment\n")
+
+        return path
+
+    def create_daily_files(self, path, days):
+        for device in self.devices:
+            for day in days:
+                create_daily_track_file(path, device['filename'], device['device_id'], self.daily_date_times[device['device_id']][day])
+
+    def process_whole_track(self, path):
+        """Process the whole track of the devices with the stage cache and write the prioritised file, as main does."""
+
+        track_dfs = [cruise_track_data_processing.process_track_data_with_stage_cache(device['dataframe_name'], path, device['filename'], device['device_id'],
+                                                                                     path, device['filename'], os.path.join(path, device['invalid_position_filename']),
+                                                                                     path, device['output_flagging_filename'], '',
+                                                                                     os.path.join(path, 'stage_cache', device['output_flagging_filename']))
+                     for device in self.devices]
+
+        track_df = cruise_track_data_processing_utils.combine_position_dataframes(*track_dfs)
+        cruise_track_data_processing_utils.prioritise_data_points(cruise_track_data_processing_utils.remove_intermediate_columns(track_df),
+                                                                  path, "track_data_prioritised.csv")
+
+    def process_new(self, path):
+        return cruise_track_data_processing.process_new_track_data_of_devices(self.devices, path, '', "track_data_prioritised.csv")
+
+    def read_prioritised(self, path):
+        with open(os.path.join(path, "track_data_prioritised.csv")) as file:
+            return file.read()
+
+    def test_same_as_whole_track(self):
+        """Test the prioritised file is the same when the days are processed one by one, with a device which lags
+        behind, or after the whole track has been processed, as when the whole track is processed at once"""
+
+        whole_track_path = self.create_track_directory("whole_track")
+        self.create_daily_files(whole_track_path, [0, 1, 2])
+        self.process_whole_track(whole_track_path)
+        expected = self.read_prioritised(whole_track_path)
+
+        incremental_path = self.create_track_directory("incremental")
+        self.create_daily_files(incremental_path, [0])
+        self.assertIsNotNone(self.process_new(incremental_path))
+        self.assertIsNone(self.process_new(incremental_path))
+
+        # The days of the Trimble GPS are held back until the GLONASS has them.
+        create_daily_track_file(incremental_path, 'ace_trimble_gps', 63, self.daily_date_times[63][1])
+        create_daily_track_file(incremental_path, 'ace_trimble_gps', 63, self.daily_date_times[63][2])
+        self.assertIsNone(self.process_new(incremental_path))
+
+        create_daily_track_file(incremental_path, 'ace_glonass', 64, self.daily_date_times[64][1])
+        create_daily_track_file(incremental_path, 'ace_glonass', 64, self.daily_date_times[64][2])
+        self.assertIsNotNone(self.process_new(incremental_path))
+
+        self.assertEqual(self.read_prioritised(incremental_path), expected)
+
+        after_whole_track_path = self.create_track_directory("after_whole_track")
+        self.create_daily_files(after_whole_track_path, [0, 1])
+        self.process_whole_track(after_whole_track_path)
+        self.create_daily_files(after_whole_track_path, [2])
+        self.assertIsNotNone(self.process_new(after_whole_track_path))
+
+        self.assertEqual(self.read_prioritised(after_whole_track_path), expected)
+
+    def test_state_not_written_if_prioritisation_fails(self):
+        path = self.create_track_directory("incremental")
+        self.create_daily_files(path, [1])
+        self.process_new(path)
+
+        # The new data are before the end of the prioritised file.
+        self.create_daily_files(path, [0])
+        with self.assertRaises(ValueError):
+            self.process_new(path)
+
+        for device in self.devices:
+            (processed_file_list, last_point_df, speed_statistics) = cruise_track_data_processing_utils.get_incremental_state(path, device['output_flagging_filename'],
+                                                                                                                             path, device['filename'])
+            self.assertEqual(len(processed_file_list), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
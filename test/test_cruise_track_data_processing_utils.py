@@ -0,0 +1,639 @@
+import datetime
+import itertools
+import os
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas
+
+import cruise_track_data_processing_utils
+import data_schema
+
+
+def create_track(date_times, latitudes, longitudes):
+    """Create a dataframe of positions from lists of date and time strings, latitudes and longitudes."""
+
+    return pandas.DataFrame({'id': np.arange(len(date_times)),
+                             'date_time': pandas.to_datetime(date_times),
+                             'latitude': latitudes,
+                             'longitude': longitudes})
+
+
+class TestCalculateSpeed(unittest.TestCase):
+    def setUp(self):
+        random_generator = np.random.RandomState(1)
+        number_of_rows = 1000
+
+        date_times = pandas.Timestamp('2017-01-01') + pandas.to_timedelta(np.arange(number_of_rows) + random_generator.randint(0, 100, number_of_rows) / 100, unit='s')
+
+        self.track_df = create_track(date_times,
+                                     -50 + np.cumsum(random_generator.normal(0, 2e-5, number_of_rows)),
+                                     30 + np.cumsum(random_generator.normal(0, 3e-5, number_of_rows)))
+
+    def test_calculate_speed_same_as_knots_two_points(self):
+        """The vectorised speed and distance are the same as those calculated with the scalar functions."""
+
+        positions = list(self.track_df[['date_time', 'latitude', 'longitude']].itertuples(index=False, name=None))
+        expected = [cruise_track_data_processing_utils.knots_two_points(previous_position, current_position)
+                    for previous_position, current_position in zip(positions[:-1], positions[1:])]
+
+        actual = cruise_track_data_processing_utils.calculate_speed(self.track_df)
+
+        self.assertTrue(np.isnan(actual['speed'].iloc[0]))
+        self.assertTrue(np.isnan(actual['distance'].iloc[0]))
+        self.assertEqual(actual['measureland_qualifier_flag_speed'].iloc[0], 1)
+        self.assertListEqual(list(actual['distance'].iloc[1:]), [distance for distance, speed in expected])
+        self.assertListEqual(list(actual['speed'].iloc[1:]), [speed for distance, speed in expected])
+
+    def test_calculate_speed_same_date_time(self):
+        """Where two consecutive points have the same time, the distance is calculated but the speed is NaN."""
+
+        track_df = create_track(['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:01'],
+                                [-50.0, -50.0001, -50.0002],
+                                [30.0, 30.0, 30.0])
+
+        actual = cruise_track_data_processing_utils.calculate_speed(track_df)
+
+        self.assertFalse(np.isnan(actual['speed'].iloc[1]))
+        self.assertTrue(np.isnan(actual['speed'].iloc[2]))
+        self.assertAlmostEqual(actual['distance'].iloc[2], 11.12, places=2)
+
+
+class TestAnalyseCourse(unittest.TestCase):
+    def test_analyse_course_flags_acceleration(self):
+        """The acceleration is calculated from the speed column and flagged as good (1) or probably bad (3)."""
+
+        track_df = create_track(['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:02', '2017-01-01 00:00:03', '2017-01-01 00:00:04'],
+                                [-50.0, -50.000005, -50.00001, -50.001, -50.001005],
+                                [30.0, 30.0, 30.0, 30.0, 30.0])
+        cruise_track_data_processing_utils.calculate_speed(track_df)
+
+        count_acceleration_errors = cruise_track_data_processing_utils.analyse_course(track_df)
+
+        self.assertEqual(count_acceleration_errors, 1)
+        self.assertListEqual(list(track_df['measureland_qualifier_flag_acceleration']), [1, 1, 1, 3, 1])
+
+    def test_analyse_course_missing_speed(self):
+        """Where the speed is not known after a point, the acceleration is flagged as missing (9)."""
+
+        track_df = create_track(['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:01', '2017-01-01 00:00:02'],
+                                [-50.0, -50.000005, -50.00001, -50.000015],
+                                [30.0, 30.0, 30.0, 30.0])
+        cruise_track_data_processing_utils.calculate_speed(track_df)
+
+        cruise_track_data_processing_utils.analyse_course(track_df)
+
+        self.assertListEqual(list(track_df['measureland_qualifier_flag_acceleration']), [1, 1, 1, 9])
+
+
+class TestTimePeriods(unittest.TestCase):
+    def setUp(self):
+        self.track_df = create_track(['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:02', '2017-01-01 00:00:03',
+                                      '2017-01-01 00:00:04', '2017-01-01 00:00:05', '2017-01-01 00:00:06'],
+                                     [-50.0] * 7,
+                                     [30.0] * 7)
+
+        # Overlapping periods, the second one is contained in the first one.
+        self.time_periods = [(datetime.datetime(2017, 1, 1, 0, 0, 1), datetime.datetime(2017, 1, 1, 0, 0, 4), 'first'),
+                             (datetime.datetime(2017, 1, 1, 0, 0, 2), datetime.datetime(2017, 1, 1, 0, 0, 3), 'second'),
+                             (datetime.datetime(2017, 1, 1, 0, 0, 6), datetime.datetime(2017, 1, 1, 0, 0, 6), 'third')]
+
+    def test_date_times_in_time_periods_inclusive(self):
+        date_time_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(self.track_df['date_time'])
+
+        actual = cruise_track_data_processing_utils.date_times_in_time_periods(date_time_ns, self.time_periods)
+
+        self.assertListEqual(list(actual), [False, True, True, True, True, False, True])
+
+    def test_date_times_in_time_periods_exclusive(self):
+        date_time_ns = cruise_track_data_processing_utils.date_time_to_nanoseconds(self.track_df['date_time'])
+
+        actual = cruise_track_data_processing_utils.date_times_in_time_periods(date_time_ns, self.time_periods, inclusive=False)
+
+        self.assertListEqual(list(actual), [False, False, True, True, False, False, False])
+
+    def test_update_visual_position_flag(self):
+        invalid_position_file = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
+        invalid_position_file.write("start,end,comment\n2017-01-01 00:00:02,2017-01-01 00:00:03,wrong position\n")
+        invalid_position_file.close()
+
+        actual = cruise_track_data_processing_utils.update_visual_position_flag(self.track_df, invalid_position_file.name)
+
+        self.assertListEqual(list(actual['measureland_qualifier_flag_visual']), [1, 1, 3, 3, 1, 1, 1])
+
+        os.unlink(invalid_position_file.name)
+
+
+class TestCombineMeasurelandQualifierFlags(unittest.TestCase):
+    def test_same_as_calculate_measureland_qualifier_flag_overall(self):
+        """All of the combinations of individual flags give the same overall flag as the row by row function."""
+
+        flag_columns = cruise_track_data_processing_utils.MEASURELAND_QUALIFIER_FLAG_COLUMNS
+        flags_df = pandas.DataFrame(list(itertools.product([1, 2, 3, 9], repeat=len(flag_columns))), columns=flag_columns, dtype='int8')
+
+        expected = list(flags_df.apply(cruise_track_data_processing_utils.calculate_measureland_qualifier_flag_overall, axis=1))
+
+        actual = cruise_track_data_processing_utils.combine_measureland_qualifier_flags(flags_df)
+
+        self.assertEqual(actual.dtype, np.int8)
+        self.assertListEqual(list(actual), expected)
+
+    def test_new_flag_column_and_rule(self):
+        flags_df = pandas.DataFrame({'flag_a': [1, 1, 3, 9],
+                                     'flag_b': [1, 4, 1, 1]})
+        rules = [(4, 'any', 4), (3, 'any', 3), (1, 'all', 1)]
+
+        actual = cruise_track_data_processing_utils.combine_measureland_qualifier_flags(flags_df, ['flag_a', 'flag_b'], rules)
+
+        self.assertListEqual(list(actual), [1, 4, 3, 2])
+
+
+class TestPrioritiseDataPoints(unittest.TestCase):
+    def setUp(self):
+        self.track_df = pandas.DataFrame({'date_time': pandas.to_datetime(['2017-01-01 00:00:00.10', '2017-01-01 00:00:00.60',
+                                                                           '2017-01-01 00:00:01.10', '2017-01-01 00:00:01.20', '2017-01-01 00:00:01.30', '2017-01-01 00:00:01.40',
+                                                                           '2017-01-01 00:00:02.00',
+                                                                           '2017-01-01 00:00:03.00', '2017-01-01 00:00:03.50',
+                                                                           '2017-01-01 00:00:04.00']),
+                                          'device_id': [63, 64,
+                                                        63, 63, 64, 64,
+                                                        63,
+                                                        63, 64,
+                                                        64],
+                                          'measureland_qualifier_flag_overall': [1, 1,
+                                                                                 3, 1, 3, 1,
+                                                                                 2,
+                                                                                 2, 2,
+                                                                                 3]})
+
+    def test_select_prioritised_rows_same_as_choose_rows(self):
+        seconds = self.track_df['date_time'].dt.floor('s')
+        expected = []
+        for second in seconds.unique():
+            rows = [row for row_id, row in self.track_df[seconds == second].iterrows()]
+            selected_row = cruise_track_data_processing_utils.choose_rows(rows)
+            if selected_row is not None:
+                expected.append(selected_row.name)
+
+        (selected_df, selected_count, non_selected_count) = cruise_track_data_processing_utils.select_prioritised_rows(self.track_df)
+
+        self.assertListEqual(list(selected_df.index), expected)
+        self.assertListEqual(list(selected_df.index), [1, 3, 6])
+        self.assertEqual(selected_count, 3)
+        self.assertEqual(non_selected_count, 2)
+
+
+class TestAppendPrioritisedDataPoints(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+
+        date_times = pandas.Timestamp('2017-01-01') + pandas.to_timedelta(np.repeat(np.arange(20), 2) + 0.25, unit='s')
+        self.track_df = create_track(date_times, np.linspace(-50, -49, 40), np.linspace(30, 31, 40))
+        for column in cruise_track_data_processing_utils.PRIORITISED_COLUMNS[3:]:
+            self.track_df[column] = 1
+        self.track_df['device_id'] = np.tile([63, 64], 20)
+
+    def test_append_same_as_prioritise_all(self):
+        cruise_track_data_processing_utils.prioritise_data_points(self.track_df, self.path, 'all.csv')
+        cruise_track_data_processing_utils.append_prioritised_data_points(self.track_df.iloc[:24], self.path, 'appended.csv')
+        cruise_track_data_processing_utils.append_prioritised_data_points(self.track_df.iloc[24:], self.path, 'appended.csv')
+
+        with open(self.path + 'all.csv') as expected, open(self.path + 'appended.csv') as actual:
+            self.assertEqual(actual.read(), expected.read())
+
+    def test_append_earlier_data(self):
+        cruise_track_data_processing_utils.append_prioritised_data_points(self.track_df.iloc[24:], self.path, 'appended.csv')
+
+        with self.assertRaises(ValueError):
+            cruise_track_data_processing_utils.append_prioritised_data_points(self.track_df.iloc[:24], self.path, 'appended.csv')
+
+
+class TestParquetStore(unittest.TestCase):
+    def test_output_and_get_data_from_parquet_store(self):
+        track_df = create_track(['2017-01-01 23:59:59', '2017-01-02 00:00:00', '2017-01-01 23:59:59', '2017-01-02 00:00:00'],
+                                [-50.0, -50.1, -50.2, -50.3],
+                                [30.0, 30.1, 30.2, 30.3])
+        track_df['device_id'] = [63, 63, 64, 64]
+        track_df['altitude_units'] = 'M'
+        track_df['date_time_day'] = track_df['date_time'].dt.normalize()
+        datatypes = {'device_id': 'int8', 'altitude_units': 'category', 'id': 'int32'}
+
+        path = tempfile.mkdtemp()
+        cruise_track_data_processing_utils.output_daily_parquet_files(track_df, path, 'flagging_data')
+
+        file_list = cruise_track_data_processing_utils.get_parquet_store_files(path, 'flagging_data')
+        self.assertListEqual([os.path.relpath(file, path) for file in file_list],
+                             ['flagging_data_parquet/device_id=63/flagging_data_2017-01-01.parquet',
+                              'flagging_data_parquet/device_id=63/flagging_data_2017-01-02.parquet',
+                              'flagging_data_parquet/device_id=64/flagging_data_2017-01-01.parquet',
+                              'flagging_data_parquet/device_id=64/flagging_data_2017-01-02.parquet'])
+
+        actual = cruise_track_data_processing_utils.get_data_from_parquet_store(path, 'flagging_data', datatypes,
+                                                                                 columns=['date_time', 'latitude', 'device_id'])
+
+        self.assertListEqual(list(actual.columns), ['date_time', 'latitude', 'device_id'])
+        self.assertEqual(actual['device_id'].dtype, np.int8)
+        self.assertListEqual(list(actual['latitude']), [-50.0, -50.1, -50.2, -50.3])
+
+
+class TestExtractTrackDataFromDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db_connection = sqlite3.connect(':memory:')
+        self.db_connection.execute("CREATE TABLE ship_data_gpggagpsfix (" + ", ".join(cruise_track_data_processing_utils.TRACK_DATABASE_COLUMNS) + ", extra)")
+
+        rows = [(1, '2017-01-01 23:59:59.5', -50.0, 30.0, 1, 8, 1.2, 20.5, 'M', 3.5, 'M', 63, 0, 'x'),
+                (2, '2017-01-01 23:59:59.0', -50.1, 30.1, 1, 8, 1.2, 20.5, 'M', 3.5, 'M', 64, 0, 'x'),
+                (3, '2017-01-01 23:59:58.0', -50.2, 30.2, 1, 8, 1.2, 20.5, 'M', 3.5, 'M', 63, 0, 'x'),
+                (4, '2017-01-02 00:00:00.5', -50.3, 30.3, 1, 8, 1.2, 20.5, 'M', 3.5, 'M', 63, 0, 'x')]
+        self.db_connection.executemany("INSERT INTO ship_data_gpggagpsfix VALUES (" + ", ".join(["?"] * 14) + ")", rows)
+
+        self.path = tempfile.mkdtemp()
+
+    def test_get_concatenated_csv_data_from_database(self):
+        datatypes = {'id': 'int32', 'latitude': 'float64', 'altitude_units': 'category', 'device_id': 'int8'}
+
+        concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(self.path, 'ace_gps', '63', self.path, 'ace_gps', datatypes,
+                                                                                         self.db_connection, chunk_size=2)
+
+        track_df = pandas.read_csv(concatenated_file, parse_dates=[1, 13])
+        self.assertListEqual(list(track_df.columns), cruise_track_data_processing_utils.TRACK_DATABASE_COLUMNS + ['date_time_day'])
+        self.assertListEqual(list(track_df['id']), [3, 1, 4])
+        self.assertListEqual(list(track_df['date_time_day']), list(pandas.to_datetime(['2017-01-01', '2017-01-01', '2017-01-02'])))
+        self.assertListEqual(os.listdir(self.path), ['ace_gps_concatenated.csv'])
+
+    def test_no_data_for_device(self):
+        with self.assertRaises(ValueError):
+            cruise_track_data_processing_utils.get_concatenated_csv_data(self.path, 'ace_gps', 65, self.path, 'ace_gps', db_connection=self.db_connection)
+
+        self.assertFalse(os.path.isfile(os.path.join(self.path, 'ace_gps_concatenated.csv')))
+
+    def test_get_database_connection_parameters(self):
+        environment = {'ACE_DATABASE_OPTION_FILE': os.path.join(self.path, 'missing.cnf'), 'ACE_DATABASE_PASSWORD': 'secret', 'ACE_DATABASE_PORT': '3307'}
+
+        parameters = cruise_track_data_processing_utils.get_database_connection_parameters(environment)
+
+        self.assertDictEqual(parameters, {'host': 'localhost', 'port': 3307, 'db': 'ace2016', 'user': 'ace', 'passwd': 'secret'})
+
+        with self.assertRaises(ValueError):
+            cruise_track_data_processing_utils.get_database_connection_parameters({'ACE_DATABASE_OPTION_FILE': os.path.join(self.path, 'missing.cnf')})
+
+
+class TestReadTrackCsv(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def test_read_track_csv(self):
+        filepath = os.path.join(self.path, 'ace_gps_concatenated.csv')
+        with open(filepath, 'w') as csvfile:
+            csvfile.write("id,date_time,latitude,longitude,fix_quality,number_satellites,horiz_dilution_of_position,altitude,altitude_units,"
+                          "geoid_height,geoid_height_units,device_id,measureland_qualifier_flags_id,date_time_day\n"
+                          "1,2017-01-01 23:59:59.5,-50.1,30.1,1,8,1.2,20.5,M,3.5,M,63,0,2017-01-01\n"
+                          "2,2017-01-02 00:00:00,-50.2,30.2,1,8,1.2,,M,3.5,M,63,0,2017-01-02\n")
+
+        track_df = cruise_track_data_processing_utils.read_track_csv(filepath, data_schema.TRACK_CSV_SCHEMA)
+
+        self.assertListEqual(list(track_df['date_time']), [pandas.Timestamp('2017-01-01 23:59:59.5'), pandas.Timestamp('2017-01-02 00:00:00')])
+        self.assertListEqual(list(track_df['date_time_day']), list(pandas.to_datetime(['2017-01-01', '2017-01-02'])))
+        self.assertEqual(track_df['device_id'].dtype, np.int8)
+        self.assertEqual(track_df['altitude'].dtype, np.float16)
+        self.assertTrue(np.isnan(track_df['altitude'].iloc[1]))
+        self.assertEqual(track_df['altitude_units'].dtype, 'category')
+
+    def test_read_track_csv_in_chunks(self):
+        """Test the chunks are the same as the file read at once, with or without pyarrow, including missing values of
+        float16 columns in a chunk"""
+
+        filepath = os.path.join(self.path, 'ace_gps_concatenated.csv')
+        with open(filepath, 'w') as csvfile:
+            csvfile.write("id,date_time,latitude,longitude,fix_quality,number_satellites,horiz_dilution_of_position,altitude,altitude_units,"
+                          "geoid_height,geoid_height_units,device_id,measureland_qualifier_flags_id,date_time_day\n")
+            for i in range(10):
+                altitude = "" if i in [0, 6] else "20.5"
+                csvfile.write("{},2017-01-01 23:59:{:02d}.5,-50.{},30.{},1,8,1.2,{},M,3.5,M,63,0,2017-01-01\n".format(i, i, i, i, altitude))
+
+        expected = cruise_track_data_processing_utils.read_track_csv(filepath, data_schema.TRACK_CSV_SCHEMA)
+
+        for pyarrow in [cruise_track_data_processing_utils.import_pyarrow_csv(), None]:
+            with unittest.mock.patch('cruise_track_data_processing_utils.import_pyarrow_csv', return_value=pyarrow):
+                chunks = list(cruise_track_data_processing_utils.read_track_csv_in_chunks(filepath, data_schema.TRACK_CSV_SCHEMA, 4))
+
+            self.assertListEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+            self.assertTrue(np.isnan(chunks[1]['altitude'].iloc[2]))
+            pandas.testing.assert_frame_equal(pandas.concat(chunks, ignore_index=True), expected)
+
+    def test_read_track_csv_columns(self):
+        filepath = os.path.join(self.path, 'ace_cruise_track_1sec_2017-01.csv')
+        with open(filepath, 'w') as csvfile:
+            csvfile.write(",".join(cruise_track_data_processing_utils.PRIORITISED_COLUMNS) + "\n"
+                          "2017-01-01T00:00:00.50+00:00,-50.1,30.1,1,8,1.2,20.5,M,3.5,M,63,NaN,1\n")
+
+        position_df = cruise_track_data_processing_utils.read_track_csv(filepath, data_schema.POSITION_CSV_SCHEMA,
+                                                                         columns=['latitude', 'date_time'])
+
+        self.assertListEqual(list(position_df.columns), ['latitude', 'date_time'])
+        self.assertEqual(position_df['date_time'].iloc[0], pandas.Timestamp('2017-01-01 00:00:00.5'))
+
+
+class TestConcatenateCsvFiles(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        with open(os.path.join(self.path, 'ace_gps_2017-01-02.csv'), 'w') as csvfile:
+            csvfile.write("id,date_time,latitude\n3,2017-01-02 00:00:00,-50.3\n4,2017-01-02 00:00:01,-50.4\n")
+        with open(os.path.join(self.path, 'ace_gps_2017-01-01.csv'), 'w') as csvfile:
+            csvfile.write("id,date_time,latitude\n1,2017-01-01 00:00:00,-50.1\n1,2017-01-01 00:00:00\n2,2017-01-01 00:00:01,-50.2")
+
+        self.file_list = cruise_track_data_processing_utils.get_daily_csv_files(self.path, 'ace_gps')
+
+    def test_get_daily_csv_files(self):
+        open(os.path.join(self.path, 'ace_gps_concatenated.csv'), 'w').close()
+
+        file_list = cruise_track_data_processing_utils.get_daily_csv_files(self.path, 'ace_gps')
+
+        self.assertListEqual([os.path.basename(file) for file in file_list], ['ace_gps_2017-01-01.csv', 'ace_gps_2017-01-02.csv'])
+
+    def test_get_concatenated_csv_data_with_manual_position_errors(self):
+        with open(os.path.join(self.path, 'ace_gps_manual_position_errors.csv'), 'w') as csvfile:
+            csvfile.write("start_time,end_time,comment\n2017-01-01 00:00:00,2017-01-01 00:00:01,test\n")
+
+        concatenated_file = cruise_track_data_processing_utils.get_concatenated_csv_data(self.path, 'ace_gps', 63, self.path, 'ace_gps')
+
+        self.assertListEqual(open(concatenated_file).readlines(), ["id,date_time,latitude\n",
+                                                                   "1,2017-01-01 00:00:00,-50.1\n",
+                                                                   "2,2017-01-01 00:00:01,-50.2\n",
+                                                                   "3,2017-01-02 00:00:00,-50.3\n",
+                                                                   "4,2017-01-02 00:00:01,-50.4\n"])
+
+    def test_get_new_daily_csv_files(self):
+        open(os.path.join(self.path, 'ace_gps_manual_position_errors.csv'), 'w').close()
+
+        file_list = cruise_track_data_processing_utils.get_new_daily_csv_files(self.path, 'ace_gps', ['ace_gps_2017-01-01.csv'])
+
+        self.assertListEqual([os.path.basename(file) for file in file_list], ['ace_gps_2017-01-02.csv'])
+
+    def test_concatenate_csv_files_validate(self):
+        output_file = os.path.join(self.path, 'output.csv')
+
+        cruise_track_data_processing_utils.concatenate_csv_files(self.file_list, output_file)
+
+        self.assertListEqual(open(output_file).readlines(), ["id,date_time,latitude\n",
+                                                             "1,2017-01-01 00:00:00,-50.1\n",
+                                                             "2,2017-01-01 00:00:01,-50.2\n",
+                                                             "3,2017-01-02 00:00:00,-50.3\n",
+                                                             "4,2017-01-02 00:00:01,-50.4\n"])
+
+    def test_concatenate_csv_files_copy(self):
+        output_file = os.path.join(self.path, 'output.csv')
+
+        cruise_track_data_processing_utils.concatenate_csv_files(self.file_list, output_file, validate=False)
+
+        self.assertListEqual(open(output_file).readlines(), ["id,date_time,latitude\n",
+                                                             "1,2017-01-01 00:00:00,-50.1\n",
+                                                             "1,2017-01-01 00:00:00\n",
+                                                             "2,2017-01-01 00:00:01,-50.2\n",
+                                                             "3,2017-01-02 00:00:00,-50.3\n",
+                                                             "4,2017-01-02 00:00:01,-50.4\n"])
+
+    def test_read_csv_files_in_chunks(self):
+        schema = {'datatypes': {'id': 'int32'}, 'date_columns': ['date_time'], 'utc_offset': False}
+        chunks = list(cruise_track_data_processing_utils.read_csv_files_in_chunks(self.file_list, schema, chunk_size=3))
+
+        self.assertListEqual([len(chunk) for chunk in chunks], [3, 1])
+        self.assertListEqual(list(pandas.concat(chunks)['id']), [1, 2, 3, 4])
+        self.assertEqual(chunks[0]['date_time'].iloc[0], pandas.Timestamp('2017-01-01 00:00:00'))
+
+
+class TestFlagTrackChunk(unittest.TestCase):
+    def setUp(self):
+        random_generator = np.random.RandomState(8)
+        number_of_rows = 500
+
+        date_times = pandas.Timestamp('2017-01-01') + pandas.to_timedelta(np.arange(number_of_rows), unit='s')
+        latitudes = -50 + np.cumsum(random_generator.normal(0, 3e-5, number_of_rows))
+        latitudes[::37] += 0.001
+
+        self.track_df = create_track(date_times, latitudes, 30 + np.cumsum(random_generator.normal(0, 5e-5, number_of_rows)))
+
+    def test_flag_track_in_chunks_same_as_whole_track(self):
+        upper_bound = 10
+
+        (expected, expected_acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(self.track_df.copy(), None, 0, upper_bound, '', '')
+
+        chunks = []
+        actual_acceleration_errors = 0
+        previous_point_df = None
+        initial_speed_knots = 0
+        for chunk_start in range(0, len(self.track_df), 150):
+            chunk_df = self.track_df.iloc[chunk_start:chunk_start + 150]
+            (flagged_chunk_df, acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(chunk_df, previous_point_df, initial_speed_knots, upper_bound, '', '')
+
+            chunks.append(flagged_chunk_df)
+            actual_acceleration_errors += acceleration_errors
+            previous_point_df = flagged_chunk_df.iloc[[-1]]
+            initial_speed_knots = flagged_chunk_df['speed'].iloc[-1]
+
+        actual = pandas.concat(chunks, ignore_index=True)
+
+        self.assertGreater(expected_acceleration_errors, 0)
+        self.assertEqual(actual_acceleration_errors, expected_acceleration_errors)
+        pandas.testing.assert_frame_equal(actual, expected)
+
+    def test_flag_track_by_day_same_as_whole_track(self):
+        upper_bound = 10
+
+        # The first day has one point, and the third day begins in the middle of the track.
+        date_times = pandas.Timestamp('2016-12-31 23:59:59') + pandas.to_timedelta(np.arange(len(self.track_df)), unit='s')
+        date_times = date_times.where(np.arange(len(self.track_df)) < 300, date_times + pandas.Timedelta('1 day 23:50:00'))
+        self.track_df['date_time'] = date_times
+        self.track_df['date_time_day'] = date_times.normalize()
+
+        (expected, expected_acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(self.track_df.copy(), None, 0, upper_bound, '', '')
+
+        days = cruise_track_data_processing_utils.split_track_by_day(self.track_df, expected['speed'].values)
+
+        flagged_days = []
+        actual_acceleration_errors = 0
+        for (day_df, previous_point_df, initial_speed_knots) in days:
+            (flagged_day_df, acceleration_errors) = cruise_track_data_processing_utils.flag_track_chunk(day_df, previous_point_df, initial_speed_knots, upper_bound, '', '')
+
+            flagged_days.append(flagged_day_df)
+            actual_acceleration_errors += acceleration_errors
+
+        actual = pandas.concat(flagged_days, ignore_index=True)
+
+        self.assertEqual([len(day_df) for (day_df, previous_point_df, initial_speed_knots) in days], [1, 299, 200])
+        self.assertEqual(actual_acceleration_errors, expected_acceleration_errors)
+        pandas.testing.assert_frame_equal(actual, expected)
+
+
+class TestMergeSortedDataframes(unittest.TestCase):
+    def setUp(self):
+        random_generator = np.random.RandomState(9)
+
+        self.dataframes = []
+        for device_id in [63, 64, 65]:
+            date_time_ns = np.sort(random_generator.randint(0, 300, 200)) * 10**9 + pandas.Timestamp('2017-01-01').value
+            self.dataframes.append(pandas.DataFrame({'date_time': pandas.to_datetime(date_time_ns),
+                                                     'device_id': device_id,
+                                                     'row': np.arange(200)}))
+
+        self.expected = pandas.concat(self.dataframes).sort_values(['date_time'], kind='mergesort')
+
+    def test_merge_sorted_dataframes(self):
+        actual = cruise_track_data_processing_utils.merge_sorted_dataframes(self.dataframes)
+
+        pandas.testing.assert_frame_equal(actual, self.expected)
+
+
+class TestFindNearestIndexes(unittest.TestCase):
+    def test_find_nearest_indexes(self):
+        (before, after, nearest) = cruise_track_data_processing_utils.find_nearest_indexes(np.array([10, 20, 30]), np.array([0, 10, 14, 15, 16, 40]))
+
+        self.assertListEqual(before.tolist(), [0, 0, 0, 0, 0, 2])
+        self.assertListEqual(after.tolist(), [0, 0, 1, 1, 1, 2])
+        # 15 is as near to 10 and 20, the one before is used.
+        self.assertListEqual(nearest.tolist(), [0, 0, 0, 0, 1, 2])
+
+
+class TestStreamingStatistics(unittest.TestCase):
+    def setUp(self):
+        random_generator = np.random.RandomState(11)
+        self.speed_df = pandas.DataFrame({'speed': np.concatenate((random_generator.gamma(4, 2.5, 10000), [np.nan, 0.1, 150.0]))})
+
+    def test_statistics_same_as_dataframe(self):
+        speed_statistics = cruise_track_data_processing_utils.StreamingStatistics()
+        speed_statistics.update(self.speed_df['speed'].values)
+
+        self.assertEqual(speed_statistics.count, 10002)
+        self.assertEqual(speed_statistics.maximum, 150.0)
+        self.assertEqual(speed_statistics.minimum, self.speed_df['speed'].min())
+        self.assertAlmostEqual(speed_statistics.mean, self.speed_df['speed'].mean())
+        self.assertAlmostEqual(speed_statistics.std(), self.speed_df['speed'].std())
+
+        # Upper bound for outliers of the speeds from 2.5 to 100, from the exact quartiles.
+        speeds = self.speed_df['speed'].values
+        (q1, q3) = np.percentile(speeds[(speeds >= 2.5) & (speeds < 100)], [25, 75])
+        self.assertAlmostEqual(speed_statistics.iqr_upper_bound(), q3 + 1.5 * (q3 - q1), delta=4 * speed_statistics.bin_width)
+
+    def test_merge_chunks(self):
+        expected = cruise_track_data_processing_utils.StreamingStatistics()
+        expected.update(self.speed_df['speed'].values)
+
+        actual = cruise_track_data_processing_utils.StreamingStatistics()
+        for chunk_start in range(0, len(self.speed_df), 3000):
+            chunk_statistics = cruise_track_data_processing_utils.StreamingStatistics()
+            chunk_statistics.update(self.speed_df['speed'].values[chunk_start:chunk_start + 3000])
+            actual.merge(chunk_statistics)
+
+        self.assertEqual(actual.count, expected.count)
+        self.assertAlmostEqual(actual.mean, expected.mean)
+        self.assertAlmostEqual(actual.std(), expected.std())
+        self.assertEqual(actual.iqr_upper_bound(), expected.iqr_upper_bound())
+
+    def test_save_and_load(self):
+        expected = cruise_track_data_processing_utils.StreamingStatistics()
+        expected.update(self.speed_df['speed'].values)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'speed_statistics.npz')
+            expected.save(filepath)
+            actual = cruise_track_data_processing_utils.StreamingStatistics.load(filepath)
+
+        self.assertEqual(actual.count, expected.count)
+        self.assertEqual(actual.mean, expected.mean)
+        self.assertEqual(actual.std(), expected.std())
+        self.assertEqual(actual.iqr_upper_bound(), expected.iqr_upper_bound())
+
+        # The statistics can be updated after they have been loaded.
+        actual.update([10.0])
+        self.assertEqual(actual.count, expected.count + 1)
+
+
+class TestStageCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.directory.name, 'input.csv')
+        with open(self.input_file, 'w') as file:
+            file.write("date_time,value\n2017-01-01 00:00:00,1\n")
+
+        self.calls = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def stage(self, value):
+        self.calls += 1
+        return pandas.DataFrame({'value': [value]})
+
+    def test_fingerprint_file_changes_with_content(self):
+        fingerprint = cruise_track_data_processing_utils.fingerprint_file(self.input_file)
+
+        self.assertEqual(cruise_track_data_processing_utils.fingerprint_file(self.input_file), fingerprint)
+        self.assertNotEqual(cruise_track_data_processing_utils.fingerprint_file(''), fingerprint)
+
+        with open(self.input_file, 'a') as file:
+            file.write("2017-01-01 00:00:01,2\n")
+
+        self.assertNotEqual(cruise_track_data_processing_utils.fingerprint_file(self.input_file), fingerprint)
+
+    def test_fingerprint_files(self):
+        fingerprint_cache_file = os.path.join(self.directory.name, 'cache', 'file_fingerprints.csv')
+
+        fingerprints = cruise_track_data_processing_utils.fingerprint_files([self.input_file], fingerprint_cache_file)
+        self.assertListEqual(fingerprints, [('input.csv', cruise_track_data_processing_utils.fingerprint_file(self.input_file))])
+
+        # The fingerprint kept for the same modification time is used without reading the file again.
+        with unittest.mock.patch('cruise_track_data_processing_utils.fingerprint_file') as fingerprint_file:
+            self.assertListEqual(cruise_track_data_processing_utils.fingerprint_files([self.input_file], fingerprint_cache_file), fingerprints)
+            fingerprint_file.assert_not_called()
+
+        # Touching or moving the file does not change its fingerprint.
+        os.utime(self.input_file, ns=(0, 0))
+        moved_file = os.path.join(self.directory.name, 'moved', 'input.csv')
+        os.renames(self.input_file, moved_file)
+        self.assertListEqual(cruise_track_data_processing_utils.fingerprint_files([moved_file], fingerprint_cache_file), fingerprints)
+
+        with open(moved_file, 'a') as file:
+            file.write("2017-01-01 00:00:01,2\n")
+
+        self.assertNotEqual(cruise_track_data_processing_utils.fingerprint_files([moved_file], fingerprint_cache_file), fingerprints)
+
+    def test_fingerprint_dataframe(self):
+        dataframe = pandas.DataFrame({'value': [1, 2, 3]})
+
+        fingerprint = cruise_track_data_processing_utils.fingerprint_dataframe(dataframe)
+
+        self.assertEqual(cruise_track_data_processing_utils.fingerprint_dataframe(dataframe.copy()), fingerprint)
+        self.assertNotEqual(cruise_track_data_processing_utils.fingerprint_dataframe(dataframe.astype('float64')), fingerprint)
+        self.assertNotEqual(cruise_track_data_processing_utils.fingerprint_dataframe(dataframe.iloc[::-1]), fingerprint)
+
+    def test_run_cached_stage(self):
+        cache_path = os.path.join(self.directory.name, 'cache')
+        fingerprint = cruise_track_data_processing_utils.fingerprint_stage('test', cruise_track_data_processing_utils.fingerprint_file(self.input_file), 1)
+
+        (first, first_calculated) = cruise_track_data_processing_utils.run_cached_stage(cache_path, 'test', fingerprint, self.stage, 1)
+        (second, second_calculated) = cruise_track_data_processing_utils.run_cached_stage(cache_path, 'test', fingerprint, self.stage, 1)
+
+        self.assertTrue(first_calculated)
+        self.assertFalse(second_calculated)
+        self.assertEqual(self.calls, 1)
+        pandas.testing.assert_frame_equal(second, first)
+
+        # A different parameter gives a different fingerprint, so the stage is calculated again.
+        other_fingerprint = cruise_track_data_processing_utils.fingerprint_stage('test', cruise_track_data_processing_utils.fingerprint_file(self.input_file), 2)
+        (third, third_calculated) = cruise_track_data_processing_utils.run_cached_stage(cache_path, 'test', other_fingerprint, self.stage, 2)
+
+        self.assertTrue(third_calculated)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(third['value'].tolist(), [2])
+
+        # Only the result of the last fingerprint is kept, the results of other stages are not removed.
+        cruise_track_data_processing_utils.run_cached_stage(cache_path, 'test_other', fingerprint, self.stage, 1)
+        self.assertListEqual(sorted(os.listdir(cache_path)), ['test_' + other_fingerprint + '.parquet', 'test_other_' + fingerprint + '.parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+import pandas
+
+import data_schema
+
+
+class TestDowncastDataframe(unittest.TestCase):
+    def test_columns_of_the_schema(self):
+        """Test the columns in COLUMN_DATATYPES are converted to their data type, including float64 for the latitude"""
+
+        dataframe = pandas.DataFrame({'latitude': [-50.123456789, -50.123456799],
+                                      'heading': [359.5, 12.25],
+                                      'measureland_qualifier_flag_overall': [1, 3],
+                                      'altitude_units': ['M', 'M']})
+
+        (actual, report) = data_schema.downcast_dataframe(dataframe)
+
+        self.assertEqual(actual['latitude'].dtype, np.float64)
+        self.assertEqual(actual['heading'].dtype, np.float32)
+        self.assertEqual(actual['measureland_qualifier_flag_overall'].dtype, np.int8)
+        self.assertEqual(actual['altitude_units'].dtype.name, 'category')
+        self.assertListEqual(actual['latitude'].tolist(), [-50.123456789, -50.123456799])
+
+        # The input dataframe is not modified.
+        self.assertEqual(dataframe['measureland_qualifier_flag_overall'].dtype, np.int64)
+
+        self.assertEqual(report.loc['measureland_qualifier_flag_overall', 'datatype_after'], 'int8')
+        self.assertEqual(report.loc['measureland_qualifier_flag_overall', 'bytes_saved'], 14)
+
+    def test_other_columns(self):
+        """Test the columns which are not in COLUMN_DATATYPES are converted to the smallest integer data type only if
+        they have integer values and no missing values"""
+
+        dataframe = pandas.DataFrame({'system_status_1': [0.0, 200.0, 3.0],
+                                      'zone_i': [-1, 20, 100],
+                                      'gps_mode': [1.0, np.nan, 2.0],
+                                      'unknown1': [0.5, 1.0, 2.0],
+                                      'pc_date_utc': ['2017-01-01', '2017-01-01', '2017-01-02']})
+
+        (actual, report) = data_schema.downcast_dataframe(dataframe)
+
+        self.assertEqual(actual['system_status_1'].dtype, np.uint8)
+        self.assertEqual(actual['zone_i'].dtype, np.int8)
+        self.assertEqual(actual['gps_mode'].dtype, np.float64)
+        self.assertTrue(np.isnan(actual['gps_mode'][1]))
+        self.assertEqual(actual['unknown1'].dtype, np.float64)
+        self.assertListEqual(actual['pc_date_utc'].tolist(), ['2017-01-01', '2017-01-01', '2017-01-02'])
+
+        self.assertEqual(report.loc['gps_mode', 'bytes_saved'], 0)
+
+    def test_columns_of_numbers_with_object_data_type(self):
+        """Test the columns of numbers with the object data type, as after appending to an empty dataframe, are converted"""
+
+        dataframe = pandas.DataFrame({'heading': [10.5, 11.5], 'high_level_status': [0.0, 1.0]}, dtype=object)
+
+        (actual, report) = data_schema.downcast_dataframe(dataframe)
+
+        self.assertEqual(actual['heading'].dtype, np.float32)
+        self.assertEqual(actual['high_level_status'].dtype, np.uint8)
+
+
+if __name__ == '__main__':
+    unittest.main()
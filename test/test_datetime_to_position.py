@@ -0,0 +1,87 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import datetime_to_position
+
+
+def create_position_database(database_path, rows):
+    """Create an SQLite database with a gps table of (date_time, latitude, longitude) rows."""
+
+    conn = sqlite3.connect(database_path)
+    conn.execute("CREATE TABLE gps (date_time TEXT, latitude REAL, longitude REAL)")
+    conn.executemany("INSERT INTO gps VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+class TestDatetimeToPosition(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "positions.sqlite3")
+
+        create_position_database(self.database_path, [('2017-01-01T12:03:03.00+00:00', -50.0, 30.0),
+                                                      ('2017-01-01T12:03:04.00+00:00', -50.1, 30.1),
+                                                      ('2017-01-01T12:03:05.00+00:00', -50.2, 30.2),
+                                                      ('2017-01-01T12:04:00.00+00:00', -50.3, 30.3)])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_datetime_range(self):
+        self.assertEqual(datetime_to_position.get_datetime_range('2017-01-01T12:03:09'), ('2017-01-01T12:03:09', '2017-01-01T12:03:0:'))
+
+    def test_create_position_index(self):
+        """Test the index is created in the copy of the database and not in the database"""
+
+        indexed_database_path = os.path.join(self.directory.name, "positions_indexed.sqlite3")
+        datetime_to_position.create_position_index(self.database_path, indexed_database_path)
+
+        self.assertFalse(datetime_to_position.has_position_index(sqlite3.connect(self.database_path).cursor()))
+
+        cursor = sqlite3.connect(indexed_database_path).cursor()
+        self.assertTrue(datetime_to_position.has_position_index(cursor))
+
+        cursor.execute("EXPLAIN QUERY PLAN SELECT latitude,longitude FROM gps WHERE date_time >= ? AND date_time < ? ORDER BY date_time LIMIT 1",
+                       ('2017-01-01T12:03:04', '2017-01-01T12:03:05'))
+        self.assertIn("USING COVERING INDEX", " ".join(str(row[-1]) for row in cursor.fetchall()))
+
+        # Creating it again keeps the index which exists.
+        datetime_to_position.create_position_index(indexed_database_path, os.path.join(self.directory.name, "positions_indexed_2.sqlite3"))
+
+    def test_datetime_text_to_position(self):
+        for database_path in [self.database_path, os.path.join(self.directory.name, "positions_indexed.sqlite3")]:
+            if database_path != self.database_path:
+                datetime_to_position.create_position_index(self.database_path, database_path)
+
+            locator = datetime_to_position.DatetimeToPosition(database_path)
+
+            self.assertEqual(locator.datetime_text_to_position('2017-01-01 12:03:04'), (-50.1, 30.1))
+            self.assertEqual(locator.datetime_text_to_position('2017-01-01T12:04'), (-50.3, 30.3))
+            self.assertIsNone(locator.datetime_text_to_position('2017-01-01T12:03:09'))
+
+    def test_positions_for_datetimes(self):
+        """Test the positions are in the order of the datetimes, with None when there is no position, and are the same
+        as those of datetime_text_to_position"""
+
+        datetimes = ['2017-01-01T12:04', datetime.datetime(2017, 1, 1, 12, 3, 3), '2017-01-01 12:03:09', '2017-01-01T12:03:04', '2017-01-01T12:04']
+
+        for database_path in [self.database_path, os.path.join(self.directory.name, "positions_indexed.sqlite3")]:
+            if database_path != self.database_path:
+                datetime_to_position.create_position_index(self.database_path, database_path)
+
+            locator = datetime_to_position.DatetimeToPosition(database_path)
+
+            actual = locator.positions_for_datetimes(iter(datetimes))
+
+            self.assertListEqual(actual, [(-50.3, 30.3), (-50.0, 30.0), None, (-50.1, 30.1), (-50.3, 30.3)])
+            self.assertListEqual(actual, [locator.datetime_text_to_position(datetime_to_position.datetime_to_text(date_time)) for date_time in datetimes])
+
+            # The temporary table can be created again.
+            self.assertListEqual(locator.positions_for_datetimes([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import glob
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas
+
+import cruise_track_data_processing_utils
+import get_positions
+import position_index
+
+
+class TestGetNearestPositions(unittest.TestCase):
+    def setUp(self):
+        # Fixes every 10 seconds, with a gap from 12:00:20 to 12:01:00.
+        self.position_df = pandas.DataFrame({'date_time': pandas.to_datetime(['2017-01-01 12:00:00', '2017-01-01 12:00:10', '2017-01-01 12:00:20',
+                                                                              '2017-01-01 12:01:00']),
+                                             'latitude': [-50.0, -50.1, -50.2, -50.6],
+                                             'longitude': [179.0, 179.5, 180.0, -179.0]})
+
+        self.dates = pandas.Series(pandas.to_datetime(['2017-01-01 12:00:10', '2017-01-01 12:00:14', '2017-01-01 12:00:15',
+                                                       '2017-01-01 12:00:40', '2017-01-01 11:59:55', '2017-01-01 12:01:04']),
+                                   index=[10, 11, 12, 13, 14, 15])
+
+    def test_nearest(self):
+        actual = get_positions.get_nearest_positions(self.dates, self.position_df, 5)
+
+        self.assertListEqual(actual.index.tolist(), [10, 11, 12, 13, 14, 15])
+        np.testing.assert_array_equal(actual['latitude'].values, [-50.1, -50.1, -50.1, np.nan, -50.0, -50.6])
+        np.testing.assert_array_equal(actual['time_offset'].values, [0, -4, -5, np.nan, 5, -4])
+        self.assertFalse(actual['interpolated'].any())
+
+    def test_interpolate(self):
+        actual = get_positions.get_nearest_positions(self.dates, self.position_df, 20, interpolate=True)
+
+        self.assertListEqual(actual['interpolated'].tolist(), [False, True, True, True, False, False])
+
+        # Exact fix, and half way between two fixes.
+        self.assertEqual(actual['latitude'][10], -50.1)
+        self.assertAlmostEqual(actual['latitude'][12], -50.15, places=3)
+        self.assertAlmostEqual(actual['longitude'][12], 179.75, places=3)
+        self.assertEqual(actual['time_offset'][12], -5)
+
+        # Across 180 degrees of longitude.
+        self.assertAlmostEqual(actual['latitude'][13], -50.4, places=2)
+        self.assertAlmostEqual(abs(actual['longitude'][13]), 179.5, places=2)
+        self.assertEqual(actual['time_offset'][13], -20)
+
+    def test_no_positions(self):
+        actual = get_positions.get_nearest_positions(self.dates, self.position_df.iloc[:0], 5)
+
+        self.assertTrue(actual['latitude'].isnull().all())
+
+
+class TestGetPositionFilesForDates(unittest.TestCase):
+    def test_get_positions_near_dates(self):
+        """Test only the files of the months within tolerance of the dates are read"""
+
+        with tempfile.TemporaryDirectory() as path:
+            for month in ['2016-12', '2017-01', '2017-02']:
+                open(os.path.join(path, 'ace_cruise_track_1min_{}.csv'.format(month)), 'w').close()
+
+            dates = pandas.Series(pandas.to_datetime(['2016-12-31 23:59:50', '2016-12-30 12:00:00']))
+
+            actual = get_positions.get_position_files_for_dates(path, 'min', dates, 5)
+            self.assertListEqual([os.path.basename(file) for file in actual], ['ace_cruise_track_1min_2016-12.csv'])
+
+            actual = get_positions.get_position_files_for_dates(path, 'min', dates, 60)
+            self.assertListEqual([os.path.basename(file) for file in actual], ['ace_cruise_track_1min_2016-12.csv', 'ace_cruise_track_1min_2017-01.csv'])
+
+
+class TestGetAllPositions(unittest.TestCase):
+    def create_position_file(self, filename, date_times):
+        number_of_rows = len(date_times)
+        position_df = pandas.DataFrame({'date_time': date_times, 'latitude': np.linspace(-50, -51, number_of_rows),
+                                        'longitude': np.linspace(30, 31, number_of_rows), 'fix_quality': 1, 'number_satellites': 8,
+                                        'horiz_dilution_of_position': 1.0, 'altitude': 20.0, 'altitude_units': 'M', 'geoid_height': 3.0,
+                                        'geoid_height_units': 'M', 'device_id': 63, 'speed': 10.0, 'measureland_qualifier_flag_overall': 1})
+
+        cruise_track_data_processing_utils.output_prioritised_data_points(position_df[cruise_track_data_processing_utils.PRIORITISED_COLUMNS],
+                                                                          self.path + "/", filename)
+
+    def test_cached_positions(self):
+        """Test the positions are read with only three columns and truncated to the second, and are read from the
+        cache until a position file is modified"""
+
+        with tempfile.TemporaryDirectory() as self.path:
+            cache_path = os.path.join(self.path, "positions_cache")
+
+            self.create_position_file("ace_cruise_track_1sec_2017-01.csv", pandas.date_range('2017-01-01 00:00:00.25', periods=10, freq='s'))
+            self.create_position_file("ace_cruise_track_1sec_2016-12.csv", pandas.date_range('2016-12-31 23:59:50', periods=10, freq='s'))
+
+            expected = get_positions.get_all_positions(self.path, "sec")
+
+            self.assertListEqual(expected.columns.tolist(), ['date_time', 'latitude', 'longitude'])
+            self.assertEqual(expected['date_time'][0], pandas.Timestamp('2016-12-31 23:59:50'))
+            self.assertEqual(expected['date_time'][10], pandas.Timestamp('2017-01-01 00:00:00'))
+
+            actual = get_positions.get_all_positions(self.path, "sec", cache_path)
+            pandas.testing.assert_frame_equal(actual, expected)
+            self.assertEqual(len(cruise_track_data_processing_utils.get_stage_cache_files(cache_path, "positions_1sec")), 1)
+
+            # Read from the cache: the csv files are not read.
+            with unittest.mock.patch('get_positions.read_positions', side_effect=AssertionError("Position files read")):
+                actual = get_positions.get_all_positions(self.path, "sec", cache_path)
+            pandas.testing.assert_frame_equal(actual, expected)
+
+            # A modified file is read again.
+            self.create_position_file("ace_cruise_track_1sec_2017-01.csv", pandas.date_range('2017-01-01 00:00:00', periods=5, freq='s'))
+            os.utime(os.path.join(self.path, "ace_cruise_track_1sec_2017-01.csv"), ns=(0, 10**18))
+
+            actual = get_positions.get_all_positions(self.path, "sec", cache_path)
+            self.assertEqual(len(actual), 15)
+            # The positions cached before the modification are removed.
+            self.assertEqual(len(cruise_track_data_processing_utils.get_stage_cache_files(cache_path, "positions_1sec")), 1)
+
+    def test_positions_from_index(self):
+        """Test the output is the same with the position index as with the position files"""
+
+        with tempfile.TemporaryDirectory() as self.path:
+            self.create_position_file("ace_cruise_track_1sec_2017-01.csv", pandas.date_range('2017-01-01 00:00:00.25', periods=10, freq='s'))
+            self.create_position_file("ace_cruise_track_1sec_2016-12.csv", pandas.date_range('2016-12-31 23:59:50', periods=10, freq='s'))
+
+            index_file = os.path.join(self.path, "positions.idx")
+            position_index.build_position_index(sorted(glob.glob(os.path.join(self.path, "ace_cruise_track_1sec_*.csv"))), index_file)
+
+            date_time_file = os.path.join(self.path, "bottles.csv")
+            with open(date_time_file, 'w') as file:
+                file.write("BTLNBR,date_time\n1,2016-12-31 23:59:55\n2,2017-01-01 00:00:05\n3,2017-01-01 00:00:30\n")
+
+            for tolerance in [None, 60]:
+                get_positions.process_get_positions(date_time_file, self.path, "sec", self.path + "/", "files.csv", tolerance)
+                get_positions.process_get_positions(date_time_file, self.path, "sec", self.path + "/", "index.csv", tolerance, index_file=index_file)
+
+                expected = pandas.read_csv(os.path.join(self.path, "files.csv"))
+                actual = pandas.read_csv(os.path.join(self.path, "index.csv"))
+
+                if tolerance is None:
+                    self.assertTrue(np.isnan(actual['latitude'][2]))
+                    pandas.testing.assert_frame_equal(actual, expected)
+                else:
+                    # The index keeps the times of the points to the second.
+                    pandas.testing.assert_frame_equal(actual.drop(columns='time_offset'), expected.drop(columns='time_offset'))
+                    self.assertListEqual(actual['time_offset'].tolist(), [0, 0, -21])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas
+
+import cruise_track_data_processing_utils
+import position_index
+
+
+def create_position_file(path, filename, date_times, latitudes, longitudes):
+    """Create a prioritised track csv file with the dates and times, latitudes and longitudes."""
+
+    number_of_rows = len(date_times)
+    position_df = pandas.DataFrame({'date_time': [pandas.Timestamp(date_time) for date_time in date_times], 'latitude': latitudes, 'longitude': longitudes,
+                                    'fix_quality': 1, 'number_satellites': 8, 'horiz_dilution_of_position': 1.0, 'altitude': 20.0,
+                                    'altitude_units': 'M', 'geoid_height': 3.0, 'geoid_height_units': 'M', 'device_id': 63,
+                                    'speed': 10.0, 'measureland_qualifier_flag_overall': np.ones(number_of_rows, dtype='int8')})
+
+    cruise_track_data_processing_utils.output_prioritised_data_points(position_df[cruise_track_data_processing_utils.PRIORITISED_COLUMNS],
+                                                                      path + "/", filename)
+
+    return os.path.join(path, filename)
+
+
+class TestPositionIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_file = os.path.join(self.directory.name, "positions.idx")
+
+        # Two monthly files, given in the wrong order, with two points in the same second.
+        track_files = [create_position_file(self.directory.name, "ace_cruise_track_1sec_2017-01.csv",
+                                            ['2017-01-01 00:00:00', '2017-01-01 00:00:01', '2017-01-01 00:00:01.50', '2017-01-01 00:00:10'],
+                                            [-50.0, -50.1, -50.15, -51.0], [30.0, 30.1, 30.15, 31.0]),
+                       create_position_file(self.directory.name, "ace_cruise_track_1sec_2016-12.csv",
+                                            ['2016-12-31 23:59:59'], [-49.9, ], [29.9])]
+
+        self.assertEqual(position_index.build_position_index(track_files, self.index_file), 4)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_exact_positions(self):
+        index = position_index.PositionIndex(self.index_file)
+
+        self.assertIsInstance(index.seconds, np.memmap)
+
+        (latitude, longitude, time_offset) = index.positions_for_datetimes([datetime.datetime(2016, 12, 31, 23, 59, 59), datetime.datetime(2017, 1, 1, 0, 0, 1, 700000),
+                                                                            datetime.datetime(2017, 1, 1, 0, 0, 5), datetime.datetime(2017, 1, 1, 0, 0, 11)])
+
+        np.testing.assert_array_equal(latitude, [-49.9, -50.1, np.nan, np.nan])
+        np.testing.assert_array_equal(longitude, [29.9, 30.1, np.nan, np.nan])
+        np.testing.assert_array_equal(time_offset, [0, 0, np.nan, np.nan])
+
+        self.assertEqual(index.datetime_to_position(datetime.datetime(2017, 1, 1)), (-50.0, 30.0))
+        self.assertIsNone(index.datetime_to_position(datetime.datetime(2017, 1, 2)))
+
+    def test_nearest_positions(self):
+        index = position_index.PositionIndex(self.index_file)
+
+        date_times = pandas.to_datetime(['2016-12-31 23:59:50', '2017-01-01 00:00:05', '2017-01-01 00:00:06', '2017-01-01 00:00:13', '2017-01-01 00:00:20'])
+        (latitude, longitude, time_offset) = index.positions_for_datetimes(date_times, tolerance=4)
+
+        np.testing.assert_array_equal(latitude, [np.nan, -50.1, -51.0, -51.0, np.nan])
+        np.testing.assert_array_equal(time_offset, [np.nan, -4, 4, -3, np.nan])
+
+    def test_not_an_index_file(self):
+        with self.assertRaises(ValueError):
+            position_index.PositionIndex(os.path.join(self.directory.name, "ace_cruise_track_1sec_2017-01.csv"))
+
+
+if __name__ == '__main__':
+    unittest.main()